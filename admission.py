@@ -0,0 +1,392 @@
+import asyncio
+import contextvars
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+from starlette.responses import Response
+from starlette.routing import Match
+from config import (
+    RATE_LIMIT_ENABLED, RATE_LIMIT_CLIENT_RATE, RATE_LIMIT_CLIENT_BURST,
+    RATE_LIMIT_ROUTE_RATE, RATE_LIMIT_ROUTE_BURST, RATE_LIMIT_ROUTES,
+    RATE_LIMIT_PROXY_HOPS, RATE_LIMIT_REDIS_URL,
+    ADMISSION_DB_MAX_IN_FLIGHT, ADMISSION_FIREBASE_MAX_IN_FLIGHT,
+    ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT,
+)
+from metrics import REGISTRY, ADMISSION_REJECTED, gauge
+
+logger = logging.getLogger(__name__)
+
+# İki katmanlı giriş kontrolü:
+#   1. AdmissionMiddleware istemci+rota ve rota başına token bucket uygular;
+#      sınırı aşan istek hiçbir işe başlamadan 429 ile döner.
+#   2. executor.run_blocking her Firebase/veritabanı çağrısını bağımlılık
+#      başına bir InFlightLimiter'dan geçirir. Sınır doluyken bekleme kuyruğu
+#      da doluysa veya bekleme ADMISSION_QUEUE_TIMEOUT'u aşarsa 503 döner.
+# Bir istek yalnızca ilk bağımlılık çağrısında reddedilebilir; işe başlamış bir
+# istek (ör. Firebase'de kullanıcı oluşturulmuş, veritabanı yazımı bekliyor)
+# sonraki çağrılarında beklenir, yarıda bırakılmaz. İstek dışı işler (ısınma,
+# arka plan görevleri) hiçbir zaman reddedilmez, yalnızca sırada bekler.
+
+# Sağlık kontrolü ve metrik kazıma hiçbir zaman sınırlanmaz
+_EXEMPT_ROUTES = frozenset({"/health", "/ready", "/metrics"})
+
+_LIMITS = {
+    "db": ADMISSION_DB_MAX_IN_FLIGHT,
+    "firebase": ADMISSION_FIREBASE_MAX_IN_FLIGHT,
+}
+
+class Overloaded(HTTPException):
+    """Bağımlılık doygun olduğu için istek reddedildiğinde fırlatılır (503 + Retry-After)"""
+
+    def __init__(self, downstream, reason, retry_after=1.0):
+        super().__init__(
+            status_code=503,
+            detail=f"Servis yoğun ({downstream}), lütfen daha sonra tekrar deneyin",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+        self.downstream = downstream
+        self.reason = reason
+
+class InFlightLimiter:
+    """Bir bağımlılığa aynı anda yapılan çağrıları sınırlayan, sınırlı bekleme kuyruklu semafor
+
+    Yalnızca event loop thread'inden kullanılır. Slot serbest kaldığında
+    sıradaki bekleyene doğrudan devredilir (FIFO).
+
+    Args:
+        name (str): Bağımlılık adı ("db" veya "firebase")
+        limit (int): Aynı anda çalışabilecek en fazla çağrı (0 = sınırsız)
+        max_queue (int): Reddedilmeden önce bekleyebilecek en fazla çağrı
+        queue_timeout (float): Reddedilmeden önce beklenecek en uzun süre (saniye)
+    """
+
+    def __init__(self, name, limit, max_queue=100, queue_timeout=2.0):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._active = 0
+        self._waiters = deque()
+
+    @property
+    def saturated(self):
+        """Sınır ve bekleme kuyruğu doluysa True"""
+        return 0 < self.limit <= self._active and len(self._waiters) >= self.max_queue
+
+    async def acquire(self, shed=False):
+        """Bir slot alır
+
+        Args:
+            shed (bool): True ise kuyruk doluysa veya bekleme süresi aşılırsa
+                Overloaded fırlatılır; False ise slot boşalana kadar beklenir
+        """
+        if self.limit <= 0:
+            return
+        if self._active < self.limit and not self._waiters:
+            self._active += 1
+            return
+        if shed and len(self._waiters) >= self.max_queue:
+            ADMISSION_REJECTED.inc(limit=self.name, reason="queue_full")
+            raise Overloaded(self.name, "queue_full", self.queue_timeout)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            if shed:
+                await asyncio.wait_for(waiter, self.queue_timeout)
+            else:
+                await waiter
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # Slot tam zaman aşımı/iptal anında devredildi; sıradakine aktar
+                self.release()
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                ADMISSION_REJECTED.inc(limit=self.name, reason="timeout")
+                raise Overloaded(self.name, "timeout", self.queue_timeout) from None
+            raise
+
+    def release(self):
+        """Slotu sıradaki bekleyene devreder veya serbest bırakır"""
+        if self.limit <= 0:
+            return
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    def stats(self):
+        return {"limit": self.limit, "in_flight": self._active, "waiting": len(self._waiters)}
+
+_limiters = {}
+_limiters_pid = None
+_limiters_lock = threading.Lock()
+
+def get_limiter(name):
+    """Verilen bağımlılık için bu sürece ait eşzamanlılık sınırlayıcısını döndürür"""
+    global _limiters, _limiters_pid
+    pid = os.getpid()
+    with _limiters_lock:
+        if _limiters_pid != pid:
+            # Fork sonrası ebeveynin bekleyenleri çocuğa ait değildir
+            _limiters = {}
+            _limiters_pid = pid
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limiter = _limiters[name] = InFlightLimiter(
+                name, _LIMITS[name], ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT
+            )
+        return limiter
+
+class _RequestAdmission:
+    __slots__ = ("admitted",)
+
+    def __init__(self):
+        self.admitted = False
+
+# İstek bağlamı; middleware dışında (arka plan işleri) None'dır
+_request_admission = contextvars.ContextVar("request_admission", default=None)
+
+@asynccontextmanager
+async def downstream_slot(name):
+    """Bağımlılık çağrısı süresince bir slot tutar
+
+    İsteğin ilk bağımlılık çağrısında kuyruk doluysa Overloaded fırlatılır.
+    """
+    limiter = get_limiter(name)
+    state = _request_admission.get()
+    await limiter.acquire(shed=state is not None and not state.admitted)
+    if state is not None:
+        state.admitted = True
+    try:
+        yield
+    finally:
+        limiter.release()
+
+def check_capacity(*names):
+    """İşi yanıt gövdesi akarken yapılacak istekler için kapasiteyi önceden denetler
+
+    StreamingResponse başlıkları gönderdikten sonra 503 dönülemez; bu yüzden
+    akış başlamadan bağımlılıklar doygunsa istek burada reddedilir ve istek
+    kabul edilmiş sayılır.
+
+    Raises:
+        Overloaded: Bağımlılıklardan biri doygunsa
+    """
+    for name in names:
+        limiter = get_limiter(name)
+        if limiter.saturated:
+            ADMISSION_REJECTED.inc(limit=name, reason="queue_full")
+            raise Overloaded(name, "queue_full", limiter.queue_timeout)
+    state = _request_admission.get()
+    if state is not None:
+        state.admitted = True
+
+def get_admission_stats():
+    """Bağımlılık başına eşzamanlı ve bekleyen çağrı sayılarını döndürür"""
+    return {name: get_limiter(name).stats() for name in _LIMITS}
+
+_ADMISSION_IN_FLIGHT = gauge("admission_in_flight", "Giriş kontrolünden geçmiş, çalışan bağımlılık çağrıları", ("downstream",))
+_ADMISSION_WAITING = gauge("admission_waiting", "Slot bekleyen bağımlılık çağrıları", ("downstream",))
+
+@REGISTRY.register_collector
+def _collect_admission_metrics():
+    for name, stats in get_admission_stats().items():
+        _ADMISSION_IN_FLIGHT.set(stats["in_flight"], downstream=name)
+        _ADMISSION_WAITING.set(stats["waiting"], downstream=name)
+
+class LocalBucketStore:
+    """Worker içinde tutulan token bucket'lar (event loop thread'inden kullanılır)"""
+
+    _MAX_KEYS = 100000
+
+    def __init__(self):
+        self._buckets = OrderedDict()
+
+    async def take(self, key, rate, burst):
+        """Bucket'tan bir token alır
+
+        Returns:
+            float: İzin verildiyse 0, aksi halde bir sonraki token'a kalan süre (saniye)
+        """
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self._MAX_KEYS:
+                self._buckets.popitem(last=False)
+            bucket = self._buckets[key] = [float(burst), now]
+        else:
+            self._buckets.move_to_end(key)
+        tokens = min(float(burst), bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens >= 1.0:
+            bucket[0] = tokens - 1.0
+            return 0.0
+        bucket[0] = tokens
+        return (1.0 - tokens) / rate
+
+# Zaman Redis sunucusundan alınır; böylece worker saatleri arasındaki fark önemsizdir
+_TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+class RedisBucketStore:
+    """Tüm worker'lar arasında paylaşılan, Redis'te tutulan token bucket'lar
+
+    Redis'e erişilemezse birkaç saniyeliğine worker içi bucket'lara geçilir;
+    hız sınırlayıcının arızası istekleri durdurmaz.
+
+    Args:
+        url (str): Redis bağlantı adresi
+        timeout (float): Redis çağrısı başına en uzun süre (saniye)
+    """
+
+    _RETRY_INTERVAL = 5.0
+
+    def __init__(self, url, timeout=0.25):
+        import redis.asyncio as redis  # isteğe bağlı bağımlılık
+        self._client = redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self._script = self._client.register_script(_TOKEN_BUCKET_LUA)
+        self._fallback = LocalBucketStore()
+        self._retry_at = 0.0
+
+    async def take(self, key, rate, burst):
+        now = time.monotonic()
+        if now >= self._retry_at:
+            try:
+                return float(await self._script(keys=[f"ratelimit:{key}"], args=[rate, burst]))
+            except Exception as e:
+                logger.warning("Redis hız sınırlayıcısına erişilemedi, worker içi sınır kullanılıyor: %s", e)
+                self._retry_at = now + self._RETRY_INTERVAL
+        return await self._fallback.take(key, rate, burst)
+
+def _create_bucket_store():
+    if RATE_LIMIT_REDIS_URL:
+        try:
+            return RedisBucketStore(RATE_LIMIT_REDIS_URL)
+        except ImportError:
+            logger.error("RATE_LIMIT_REDIS_URL verilmiş ama redis paketi kurulu değil; sınırlar worker başına uygulanacak")
+    return LocalBucketStore()
+
+def _route_limits(route_key):
+    """Rota için (istemci oranı, istemci burst, rota oranı, rota burst) döndürür"""
+    override = RATE_LIMIT_ROUTES.get(route_key, {})
+    return (
+        float(override.get("client_rate", RATE_LIMIT_CLIENT_RATE)),
+        int(override.get("client_burst", RATE_LIMIT_CLIENT_BURST)),
+        float(override.get("route_rate", RATE_LIMIT_ROUTE_RATE)),
+        int(override.get("route_burst", RATE_LIMIT_ROUTE_BURST)),
+    )
+
+def _client_address(scope):
+    if RATE_LIMIT_PROXY_HOPS > 0:
+        forwarded = [
+            value.decode("latin-1") for name, value in scope.get("headers", ()) if name == b"x-forwarded-for"
+        ]
+        hops = [hop.strip() for hop in ",".join(forwarded).split(",") if hop.strip()]
+        if hops:
+            # Vekillerin eklediği son elemanlar güvenilir; baştakiler istemci tarafından yazılabilir
+            return hops[-min(RATE_LIMIT_PROXY_HOPS, len(hops))]
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+def _match_route(scope):
+    app = scope.get("app")
+    router = getattr(app, "router", None)
+    for route in getattr(router, "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route
+    return None
+
+class AdmissionMiddleware:
+    """İstemci ve rota başına token bucket uygulayan ve istek bağlamını kuran ASGI middleware'i
+
+    Sınırı aşan istekler rota çalışmadan 429 ve Retry-After ile döner.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._store = None
+        self._store_pid = None
+
+    def _get_store(self):
+        pid = os.getpid()
+        if self._store_pid != pid:
+            self._store = _create_bucket_store()
+            self._store_pid = pid
+        return self._store
+
+    async def _retry_after(self, scope):
+        """İzin verildiyse 0, aksi halde istemcinin beklemesi gereken süreyi döndürür"""
+        route = _match_route(scope)
+        path = getattr(route, "path", "unmatched")
+        if path in _EXEMPT_ROUTES:
+            return 0.0
+        if route is not None:
+            # Reddedilen istekler de metriklerde rota şablonuyla görünsün
+            scope["route"] = route
+        route_key = f"{scope.get('method', '')} {path}"
+        client_rate, client_burst, route_rate, route_burst = _route_limits(route_key)
+        store = self._get_store()
+        if client_rate > 0:
+            wait = await store.take(f"{route_key}|{_client_address(scope)}", client_rate, max(1, client_burst))
+            if wait > 0:
+                ADMISSION_REJECTED.inc(limit="client", reason="rate")
+                return wait
+        if route_rate > 0:
+            wait = await store.take(route_key, route_rate, max(1, route_burst))
+            if wait > 0:
+                ADMISSION_REJECTED.inc(limit="route", reason="rate")
+                return wait
+        return 0.0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if RATE_LIMIT_ENABLED:
+            wait = await self._retry_after(scope)
+            if wait > 0:
+                response = Response(
+                    content=json.dumps({"detail": "Çok fazla istek, lütfen daha sonra tekrar deneyin"}),
+                    status_code=429,
+                    media_type="application/json",
+                    headers={"Retry-After": str(max(1, math.ceil(wait)))}
+                )
+                await response(scope, receive, send)
+                return
+
+        token = _request_admission.set(_RequestAdmission())
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_admission.reset(token)
@@ -1,28 +1,52 @@
-from fastapi import FastAPI, HTTPException, Depends, Header, Request, Response, status
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+from datetime import datetime
 import logging
-import json
+import time
 import uvicorn
-import traceback
 from firebase_service import FirebaseService
-from database import insert_user, update_user, delete_user
-from config import PORT, WEBHOOK_SECRET
+from metrics import REGISTRY, MetricsMiddleware, record_webhook_results
+from database import (
+    insert_user, update_user, delete_user, get_pool, close_pool, get_pool_stats,
+    DUPLICATE_EVENT_RESULT, list_users, iter_user_batches,
+    get_replica_stats, set_read_session, start_replica_monitor,
+)
+from schema import bootstrap_schema, verify_schema
+from serialization import FastJSONResponse, dumps
+from admission import AdmissionMiddleware, check_capacity, get_admission_stats
+from resilience import get_breaker_stats
+from changes import get_change_hub, get_change_stats, start_change_hub, stop_change_hub, stream_changes
+from executor import run_db, run_firebase, shutdown_executors
+from warmup import Warmup
+from logging_setup import configure_logging
+from webhook_queue import (
+    EVENT_TYPES, enqueue_event, enqueue_events,
+    ensure_outbox_table, get_queue_stats, start_workers, stop_workers,
+)
+from write_repair import start_repairer, stop_repairer
+from config import (
+    PORT, WEBHOOK_SECRET, WEBHOOK_BATCH_MAX_SIZE, DB_ENSURE_INDEXES, WEBHOOK_INGEST_MODE,
+    USERS_PAGE_MAX_SIZE, USERS_EXPORT_BATCH_SIZE, BULK_IMPORT_MAX_USERS, CHANGES_ENABLED,
+)
 
 # Loglama ayarları
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title="Firebase Auth PostgreSQL Entegrasyon Servisi",
     description="Firebase Authentication ile PostgreSQL veritabanı entegrasyonu sağlar",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
+# İstemci/rota başına hız sınırı ve bağımlılık bazında yük atma; 429
+# yanıtları da CORS başlıklarını alsın diye CORS'un içinde çalışır
+app.add_middleware(AdmissionMiddleware)
+
 # CORS ayarları - ihtiyaca göre düzenlenebilir
 app.add_middleware(
     CORSMiddleware,
@@ -32,6 +56,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Rota bazında süre ve eşzamanlı istek ölçümü
+app.add_middleware(MetricsMiddleware)
+
 # Firebase servis instance'ı
 firebase_service = FirebaseService()
 
@@ -41,6 +68,15 @@ class UserCreate(BaseModel):
     password: str
     display_name: Optional[str] = None
 
+class BulkUserItem(BaseModel):
+    email: str
+    password: Optional[str] = None
+    display_name: Optional[str] = None
+    uid: Optional[str] = Field(None, description="Verilmezse rastgele atanır; tekrar denemelerin aynı kullanıcıyı yazması için verilmesi önerilir")
+
+class BulkUserCreate(BaseModel):
+    users: List[BulkUserItem]
+
 class UserUpdate(BaseModel):
     email: Optional[str] = None
     display_name: Optional[str] = None
@@ -48,6 +84,8 @@ class UserUpdate(BaseModel):
 class FirebaseAuthEvent(BaseModel):
     event_type: str = Field(..., description="Olay tipi: create, update, delete")
     user_data: Dict[str, Any] = Field(..., description="Kullanıcı verileri")
+    event_id: Optional[str] = Field(None, description="Olayın benzersiz kimliği; tekrar teslimler bir kez uygulanır")
+    version: Optional[int] = Field(None, description="Olayın kaynak sürümü (ör. milisaniye cinsinden olay zamanı); eski olaylar uygulanmaz")
 
 # Token doğrulama dependency
 async def verify_token(authorization: Optional[str] = Header(None)):
@@ -56,10 +94,14 @@ async def verify_token(authorization: Optional[str] = Header(None)):
     
     token = authorization.replace("Bearer ", "")
     try:
-        decoded_token = firebase_service.verify_id_token(token)
+        decoded_token = await firebase_service.verify_id_token_async(token)
+        # Kullanıcının kendi yazımından hemen sonraki okumaları replika yerine primary'den yapılır
+        set_read_session(decoded_token.get("uid"))
         return decoded_token
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Token doğrulama hatası: {str(e)}")
+        logger.error("Token doğrulama hatası: %s", e)
         raise HTTPException(status_code=401, detail="Geçersiz veya süresi dolmuş token")
 
 async def verify_webhook_signature(request: Request):
@@ -77,21 +119,80 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Render için sağlık kontrolü endpoint'i"""
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "db_pool": get_pool_stats(),
+        "db_replicas": get_replica_stats(),
+        "token_cache": firebase_service.token_cache_stats(),
+        "user_cache": firebase_service.user_cache_stats(),
+        "admission": get_admission_stats(),
+        "circuit_breakers": get_breaker_stats(),
+        "changes": get_change_stats()
+    }
+
+@app.get("/ready")
+async def readiness_check():
+    """Firebase ve veritabanı ısınması tamamlandığında 200, aksi halde 503 döner"""
+    body = warmup.status()
+    return FastJSONResponse(
+        body,
+        status_code=status.HTTP_200_OK if warmup.ready else status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus formatında metrikler (her worker kendi değerlerini raporlar)"""
+    return Response(content=REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 @app.post("/users", status_code=status.HTTP_201_CREATED)
 async def create_user(user_data: UserCreate):
     try:
-        result = firebase_service.create_user(
+        result = await firebase_service.create_user_async(
             email=user_data.email,
             password=user_data.password,
             display_name=user_data.display_name
         )
-        return result
+        # Yanıt jsonable_encoder'dan geçmeden doğrudan kodlanır
+        return FastJSONResponse(result, status_code=status.HTTP_201_CREATED)
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Kullanıcı oluşturma hatası: {str(e)}")
+        logger.error("Kullanıcı oluşturma hatası: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
 
+async def _stream_bulk_import(users):
+    """Tamamlanan her parçanın sonucunu ve ilerlemeyi NDJSON satırı olarak yazar"""
+    start = time.perf_counter()
+    processed = succeeded = 0
+    async for results in firebase_service.bulk_create_users_async(users):
+        processed += len(results)
+        succeeded += sum(1 for result in results if result["status"] == "success")
+        yield dumps({
+            "type": "progress",
+            "processed": processed,
+            "total": len(users),
+            "results": results
+        }) + b"\n"
+    yield dumps({
+        "type": "summary",
+        "total": len(users),
+        "succeeded": succeeded,
+        "failed": processed - succeeded,
+        "seconds": round(time.perf_counter() - start, 3)
+    }) + b"\n"
+
+@app.post("/users/bulk", status_code=status.HTTP_200_OK)
+async def bulk_create_users(payload: BulkUserCreate, signature_verified: bool = Depends(verify_webhook_signature)):
+    """Kullanıcıları auth.import_users ile toplu oluşturur; ilerleme NDJSON olarak akıtılır"""
+    if len(payload.users) > BULK_IMPORT_MAX_USERS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Tek istekte en fazla {BULK_IMPORT_MAX_USERS} kullanıcı gönderilebilir"
+        )
+    users = [user.model_dump() for user in payload.users]
+    check_capacity("firebase", "db")
+    return StreamingResponse(_stream_bulk_import(users), media_type="application/x-ndjson")
+
 @app.put("/users/{uid}", status_code=status.HTTP_200_OK)
 async def update_user_info(uid: str, user_data: UserUpdate, token_data: dict = Depends(verify_token)):
     # İsteği yapan kullanıcının yetkisini kontrol et
@@ -99,17 +200,19 @@ async def update_user_info(uid: str, user_data: UserUpdate, token_data: dict = D
         raise HTTPException(status_code=403, detail="Bu işlem için yetkiniz yok")
     
     try:
-        result = firebase_service.update_user_info(
+        result = await firebase_service.update_user_info_async(
             uid=uid,
             email=user_data.email,
             display_name=user_data.display_name
         )
         if result:
-            return result
+            return FastJSONResponse(result)
         else:
             raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Kullanıcı güncelleme hatası: {str(e)}")
+        logger.error("Kullanıcı güncelleme hatası: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/users/{uid}", status_code=status.HTTP_200_OK)
@@ -119,48 +222,202 @@ async def delete_user_account(uid: str, token_data: dict = Depends(verify_token)
         raise HTTPException(status_code=403, detail="Bu işlem için yetkiniz yok")
     
     try:
-        result = firebase_service.delete_user_account(uid)
+        result = await firebase_service.delete_user_account_async(uid)
         return {"status": "success", "message": "Kullanıcı başarıyla silindi"}
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Kullanıcı silme hatası: {str(e)}")
+        logger.error("Kullanıcı silme hatası: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/users/email/{email}", status_code=status.HTTP_200_OK)
-async def get_user_by_email(email: str, token_data: dict = Depends(verify_token)):
+async def get_user_by_email(email: str, fresh: bool = False, token_data: dict = Depends(verify_token)):
     try:
-        user = firebase_service.get_user_by_email(email)
+        user = await firebase_service.get_user_by_email_async(email, fresh=fresh)
         if user:
-            return user
+            return FastJSONResponse(user)
         else:
             raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Kullanıcı getirme hatası: {str(e)}")
+        logger.error("Kullanıcı getirme hatası: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
 
+async def _stream_users_ndjson(after_id, updated_since):
+    """Kullanıcıları veritabanından parça parça okuyup satır başına bir JSON nesnesi olarak yazar"""
+    batches = iter_user_batches(after_id=after_id, updated_since=updated_since, batch_size=USERS_EXPORT_BATCH_SIZE)
+    try:
+        while True:
+            batch = await run_db(next, batches, None)
+            if batch is None:
+                break
+            yield b"".join(dumps(user) + b"\n" for user in batch)
+    finally:
+        # İstemci bağlantıyı kesse bile cursor kapanır ve bağlantı havuza döner
+        await run_db(batches.close)
+
+@app.get("/users", status_code=status.HTTP_200_OK)
+async def list_users_endpoint(
+    request: Request,
+    after: Optional[int] = Query(None, description="Bu id'den sonraki kullanıcılar (önceki yanıttaki next_after)"),
+    limit: int = Query(100, ge=1, le=USERS_PAGE_MAX_SIZE),
+    updated_since: Optional[datetime] = Query(None, description="Bu zamandan sonra oluşturulan veya güncellenen kullanıcılar"),
+    stream: bool = Query(False, description="true ise tüm sonuç NDJSON olarak akıtılır"),
+    signature_verified: bool = Depends(verify_webhook_signature)
+):
+    """users tablosunu id sırasıyla, keyset sayfalama veya NDJSON akışıyla okur"""
+    if stream or "application/x-ndjson" in request.headers.get("accept", ""):
+        check_capacity("db")
+        return StreamingResponse(_stream_users_ndjson(after, updated_since), media_type="application/x-ndjson")
+    try:
+        users = await run_db(list_users, after_id=after, limit=limit, updated_since=updated_since)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Kullanıcı listeleme hatası: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+    return FastJSONResponse({
+        "users": users,
+        "next_after": users[-1].id if len(users) == limit else None
+    })
+
+@app.get("/users/changes", status_code=status.HTTP_200_OK)
+async def user_changes_stream(
+    after: Optional[int] = Query(None, ge=0, description="Bu sıra numarasından sonraki değişikliklerden devam et"),
+    last_event_id: Optional[str] = Header(None),
+    signature_verified: bool = Depends(verify_webhook_signature)
+):
+    """users tablosundaki ekleme, güncelleme ve silmeleri Server-Sent Events olarak akıtır"""
+    if not CHANGES_ENABLED:
+        raise HTTPException(status_code=404, detail="Değişiklik akışı kapalı")
+    # EventSource yeniden bağlanırken aynı URL'ye son aldığı id'yi başlıkta gönderir
+    if last_event_id:
+        try:
+            after = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Geçersiz Last-Event-ID")
+    get_change_hub().check_available()
+    if after is not None:
+        check_capacity("db")
+    return StreamingResponse(
+        stream_changes(after),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _queued_result(queue_id):
+    if queue_id is None:
+        return dict(DUPLICATE_EVENT_RESULT)
+    return {"status": "success", "message": "Olay kuyruğa alındı", "queued": True, "id": queue_id}
+
 # Firebase Auth Webhook Endpoint'i
 @app.post("/webhook/auth", status_code=status.HTTP_200_OK)
 async def firebase_auth_webhook(event: FirebaseAuthEvent, signature_verified: bool = Depends(verify_webhook_signature)):
     try:
-        result = firebase_service.handle_auth_event(
-            event_type=event.event_type,
-            user_data=event.user_data
-        )
-        return result
+        if WEBHOOK_INGEST_MODE == "queue":
+            # Olayı yalnızca kalıcı kuyruğa yaz ve hemen onayla
+            try:
+                queue_id = await run_db(enqueue_event, event.event_type, event.user_data, event.event_id, event.version)
+                result = _queued_result(queue_id)
+            except ValueError as e:
+                result = {"status": "error", "message": str(e)}
+        else:
+            result = await firebase_service.handle_auth_event_async(
+                event_type=event.event_type,
+                user_data=event.user_data,
+                event_id=event.event_id,
+                version=event.version
+            )
+        record_webhook_results([{"event_type": event.event_type}], [result])
+        return FastJSONResponse(result)
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Webhook işleme hatası: {str(e)}")
-        traceback.print_exc()
+        record_webhook_results([{"event_type": event.event_type}], [None])
+        logger.exception("Webhook işleme hatası: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+# Toplu Firebase Auth Webhook Endpoint'i
+@app.post("/webhook/auth/batch", status_code=status.HTTP_200_OK)
+async def firebase_auth_webhook_batch(events: List[FirebaseAuthEvent], signature_verified: bool = Depends(verify_webhook_signature)):
+    if len(events) > WEBHOOK_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Tek istekte en fazla {WEBHOOK_BATCH_MAX_SIZE} olay gönderilebilir"
+        )
+    payload = [
+        {"event_type": event.event_type, "user_data": event.user_data, "event_id": event.event_id, "version": event.version}
+        for event in events
+    ]
+    if WEBHOOK_INGEST_MODE == "queue":
+        results = [None] * len(payload)
+        valid = []
+        for index, item in enumerate(payload):
+            if item["event_type"] not in EVENT_TYPES:
+                results[index] = {"status": "error", "message": "Bilinmeyen olay tipi"}
+            elif not item["user_data"].get("uid"):
+                results[index] = {"status": "error", "message": "Kullanıcı uid'si eksik"}
+            else:
+                valid.append(index)
+        queue_ids = await run_db(enqueue_events, [payload[i] for i in valid])
+        for index, queue_id in zip(valid, queue_ids):
+            results[index] = _queued_result(queue_id)
+    else:
+        results = await firebase_service.handle_auth_events_async(payload)
+    record_webhook_results(payload, results)
+    return FastJSONResponse({"results": results})
+
+@app.get("/webhook/queue", status_code=status.HTTP_200_OK)
+async def webhook_queue_stats(signature_verified: bool = Depends(verify_webhook_signature)):
+    """Kuyruk derinliği, en eski olayın bekleme süresi ve işçi sayaçları"""
+    stats = await run_db(get_queue_stats)
+    stats["mode"] = WEBHOOK_INGEST_MODE
+    return stats
+
+# Açılış işleri arka planda yürür; worker hemen istek kabul eder, /ready ısınma bitene kadar 503 döner
+warmup = Warmup()
+
+async def _warm_firebase():
+    await run_firebase(firebase_service.initialize)
+
+async def _warm_database():
+    await run_db(lambda: get_pool().open())
+    await run_db(start_replica_monitor)
+    # Tablo ve sıcak yol indeksleri; eksik indeksle worker hazır sayılmaz
+    if DB_ENSURE_INDEXES:
+        await run_db(bootstrap_schema)
+    await run_db(verify_schema)
+    start_repairer()
+    if WEBHOOK_INGEST_MODE == "queue":
+        await run_db(ensure_outbox_table)
+        start_workers()
+    if CHANGES_ENABLED:
+        start_change_hub()
+
+warmup.add_step("firebase", _warm_firebase)
+warmup.add_step("database", _warm_database)
+
+@app.on_event("startup")
+async def startup_event():
+    warmup.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Worker kapanırken thread havuzlarını ve veritabanı bağlantılarını kapat
+    await warmup.stop()
+    await stop_change_hub()
+    stop_repairer()
+    if WEBHOOK_INGEST_MODE == "queue":
+        stop_workers()
+    shutdown_executors(wait=False)
+    close_pool()
+
 # Hata yakalama
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
-    logger.error(f"Genel hata: {str(exc)}")
-    traceback.print_exc()
-    return Response(
-        content=json.dumps({"detail": str(exc)}),
-        status_code=500,
-        media_type="application/json"
-    )
+    logger.error("Genel hata: %s", exc, exc_info=exc)
+    return FastJSONResponse({"detail": str(exc)}, status_code=500)
 
 if __name__ == "__main__":
     # API'yi başlat - Render'da bu kod çalışmayacak, gunicorn kullanılacak
@@ -0,0 +1,102 @@
+"""HTTP sunucusu ve ek bağımlılık olmadan bir ASGI uygulamasına istek gönderen istemci"""
+import asyncio
+import json
+from urllib.parse import urlsplit
+
+class Lifespan:
+    """Uygulamanın startup/shutdown olaylarını çalıştırır"""
+
+    def __init__(self, app):
+        self.app = app
+        self._receive = asyncio.Queue()
+        self._send = asyncio.Queue()
+        self._task = None
+
+    async def _send_message(self, message):
+        await self._send.put(message)
+
+    async def startup(self):
+        self._task = asyncio.ensure_future(
+            self.app({"type": "lifespan", "asgi": {"version": "3.0"}}, self._receive.get, self._send_message)
+        )
+        await self._receive.put({"type": "lifespan.startup"})
+        message = await self._send.get()
+        if message["type"] != "lifespan.startup.complete":
+            raise RuntimeError(f"Uygulama başlatılamadı: {message}")
+
+    async def shutdown(self):
+        await self._receive.put({"type": "lifespan.shutdown"})
+        await self._send.get()
+        await self._task
+
+async def request(app, method, url, headers=None, json_body=None):
+    """Uygulamaya tek bir istek gönderir
+
+    Returns:
+        tuple: (durum kodu, yanıt gövdesi bytes)
+    """
+    parts = urlsplit(url)
+    body = json.dumps(json_body).encode("utf-8") if json_body is not None else b""
+    raw_headers = [(b"host", b"bench")]
+    if json_body is not None:
+        raw_headers.append((b"content-type", b"application/json"))
+        raw_headers.append((b"content-length", str(len(body)).encode()))
+    for name, value in (headers or {}).items():
+        raw_headers.append((name.lower().encode("latin-1"), value.encode("latin-1")))
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": parts.path,
+        "raw_path": parts.path.encode("utf-8"),
+        "query_string": parts.query.encode("utf-8"),
+        "root_path": "",
+        "headers": raw_headers,
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+
+    request_sent = False
+    response_done = asyncio.Event()
+    status = None
+    chunks = []
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await response_done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                response_done.set()
+
+    await app(scope, receive, send)
+    response_done.set()
+    return status, b"".join(chunks)
+
+async def wait_ready(app, timeout=60.0, interval=0.01):
+    """/ready 200 dönene kadar bekler
+
+    Returns:
+        float: Bekleme süresi (saniye)
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    while True:
+        status, body = await request(app, "GET", "/ready")
+        if status == 200:
+            return loop.time() - start
+        if loop.time() - start > timeout:
+            raise RuntimeError(f"Uygulama {timeout} sn içinde hazır olmadı: {body.decode('utf-8', 'replace')}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,220 @@
+"""Firebase Admin `auth` modülünün bellek içi yerine geçeni
+
+Benchmark ve yük testlerinde gerçek Firebase projesine gitmeden servisi
+çalıştırmak için kullanılır. `install()` SDK giriş noktalarını (credentials,
+initialize_app ve auth fonksiyonları) bu sahte arka uçla değiştirir; servis
+kodu değişmeden aynı yolları izler.
+
+Hata enjeksiyonu ile zaman aşımı, yeniden deneme ve devre kesici davranışı
+gerçek Firebase'e gitmeden denenebilir:
+
+    fake = install(FakeFirebaseAuth(error_rate=0.2, timeout_rate=0.05))
+    fake.outage(10)    # 10 sn boyunca tüm çağrılar UnavailableError
+"""
+import itertools
+import os
+import random
+import secrets
+import tempfile
+import threading
+import time
+
+class _UserRecord:
+    __slots__ = ("uid", "email", "display_name", "phone_number", "photo_url", "disabled")
+
+    def __init__(self, uid, email=None, display_name=None):
+        self.uid = uid
+        self.email = email
+        self.display_name = display_name
+        self.phone_number = None
+        self.photo_url = None
+        self.disabled = False
+
+class _Page:
+    def __init__(self, users, next_page_token):
+        self.users = users
+        self.next_page_token = next_page_token
+
+class _ImportError:
+    def __init__(self, index, reason):
+        self.index = index
+        self.reason = reason
+
+class _ImportResult:
+    def __init__(self, total, errors):
+        self.errors = errors
+        self.failure_count = len(errors)
+        self.success_count = total - len(errors)
+
+class FakeFirebaseAuth:
+    """Kullanıcıları ve token'ları bellekte tutan sahte Firebase Auth
+
+    Args:
+        latency (float): Ağ gecikmesini taklit etmek için uzak çağrı başına bekleme (saniye)
+        verify_latency (float): Token imza doğrulaması için CPU süresi taklidi (saniye)
+        token_ttl (int): Üretilen token'ların geçerlilik süresi (saniye)
+        init_latency (float): SDK başlatma süresi taklidi (saniye)
+        error_rate (float): Çağrıların UnavailableError ile başarısız olma olasılığı
+        timeout_rate (float): Çağrıların timeout kadar bekleyip DeadlineExceededError
+            ile başarısız olma olasılığı
+        timeout (float): Zaman aşımı taklidinde beklenecek süre (saniye)
+        seed (int, optional): Hata enjeksiyonu için rastgele sayı tohumu
+    """
+
+    def __init__(self, latency=0.02, verify_latency=0.001, token_ttl=3600, init_latency=0.0,
+                 error_rate=0.0, timeout_rate=0.0, timeout=1.0, seed=None):
+        self.latency = latency
+        self.init_latency = init_latency
+        self.verify_latency = verify_latency
+        self.token_ttl = token_ttl
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout = timeout
+        self._rng = random.Random(seed)
+        self._outage_until = 0.0
+        self._lock = threading.Lock()
+        self._users = {}
+        self._tokens = {}
+        self._ids = itertools.count(1)
+        self.calls = {}
+        self.faults = {}
+
+    def _count(self, name, delay):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        if name in _PATCHED:
+            self._inject_fault(name)
+        if delay:
+            time.sleep(delay)
+
+    def outage(self, seconds):
+        """Verilen süre boyunca tüm çağrıları UnavailableError ile başarısız kılar"""
+        self._outage_until = time.monotonic() + seconds
+
+    def _record_fault(self, name, kind):
+        with self._lock:
+            key = f"{name}:{kind}"
+            self.faults[key] = self.faults.get(key, 0) + 1
+
+    def _inject_fault(self, name):
+        from firebase_admin import exceptions
+        with self._lock:
+            roll = self._rng.random()
+        if time.monotonic() < self._outage_until or roll < self.error_rate:
+            self._record_fault(name, "unavailable")
+            raise exceptions.UnavailableError(f"Sahte Firebase kullanılamıyor: {name}")
+        if roll < self.error_rate + self.timeout_rate:
+            time.sleep(self.timeout)
+            self._record_fault(name, "timeout")
+            raise exceptions.DeadlineExceededError(f"Sahte Firebase zaman aşımı: {name}")
+
+    def _not_found(self, message):
+        from firebase_admin import auth
+        return auth.UserNotFoundError(message)
+
+    # Test verisi hazırlama
+    def add_user(self, uid=None, email=None, display_name=None):
+        uid = uid or f"fake-{next(self._ids)}"
+        with self._lock:
+            self._users[uid] = _UserRecord(uid, email, display_name)
+        return uid
+
+    def issue_token(self, uid, **claims):
+        token = secrets.token_urlsafe(32)
+        now = int(time.time())
+        with self._lock:
+            self._tokens[token] = dict(claims, uid=uid, iat=now, exp=now + self.token_ttl)
+        return token
+
+    # firebase_admin.auth ile aynı imzalar
+    def verify_id_token(self, id_token, app=None, check_revoked=False, clock_skew_seconds=0):
+        self._count("verify_id_token", self.verify_latency)
+        claims = self._tokens.get(id_token)
+        if claims is None or claims["exp"] < time.time():
+            raise ValueError("Geçersiz token")
+        return dict(claims)
+
+    def create_user(self, uid=None, email=None, password=None, display_name=None, **kwargs):
+        self._count("create_user", self.latency)
+        uid = uid or f"fake-{next(self._ids)}"
+        with self._lock:
+            user = self._users[uid] = _UserRecord(uid, email, display_name)
+        return user
+
+    def update_user(self, uid, email=None, display_name=None, **kwargs):
+        self._count("update_user", self.latency)
+        with self._lock:
+            user = self._users.get(uid)
+            if user is None:
+                raise self._not_found(f"Kullanıcı yok: {uid}")
+            if email is not None:
+                user.email = email
+            if display_name is not None:
+                user.display_name = display_name
+        return user
+
+    def delete_user(self, uid, app=None):
+        self._count("delete_user", self.latency)
+        with self._lock:
+            if self._users.pop(uid, None) is None:
+                raise self._not_found(f"Kullanıcı yok: {uid}")
+
+    def get_user(self, uid, app=None):
+        self._count("get_user", self.latency)
+        user = self._users.get(uid)
+        if user is None:
+            raise self._not_found(f"Kullanıcı yok: {uid}")
+        return user
+
+    def get_user_by_email(self, email, app=None):
+        self._count("get_user_by_email", self.latency)
+        with self._lock:
+            for user in self._users.values():
+                if user.email == email:
+                    return user
+        raise self._not_found(f"Kullanıcı yok: {email}")
+
+    def import_users(self, users, hash_alg=None, app=None):
+        self._count("import_users", self.latency)
+        if len(users) > 1000:
+            raise ValueError("Tek çağrıda en fazla 1000 kullanıcı aktarılabilir")
+        if hash_alg is None and any(getattr(u, "password_hash", None) for u in users):
+            raise ValueError("Şifre hash'i olan kullanıcılar için hash_alg gerekli")
+        with self._lock:
+            for user in users:
+                self._users[user.uid] = _UserRecord(user.uid, user.email, user.display_name)
+        return _ImportResult(len(users), [])
+
+    def list_users(self, page_token=None, max_results=1000, app=None):
+        self._count("list_users", self.latency)
+        with self._lock:
+            uids = sorted(self._users)
+        start = int(page_token) if page_token else 0
+        chunk = uids[start:start + max_results]
+        next_token = str(start + max_results) if start + max_results < len(uids) else None
+        return _Page([self._users[uid] for uid in chunk if uid in self._users], next_token)
+
+_PATCHED = ("verify_id_token", "create_user", "update_user", "delete_user",
+            "get_user", "get_user_by_email", "list_users", "import_users")
+
+def install(fake):
+    """firebase_admin'in ağ ve kimlik bilgisi gerektiren giriş noktalarını sahte arka uca yönlendirir
+
+    `api` veya `firebase_service` içe aktarılmadan önce çağrılmalıdır.
+    """
+    import firebase_admin
+    from firebase_admin import auth, credentials
+
+    if not os.path.exists(os.getenv("FIREBASE_CREDENTIALS_PATH", "./firebase-credentials.json")):
+        handle, path = tempfile.mkstemp(suffix=".json")
+        os.close(handle)
+        os.environ["FIREBASE_CREDENTIALS_PATH"] = path
+
+    credentials.Certificate = lambda path: None
+    def initialize_app(credential=None, options=None, name="[DEFAULT]"):
+        fake._count("initialize_app", fake.init_latency)
+
+    firebase_admin.initialize_app = initialize_app
+    for name in _PATCHED:
+        setattr(auth, name, getattr(fake, name))
+    return fake
@@ -0,0 +1,280 @@
+"""Servis için tekrarlanabilir yük testi
+
+FastAPI `app`'i sahte bir Firebase Admin arka ucu ve yerel PostgreSQL ile
+süreç içinde çalıştırır (HTTP sunucusu ölçüme dahil değildir) ve her uç nokta
+için p50/p90/p99 gecikme ile saniyedeki istek sayısını raporlar.
+
+    DATABASE_URL=postgresql://postgres@localhost/bench python -m benchmarks.load run --output base.json
+    python -m benchmarks.load run --output new.json
+    python -m benchmarks.load compare base.json new.json --threshold 10
+
+`compare`, p99 gecikmesi veya istek hızı eşikten fazla kötüleşen uç nokta
+varsa 1 koduyla çıkar; CI'da commit'ler arası gerileme kontrolü için kullanılabilir.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+# Tüm istekler tek istemciden gelir; istemci başına hız sınırı ölçümü bozar.
+# config ortam değişkenlerini içe aktarımda okuduğu için uygulama modüllerinden önce ayarlanır.
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+from benchmarks.asgi import Lifespan, request, wait_ready
+from benchmarks.fake_firebase import FakeFirebaseAuth, install
+
+WEBHOOK_SECRET_HEADER = "X-Webhook-Signature"
+UID_PREFIX = "bench-"
+
+def percentile(sorted_values, pct):
+    """Sıralı listede en yakın sıra yöntemiyle yüzdelik değeri döndürür"""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(pct / 100.0 * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, label, seconds, status):
+        self.latencies.setdefault(label, []).append(seconds)
+        if status is None or status >= 400:
+            self.errors[label] = self.errors.get(label, 0) + 1
+
+    def summary(self, elapsed):
+        result = {}
+        for label, values in sorted(self.latencies.items()):
+            values.sort()
+            result[label] = {
+                "count": len(values),
+                "errors": self.errors.get(label, 0),
+                "rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+                "mean_ms": round(sum(values) / len(values) * 1000, 3),
+                "p50_ms": round(percentile(values, 50) * 1000, 3),
+                "p90_ms": round(percentile(values, 90) * 1000, 3),
+                "p99_ms": round(percentile(values, 99) * 1000, 3),
+            }
+        return result
+
+class Workload:
+    """Tohumlanmış kullanıcılar üzerinde istek üreten senaryolar"""
+
+    def __init__(self, fake, webhook_secret, users, tokens_per_user, rng):
+        self.fake = fake
+        self.webhook_secret = webhook_secret
+        self.rng = rng
+        self.users = users
+        self.tokens = {uid: [fake.issue_token(uid) for _ in range(tokens_per_user)] for uid, _ in users}
+        self.created = []
+        self.counter = 0
+
+    def _webhook(self, event_type, user_data):
+        return ("POST /webhook/auth " + event_type, "POST", "/webhook/auth",
+                {WEBHOOK_SECRET_HEADER: self.webhook_secret},
+                {"event_type": event_type, "user_data": user_data})
+
+    def webhook_storm(self):
+        roll = self.rng.random()
+        if roll < 0.4 or not self.created:
+            self.counter += 1
+            uid = f"{UID_PREFIX}storm-{self.counter}"
+            self.created.append(uid)
+            return self._webhook("create", {"uid": uid, "email": f"{uid}@bench.local", "display_name": uid})
+        if roll < 0.8:
+            uid, email = self.rng.choice(self.users)
+            return self._webhook("update", {"uid": uid, "email": email, "display_name": f"name-{self.rng.randint(0, 9999)}"})
+        uid = self.created.pop(self.rng.randrange(len(self.created)))
+        return self._webhook("delete", {"uid": uid})
+
+    def auth_update(self):
+        uid, _ = self.rng.choice(self.users)
+        token = self.rng.choice(self.tokens[uid])
+        return ("PUT /users/{uid}", "PUT", f"/users/{uid}", {"Authorization": f"Bearer {token}"},
+                {"display_name": f"name-{self.rng.randint(0, 9999)}"})
+
+    def email_lookup(self):
+        # Gerçekçi dağılım: isteklerin çoğu az sayıdaki sıcak kullanıcıya gider
+        hot = self.users[:max(1, len(self.users) // 10)]
+        uid, email = self.rng.choice(hot if self.rng.random() < 0.8 else self.users)
+        token = self.rng.choice(self.tokens[uid])
+        return ("GET /users/email/{email}", "GET", f"/users/email/{email}", {"Authorization": f"Bearer {token}"}, None)
+
+    def mixed(self):
+        roll = self.rng.random()
+        if roll < 0.3:
+            return self.webhook_storm()
+        if roll < 0.5:
+            return self.auth_update()
+        return self.email_lookup()
+
+SCENARIOS = ("webhook_storm", "auth_update", "email_lookup", "mixed")
+
+async def run_scenario(app, workload, scenario, total, concurrency):
+    recorder = Recorder()
+    make = getattr(workload, scenario)
+    remaining = total
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            label, method, url, headers, body = make()
+            start = time.perf_counter()
+            try:
+                status, _ = await request(app, method, url, headers=headers, json_body=body)
+            except Exception:
+                status = None
+            recorder.record(label, time.perf_counter() - start, status)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return recorder.summary(time.perf_counter() - start)
+
+def ensure_users_table():
+    """Uygulamanın ısınma adımlarından önce users tablosunun ve indekslerinin var olmasını sağlar"""
+    from schema import bootstrap_schema
+    bootstrap_schema()
+
+def _seed_users(count):
+    from database import upsert_users
+    users = [(f"{UID_PREFIX}{i}", f"{UID_PREFIX}{i}@bench.local") for i in range(count)]
+    for start in range(0, count, 1000):
+        upsert_users([{"uid": uid, "email": email, "display_name": uid} for uid, email in users[start:start + 1000]])
+    return users
+
+def _cleanup():
+    from database import get_connection
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM users WHERE firebase_uid LIKE %s", (UID_PREFIX + "%",))
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+async def _run(args):
+    fake = install(FakeFirebaseAuth(
+        latency=args.firebase_latency / 1000.0,
+        error_rate=args.fault_error_rate,
+        timeout_rate=args.fault_timeout_rate,
+        timeout=args.fault_timeout / 1000.0,
+        seed=args.seed,
+    ))
+
+    import api
+    from resilience import get_breaker_stats
+    from config import WEBHOOK_SECRET
+
+    ensure_users_table()
+    lifespan = Lifespan(api.app)
+    await lifespan.startup()
+    try:
+        await wait_ready(api.app)
+        users = await asyncio.get_running_loop().run_in_executor(None, _seed_users, args.users)
+        for uid, email in users:
+            fake.add_user(uid, email, uid)
+        workload = Workload(fake, WEBHOOK_SECRET, users, args.tokens_per_user, random.Random(args.seed))
+
+        results = {}
+        for scenario in args.scenarios:
+            if args.warmup:
+                await run_scenario(api.app, workload, scenario, args.warmup, args.concurrency)
+            results[scenario] = await run_scenario(api.app, workload, scenario, args.requests, args.concurrency)
+            print(f"{scenario}: " + ", ".join(
+                f"{label} p50={r['p50_ms']}ms p99={r['p99_ms']}ms rps={r['rps']}" for label, r in results[scenario].items()
+            ), file=sys.stderr)
+    finally:
+        await asyncio.get_running_loop().run_in_executor(None, _cleanup)
+        await lifespan.shutdown()
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "params": {k: v for k, v in vars(args).items() if k != "func"},
+            "firebase_calls": dict(fake.calls),
+            "firebase_faults": dict(fake.faults),
+            "circuit_breakers": get_breaker_stats(),
+        },
+        "results": results,
+    }
+
+def cmd_run(args):
+    report = asyncio.run(_run(args))
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+def compare_reports(base, new, threshold):
+    """İki raporu karşılaştırır ve eşiği aşan gerilemeleri döndürür"""
+    regressions = []
+    rows = []
+    for scenario, endpoints in new["results"].items():
+        for label, current in endpoints.items():
+            previous = base["results"].get(scenario, {}).get(label)
+            if previous is None:
+                continue
+            p99_change = (current["p99_ms"] - previous["p99_ms"]) / previous["p99_ms"] * 100 if previous["p99_ms"] else 0.0
+            rps_change = (current["rps"] - previous["rps"]) / previous["rps"] * 100 if previous["rps"] else 0.0
+            rows.append((scenario, label, previous["p99_ms"], current["p99_ms"], p99_change, previous["rps"], current["rps"], rps_change))
+            if p99_change > threshold or rps_change < -threshold:
+                regressions.append((scenario, label))
+    return rows, regressions
+
+def cmd_compare(args):
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    rows, regressions = compare_reports(base, new, args.threshold)
+    for scenario, label, p99_a, p99_b, p99_pct, rps_a, rps_b, rps_pct in rows:
+        mark = "  <-- gerileme" if (scenario, label) in regressions else ""
+        print(f"{scenario:14} {label:34} p99 {p99_a:9.3f} -> {p99_b:9.3f} ms ({p99_pct:+6.1f}%)  "
+              f"rps {rps_a:9.2f} -> {rps_b:9.2f} ({rps_pct:+6.1f}%){mark}")
+    return 1 if regressions else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servis yük testi ve gerileme karşılaştırması")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Yük testini çalıştır")
+    run.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    run.add_argument("--requests", type=int, default=2000, help="Senaryo başına istek sayısı")
+    run.add_argument("--warmup", type=int, default=200, help="Ölçülmeyen ısınma isteği sayısı")
+    run.add_argument("--concurrency", type=int, default=50, help="Eşzamanlı sanal istemci sayısı")
+    run.add_argument("--users", type=int, default=1000, help="Tohumlanacak kullanıcı sayısı")
+    run.add_argument("--tokens-per-user", type=int, default=2, help="Kullanıcı başına tekrar kullanılan token")
+    run.add_argument("--firebase-latency", type=float, default=20.0, help="Sahte Firebase çağrı gecikmesi (ms)")
+    run.add_argument("--fault-error-rate", type=float, default=0.0, help="Sahte Firebase çağrılarının hata oranı (0-1)")
+    run.add_argument("--fault-timeout-rate", type=float, default=0.0, help="Sahte Firebase çağrılarının zaman aşımı oranı (0-1)")
+    run.add_argument("--fault-timeout", type=float, default=1000.0, help="Zaman aşımı taklidinin süresi (ms)")
+    run.add_argument("--seed", type=int, default=42)
+    run.add_argument("--output", help="JSON raporun yazılacağı dosya")
+    run.set_defaults(func=cmd_run)
+
+    compare = sub.add_parser("compare", help="İki raporu karşılaştır")
+    compare.add_argument("base")
+    compare.add_argument("new")
+    compare.add_argument("--threshold", type=float, default=10.0, help="İzin verilen kötüleşme yüzdesi")
+    compare.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
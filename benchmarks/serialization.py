@@ -0,0 +1,144 @@
+"""Yanıt serileştirme mikro ölçümü
+
+Veritabanı satırından HTTP gövdesine kadar olan yolu iki biçimde ölçer:
+
+- eski: RealDictCursor satırı (sözlük) + dict() kopyası, FastAPI'nin
+  jsonable_encoder'ı ve JSONResponse (json.dumps)
+- yeni: cursor tuple'ından UserRecord ve FastJSONResponse (orjson varsa orjson)
+
+Her senaryo için istek başına CPU süresi (process_time) ve tracemalloc ile
+ölçülen tepe bellek ayrımı raporlanır. Veritabanı veya Firebase gerekmez;
+satırlar cursor'ın döndürdüğü biçimde bellekte üretilir.
+
+    python -m benchmarks.serialization --iterations 2000 --output serialization.json
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from benchmarks.load import _git_commit
+from database import UserRecord
+from serialization import FastJSONResponse, orjson
+
+COLUMNS = ("id", "firebase_uid", "email", "display_name", "created_at", "updated_at")
+
+def _rows(count):
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return [
+        (i, f"bench-{i:06d}", f"bench-{i:06d}@example.com", f"Kullanıcı {i}",
+         base + timedelta(seconds=i), base + timedelta(seconds=2 * i))
+        for i in range(1, count + 1)
+    ]
+
+def _firebase_summary(row):
+    return {"uid": row[1], "email": row[2], "display_name": row[3]}
+
+# Senaryo: (satırlar) -> yanıt içeriği. old_* sözlük satırları, new_* UserRecord kullanır.
+
+def _old_records(rows):
+    # RealDictCursor her satır için bir sözlük üretir, veri katmanı bir kez daha kopyalar
+    return [dict(dict(zip(COLUMNS, row))) for row in rows]
+
+def _new_records(rows):
+    return [UserRecord(*row) for row in rows]
+
+SCENARIOS = {
+    # POST /users ve PUT /users/{uid}: Firebase özeti + tek satır
+    "single_user": (1, lambda rows, records: {
+        "firebase_user": _firebase_summary(rows[0]),
+        "db_user": records[0],
+    }),
+    # GET /users: 100 satırlık keyset sayfası
+    "list_page": (100, lambda rows, records: {
+        "users": records,
+        "next_after": rows[-1][0],
+    }),
+    # POST /webhook/auth/batch: 100 olayın sonucu
+    "webhook_batch": (100, lambda rows, records: {
+        "results": [{"status": "success", "message": "Kullanıcı güncellendi", "user": record} for record in records],
+    }),
+}
+
+def _old_path(rows, build):
+    return JSONResponse(jsonable_encoder(build(rows, _old_records(rows)))).body
+
+def _new_path(rows, build):
+    return FastJSONResponse(build(rows, _new_records(rows))).body
+
+def _measure(path, rows, build, iterations, alloc_samples):
+    path(rows, build)
+    start = time.process_time()
+    for _ in range(iterations):
+        path(rows, build)
+    cpu_us = (time.process_time() - start) / iterations * 1e6
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(alloc_samples):
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            body = path(rows, build)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+            del body
+    finally:
+        tracemalloc.stop()
+    peaks.sort()
+    return {"cpu_us_per_request": round(cpu_us, 2), "peak_alloc_bytes": peaks[len(peaks) // 2]}
+
+def _run(args):
+    results = {}
+    for name, (count, build) in SCENARIOS.items():
+        rows = _rows(count)
+        old_body = _old_path(rows, build)
+        new_body = _new_path(rows, build)
+        if json.loads(old_body) != json.loads(new_body):
+            raise RuntimeError(f"{name}: eski ve yeni yol farklı JSON üretiyor")
+        old = _measure(_old_path, rows, build, args.iterations, args.alloc_samples)
+        new = _measure(_new_path, rows, build, args.iterations, args.alloc_samples)
+        results[name] = {
+            "rows": count,
+            "body_bytes": len(new_body),
+            "old": old,
+            "new": new,
+            "cpu_saving_pct": round(100.0 * (1 - new["cpu_us_per_request"] / old["cpu_us_per_request"]), 1),
+            "alloc_saving_pct": round(100.0 * (1 - new["peak_alloc_bytes"] / old["peak_alloc_bytes"]), 1),
+        }
+        print(f"{name}: cpu {old['cpu_us_per_request']:.1f} -> {new['cpu_us_per_request']:.1f} us, "
+              f"bellek {old['peak_alloc_bytes']} -> {new['peak_alloc_bytes']} B", file=sys.stderr)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Yanıt serileştirme yolunun CPU ve bellek maliyetini ölçer")
+    parser.add_argument("--iterations", type=int, default=2000, help="CPU ölçümü için senaryo başına tekrar")
+    parser.add_argument("--alloc-samples", type=int, default=50, help="Bellek ölçümü için senaryo başına örnek")
+    parser.add_argument("--output", help="JSON raporun yazılacağı dosya")
+    args = parser.parse_args(argv)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "encoder": f"orjson {orjson.__version__}" if orjson is not None else "json",
+            "params": vars(args),
+        },
+        "results": _run(args),
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
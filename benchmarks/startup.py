@@ -0,0 +1,133 @@
+"""Soğuk başlangıç ölçümü
+
+Her çalıştırma temiz bir alt süreçte yapılır (modül önbelleği paylaşılmaz) ve
+şu süreleri ölçer: `api` modülünün içe aktarılması, lifespan startup'ı, ilk
+/health yanıtı, ilk kimlik doğrulamalı istek ve /ready'nin 200 dönmesi.
+Firebase sahte arka uçla taklit edilir; veritabanı için DATABASE_URL gerekir.
+
+    DATABASE_URL=postgresql://postgres@localhost/bench python -m benchmarks.startup --runs 10 --output startup.json
+"""
+import argparse
+import asyncio
+import json
+import platform
+import subprocess
+import sys
+import time
+
+from benchmarks.load import percentile, ensure_users_table, _git_commit
+
+STARTUP_UID = "bench-startup"
+METRICS = ("import_ms", "startup_ms", "first_health_ms", "first_auth_request_ms", "ready_ms")
+
+async def _measure(args):
+    from benchmarks.asgi import Lifespan, request, wait_ready
+    from benchmarks.fake_firebase import FakeFirebaseAuth, install
+
+    fake = install(FakeFirebaseAuth(
+        latency=args.firebase_latency / 1000.0,
+        init_latency=args.firebase_init_latency / 1000.0,
+    ))
+    fake.add_user(STARTUP_UID, f"{STARTUP_UID}@example.com", STARTUP_UID)
+    token = fake.issue_token(STARTUP_UID)
+
+    start = time.perf_counter()
+    import api
+    import_done = time.perf_counter()
+
+    lifespan = Lifespan(api.app)
+    await lifespan.startup()
+    startup_done = time.perf_counter()
+    try:
+        await request(api.app, "GET", "/health")
+        health_done = time.perf_counter()
+
+        # Isınma bitmeden gelen ilk istek: tembel başlatma yolunu da ölçer
+        auth_start = time.perf_counter()
+        status, body = await request(
+            api.app, "PUT", f"/users/{STARTUP_UID}",
+            headers={"Authorization": f"Bearer {token}"},
+            json_body={"display_name": STARTUP_UID},
+        )
+        auth_done = time.perf_counter()
+        if status != 200:
+            raise RuntimeError(f"Kimlik doğrulamalı istek başarısız ({status}): {body.decode('utf-8', 'replace')}")
+
+        await wait_ready(api.app)
+        ready_done = time.perf_counter()
+    finally:
+        await lifespan.shutdown()
+
+    return {
+        "import_ms": (import_done - start) * 1000.0,
+        "startup_ms": (startup_done - import_done) * 1000.0,
+        "first_health_ms": (health_done - startup_done) * 1000.0,
+        "first_auth_request_ms": (auth_done - auth_start) * 1000.0,
+        "ready_ms": (ready_done - import_done) * 1000.0,
+    }
+
+def _child(args):
+    result = asyncio.run(_measure(args))
+    print(json.dumps(result))
+    return 0
+
+def _summarize(samples):
+    summary = {}
+    for name in METRICS:
+        values = sorted(sample[name] for sample in samples)
+        summary[name] = {
+            "min": round(values[0], 2),
+            "p50": round(percentile(values, 50), 2),
+            "max": round(values[-1], 2),
+        }
+    return summary
+
+def cmd_run(args):
+    # Tablo bir kez, ölçülen alt süreçlerin dışında oluşturulur
+    ensure_users_table()
+    samples = []
+    for i in range(args.runs):
+        output = subprocess.check_output([
+            sys.executable, "-m", "benchmarks.startup", "--child",
+            "--firebase-latency", str(args.firebase_latency),
+            "--firebase-init-latency", str(args.firebase_init_latency),
+        ])
+        # Uygulama logları stdout'a da yazabilir; ölçüm son satırdadır
+        sample = json.loads(output.decode("utf-8").strip().splitlines()[-1])
+        samples.append(sample)
+        print(f"çalıştırma {i + 1}/{args.runs}: " + " ".join(
+            f"{name}={sample[name]:.1f}" for name in METRICS
+        ), file=sys.stderr)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "params": {k: v for k, v in vars(args).items() if k not in ("func", "child")},
+        },
+        "results": _summarize(samples),
+        "samples": samples,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servisin soğuk başlangıç süresini ölçer")
+    parser.add_argument("--runs", type=int, default=5, help="Alt süreçte yapılacak ölçüm sayısı")
+    parser.add_argument("--firebase-latency", type=float, default=20.0, help="Sahte Firebase çağrı gecikmesi (ms)")
+    parser.add_argument("--firebase-init-latency", type=float, default=200.0, help="Sahte Firebase SDK başlatma süresi (ms)")
+    parser.add_argument("--output", help="JSON raporun yazılacağı dosya")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        return _child(args)
+    return cmd_run(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+class TTLCache:
+    """Thread-safe, boyut sınırlı LRU önbellek; her kaydın kendi son kullanma süresi vardır
+
+    Args:
+        maxsize (int): Tutulacak en fazla kayıt sayısı
+        ttl (float, optional): Kayıt başına varsayılan yaşam süresi (saniye)
+    """
+
+    def __init__(self, maxsize, ttl=None):
+        if maxsize < 1:
+            raise ValueError("maxsize en az 1 olmalıdır")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def get(self, key, default=None):
+        """Kaydı döndürür; yoksa veya süresi dolduysa default döner"""
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self._misses += 1
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at <= now:
+                del self._data[key]
+                self._expirations += 1
+                self._misses += 1
+                return default
+            self._data.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Kaydı ekler; ttl verilmezse önbelleğin varsayılan süresi kullanılır"""
+        if ttl is None:
+            ttl = self.ttl
+        if ttl is not None and ttl <= 0:
+            return
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._evictions += 1
+
+    def pop(self, key, default=None):
+        """Kaydı önbellekten çıkarır ve değerini döndürür"""
+        with self._lock:
+            item = self._data.pop(key, _MISSING)
+        if item is _MISSING:
+            return default
+        return item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """İsabet/ıska sayaçlarını ve doluluk bilgisini döndürür"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._data),
+                "max_size": self.maxsize,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+            }
+
+class UserLookupCache:
+    """E-posta ile kullanıcı sorguları için önbellek
+
+    Kayıtlar e-posta ile tutulur; uid üzerinden de geçersiz kılınabilmesi için
+    uid → e-posta eşlemesi ayrıca saklanır (kullanıcının e-postası değiştiğinde
+    eski adresin kaydı da düşer). E-postalar küçük harfe çevrilerek anahtar
+    yapılır; Firebase ve users sorgusu da büyük/küçük harf duyarsızdır.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self._by_email = TTLCache(maxsize, ttl)
+        self._email_by_uid = TTLCache(maxsize, ttl)
+
+    @staticmethod
+    def _key(email):
+        return email.strip().lower()
+
+    def get(self, email):
+        return self._by_email.get(self._key(email))
+
+    def set(self, email, user):
+        key = self._key(email)
+        self._by_email.set(key, user)
+        uid = user.get("uid")
+        if uid:
+            self._email_by_uid.set(uid, key)
+
+    def invalidate(self, uid=None, email=None):
+        """uid ve/veya e-postaya ait kaydı önbellekten çıkarır"""
+        if uid:
+            old_email = self._email_by_uid.pop(uid)
+            if old_email is not None:
+                self._by_email.pop(old_email)
+        if email:
+            self._by_email.pop(self._key(email))
+
+    def stats(self):
+        return self._by_email.stats()
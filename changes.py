@@ -0,0 +1,399 @@
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from admission import Overloaded
+from config import (
+    CHANGES_RETENTION_DAYS, CHANGES_CLIENT_BUFFER, CHANGES_MAX_CLIENTS,
+    CHANGES_REPLAY_BATCH_SIZE, CHANGES_RESUME_OVERLAP, CHANGES_HEARTBEAT_INTERVAL,
+)
+from database import get_connection, open_listen_connection, pin_primary
+from executor import run_db
+from metrics import REGISTRY, CHANGE_EVENTS, CHANGE_CLIENT_OVERFLOWS, gauge
+from schema import CHANGES_CHANNEL
+from serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+# users tablosundaki değişikliklerin Server-Sent Events akışı.
+# Her worker tek bir LISTEN bağlantısı tutar (ChangeHub) ve gelen bildirimleri
+# istemci başına sınırlı bir tampona dağıtır. Tamponu dolan yavaş istemci
+# canlı dağıtımdan çıkarılır ve kaldığı yerden user_changes tablosundan,
+# kendi hızında okumaya devam eder; hub hiçbir istemciyi beklemez.
+#
+# Sıra numaraları tahsis sırasındadır, bildirimler ise commit sırasıyla gelir;
+# eşzamanlı transaction'larda bir olay kendinden büyük numaralı bir olaydan
+# sonra gelebilir. Bu yüzden devam ederken CHANGES_RESUME_OVERLAP kadar geriden
+# okunur: teslimat en az bir kezdir, istemci aynı olayı iki kez alabilir.
+
+_PRUNE_INTERVAL = 3600.0
+_MAX_RECONNECT_DELAY = 30.0
+# EventSource'un yeniden bağlanmadan önce bekleyeceği süre (ms)
+_CLIENT_RETRY_MS = 2000
+
+def read_changes(after, limit=CHANGES_REPLAY_BATCH_SIZE):
+    """Sıra numarası after'dan büyük değişiklikleri sırayla döndürür
+
+    Returns:
+        list: (seq, bildirimle aynı JSON metni) çiftleri
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT c.seq, user_change_payload(c) FROM user_changes c WHERE c.seq > %s ORDER BY c.seq LIMIT %s",
+                (after, limit)
+            )
+            return cur.fetchall()
+
+def oldest_change_seq():
+    """Tabloda devam edilebilecek en küçük sıra numarasını döndürür
+
+    Tablo boşsa dizinin bir sonraki değeri döner.
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT COALESCE(
+                    (SELECT min(seq) FROM user_changes),
+                    pg_sequence_last_value('user_changes_seq_seq') + 1,
+                    1
+                )
+                """
+            )
+            return cur.fetchone()[0]
+
+def latest_change_seq():
+    """En son kaydedilen değişikliğin sıra numarasını döndürür (yoksa 0)"""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT COALESCE(max(seq), 0) FROM user_changes")
+            return cur.fetchone()[0]
+
+def prune_changes(limit=10000):
+    """Saklama süresi dolmuş değişiklik kayıtlarından en fazla limit kadarını siler"""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                DELETE FROM user_changes WHERE seq IN (
+                    SELECT seq FROM user_changes
+                    WHERE changed_at < now() - make_interval(secs => %s)
+                    LIMIT %s
+                )
+                """,
+                (CHANGES_RETENTION_DAYS * 86400, limit)
+            )
+            return cur.rowcount
+
+def _listen(conn):
+    with conn.cursor() as cur:
+        cur.execute(f"LISTEN {CHANGES_CHANNEL}")
+
+class _RecentSeqs:
+    """Son görülen sıra numaralarının sınırlı kümesi; tekrar eden olayları ayıklar"""
+
+    def __init__(self, size, high=None):
+        self.size = size
+        self.high = high
+        self._order = deque()
+        self._seen = set()
+
+    def add(self, seq):
+        """seq daha önce görülmediyse kaydeder ve True döndürür"""
+        if seq in self._seen:
+            return False
+        self._seen.add(seq)
+        self._order.append(seq)
+        if len(self._order) > self.size:
+            self._seen.discard(self._order.popleft())
+        if self.high is None or seq > self.high:
+            self.high = seq
+        return True
+
+class ChangeSubscription:
+    """Bir akış istemcisinin canlı olay tamponu"""
+
+    __slots__ = ("queue", "overflowed")
+
+    def __init__(self, size):
+        self.queue = asyncio.Queue(size)
+        self.overflowed = False
+
+class ChangeHub:
+    """Worker başına tek LISTEN bağlantısından gelen bildirimleri abonelere dağıtır
+
+    Yalnızca event loop thread'inden kullanılır. Bağlantı koparsa artan
+    aralıklarla yeniden bağlanır ve aradaki değişiklikleri tablodan okuyup
+    yayınlar.
+
+    Args:
+        buffer_size (int): İstemci başına canlı olay tamponu
+        max_clients (int): Aynı anda en fazla abone
+    """
+
+    def __init__(self, buffer_size=1000, max_clients=1000):
+        self.buffer_size = buffer_size
+        self.max_clients = max_clients
+        self.last_seq = None
+        self.connected = False
+        self._clients = set()
+        self._recent = _RecentSeqs(max(buffer_size, CHANGES_RESUME_OVERLAP) * 2)
+        self._conn = None
+        self._fd = None
+        self._lost = None
+        self._task = None
+        self._published = 0
+        self._overflows = 0
+        self._reconnects = 0
+        self._sessions = 0
+
+    def check_available(self):
+        """Yeni bir istemci kabul edilemiyorsa Overloaded fırlatır"""
+        if self.last_seq is None:
+            raise Overloaded("changes", "listener_unavailable", CHANGES_HEARTBEAT_INTERVAL)
+        if len(self._clients) >= self.max_clients:
+            raise Overloaded("changes", "clients_full", CHANGES_HEARTBEAT_INTERVAL)
+
+    def subscribe(self):
+        self.check_available()
+        client = ChangeSubscription(self.buffer_size)
+        self._clients.add(client)
+        return client
+
+    def unsubscribe(self, client):
+        self._clients.discard(client)
+
+    def _publish(self, seq, payload):
+        if not self._recent.add(seq):
+            return
+        self.last_seq = self._recent.high
+        self._published += 1
+        for client in list(self._clients):
+            try:
+                client.queue.put_nowait((seq, payload))
+            except asyncio.QueueFull:
+                # Yavaş istemci: tamponundakileri gönderdikten sonra tablodan devam eder
+                client.overflowed = True
+                self._clients.discard(client)
+                self._overflows += 1
+                CHANGE_CLIENT_OVERFLOWS.inc()
+
+    def _on_readable(self):
+        conn = self._conn
+        try:
+            conn.poll()
+        except Exception as e:
+            if not self._lost.done():
+                self._lost.set_exception(e)
+            return
+        while conn.notifies:
+            notify = conn.notifies.pop(0)
+            try:
+                change = json.loads(notify.payload)
+                seq = change["seq"]
+            except (ValueError, KeyError, TypeError):
+                logger.warning("Geçersiz değişiklik bildirimi: %s", notify.payload)
+                continue
+            # Başka bir worker'daki yazım da bu worker'da read-your-writes sabitlemesi başlatır
+            pin_primary(change.get("uid"))
+            self._publish(seq, notify.payload)
+
+    async def _catch_up(self):
+        after = max(self.last_seq - CHANGES_RESUME_OVERLAP, 0)
+        while True:
+            rows = await run_db(read_changes, after)
+            for seq, payload in rows:
+                self._publish(seq, payload)
+            if len(rows) < CHANGES_REPLAY_BATCH_SIZE:
+                return
+            after = rows[-1][0]
+
+    async def _listen_once(self, loop):
+        self._conn = await run_db(open_listen_connection)
+        await run_db(_listen, self._conn)
+        if self.last_seq is None:
+            self.last_seq = await run_db(latest_change_seq)
+        else:
+            # Bağlantı yokken kaçan değişiklikler
+            await self._catch_up()
+        self._lost = loop.create_future()
+        self._fd = self._conn.fileno()
+        loop.add_reader(self._fd, self._on_readable)
+        self.connected = True
+        self._sessions += 1
+        logger.info("Değişiklik dinleyicisi bağlandı (son sıra %s)", self.last_seq)
+        try:
+            # LISTEN sırasında okunmuş olabilecek bildirimler
+            self._on_readable()
+            while True:
+                try:
+                    await asyncio.wait_for(asyncio.shield(self._lost), timeout=_PRUNE_INTERVAL)
+                except asyncio.TimeoutError:
+                    deleted = await run_db(prune_changes)
+                    if deleted:
+                        logger.info("%s eski değişiklik kaydı silindi", deleted)
+        finally:
+            loop.remove_reader(self._fd)
+            self.connected = False
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        delay = 1.0
+        while True:
+            sessions = self._sessions
+            try:
+                await self._listen_once(loop)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self._sessions != sessions:
+                    # Bağlantı bir süre çalıştı; beklemeyi baştan başlat
+                    delay = 1.0
+                logger.warning("Değişiklik dinleyicisi koptu, %.0f sn sonra yeniden bağlanılacak: %s", delay, e)
+            self._close()
+            self._reconnects += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, _MAX_RECONNECT_DELAY)
+
+    def _close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def start(self):
+        """Dinleyici görevini başlatır; event loop içinden çağrılmalıdır"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._close()
+
+    def stats(self):
+        return {
+            "connected": self.connected,
+            "last_seq": self.last_seq,
+            "clients": len(self._clients),
+            "published": self._published,
+            "overflows": self._overflows,
+            "reconnects": self._reconnects,
+        }
+
+_hub = None
+_hub_pid = None
+
+def get_change_hub():
+    """Bu süreç (gunicorn worker'ı) için değişiklik dağıtıcısını döndürür"""
+    global _hub, _hub_pid
+    pid = os.getpid()
+    if _hub is None or _hub_pid != pid:
+        _hub = ChangeHub(CHANGES_CLIENT_BUFFER, CHANGES_MAX_CLIENTS)
+        _hub_pid = pid
+    return _hub
+
+def start_change_hub():
+    get_change_hub().start()
+
+async def stop_change_hub():
+    if _hub is not None and _hub_pid == os.getpid():
+        await _hub.stop()
+
+def get_change_stats():
+    """Dağıtıcı istatistiklerini döndürür, henüz oluşturulmadıysa None"""
+    if _hub is None or _hub_pid != os.getpid():
+        return None
+    return _hub.stats()
+
+def _frame(seq, payload, event="change"):
+    if seq is None:
+        return f"event: {event}\ndata: {payload}\n\n".encode("utf-8")
+    return f"id: {seq}\nevent: {event}\ndata: {payload}\n\n".encode("utf-8")
+
+async def _replay(after, sent):
+    """Tablodan after'dan sonraki değişiklikleri sayfa sayfa SSE çerçevesi olarak üretir"""
+    while True:
+        rows = await run_db(read_changes, after)
+        frames = [_frame(seq, payload) for seq, payload in rows if sent.add(seq)]
+        if frames:
+            CHANGE_EVENTS.inc(len(frames), source="replay")
+            yield b"".join(frames)
+        if len(rows) < CHANGES_REPLAY_BATCH_SIZE:
+            return
+        after = rows[-1][0]
+
+async def stream_changes(after=None):
+    """Değişiklikleri SSE çerçeveleri olarak üreten async generator
+
+    after verilirse önce tablodaki daha yeni değişiklikler gönderilir, sonra
+    canlı akışa geçilir; tablo okunurken gelen canlı olaylar istemcinin
+    tamponunda bekler. after saklama süresinin dışında kalmışsa önce bir
+    "reset" olayı gönderilir; istemci tam eşitleme yapmalıdır.
+
+    Yanıt başladıktan sonra 503 dönülemez: akış sırasında dağıtıcı yeni
+    abone alamıyorsa veya veritabanı devre kesicisi açıksa bir "error" olayı
+    ve Retry-After kadar "retry" süresi gönderilip akış kapatılır. İstemci
+    Last-Event-ID ile kaldığı yerden yeniden bağlanır.
+
+    Args:
+        after (int, optional): İstemcinin aldığı son sıra numarası
+    """
+    hub = get_change_hub()
+    client = hub.subscribe()
+    sent = _RecentSeqs(CHANGES_CLIENT_BUFFER + CHANGES_RESUME_OVERLAP, high=after if after is not None else hub.last_seq)
+    try:
+        yield f"retry: {_CLIENT_RETRY_MS}\n\n".encode("utf-8")
+        if after is not None:
+            oldest = await run_db(oldest_change_seq)
+            if after < oldest - 1:
+                yield _frame(None, dumps({"oldest_seq": oldest}).decode("utf-8"), event="reset")
+                after = oldest - 1
+            async for chunk in _replay(max(after - CHANGES_RESUME_OVERLAP, 0), sent):
+                yield chunk
+        while True:
+            if client.overflowed and client.queue.empty():
+                # Canlı dağıtımdan çıkarıldı: yeniden abone ol ve kaçanları tablodan oku
+                client = hub.subscribe()
+                async for chunk in _replay(max(sent.high - CHANGES_RESUME_OVERLAP, 0), sent):
+                    yield chunk
+                continue
+            try:
+                seq, payload = await asyncio.wait_for(client.queue.get(), CHANGES_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield b": ping\n\n"
+                continue
+            if sent.add(seq):
+                CHANGE_EVENTS.inc(source="live")
+                yield _frame(seq, payload)
+    except Overloaded as e:
+        logger.warning("Değişiklik akışı kapatılıyor (%s): %s", e.downstream, e.reason)
+        yield _error_frame(e, sent.high)
+    finally:
+        hub.unsubscribe(client)
+
+def _error_frame(exc, last_seq):
+    """Akışı sonlandıran error olayını ve yeniden bağlanma süresini oluşturur"""
+    retry_after = int(exc.headers.get("Retry-After", 1))
+    payload = dumps({"reason": exc.reason, "retry_after": retry_after, "last_seq": last_seq}).decode("utf-8")
+    return f"retry: {retry_after * 1000}\n".encode("utf-8") + _frame(None, payload, event="error")
+
+_CHANGE_CLIENTS = gauge("user_change_clients", "Bu worker'daki değişiklik akışı istemcileri")
+_CHANGE_LISTENER = gauge("user_change_listener_connected", "LISTEN bağlantısı açık mı (1/0)")
+
+@REGISTRY.register_collector
+def _collect_change_metrics():
+    stats = get_change_stats()
+    if stats is None:
+        return
+    _CHANGE_CLIENTS.set(stats["clients"])
+    _CHANGE_LISTENER.set(1 if stats["connected"] else 0)
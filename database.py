@@ -1,129 +1,1730 @@
+import contextvars
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from config import DATABASE_URL
+from psycopg2 import errors, extensions
+from psycopg2.extras import RealDictCursor, execute_values
+from config import (
+    DATABASE_URL,
+    DATABASE_REPLICA_URLS,
+    DB_REPLICA_POOL_MAX_SIZE,
+    DB_REPLICA_MAX_LAG,
+    DB_REPLICA_CHECK_INTERVAL,
+    DB_READ_YOUR_WRITES_WINDOW,
+    DB_POOL_MIN_SIZE,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_ACQUIRE_TIMEOUT,
+    DB_POOL_MAX_LIFETIME,
+    DB_POOL_MAX_IDLE,
+    DB_POOL_VALIDATION_INTERVAL,
+    DB_PREPARED_STATEMENTS,
+    DB_CONNECT_TIMEOUT,
+    DB_STATEMENT_TIMEOUT,
+    DB_RETRY_ATTEMPTS,
+    WEBHOOK_DEDUPE_RETENTION_DAYS,
+    DUAL_WRITE_REPAIR_DELAY,
+    USER_PROFILE_MAX_AGE,
+)
+from cache import TTLCache
+from executor import run_db
+from resilience import RetryPolicy, circuit_breaker
+from metrics import REGISTRY, DB_QUERY_DURATION, DB_POOL_ACQUIRE_DURATION, DB_READ_ROUTES, counter, gauge
 import logging
 
-# Loglama ayarları
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
-def get_db_connection():
-    """PostgreSQL veritabanına bağlantı oluşturur"""
-    try:
-        conn = psycopg2.connect(DATABASE_URL)
+class PoolError(Exception):
+    """Bağlantı havuzu kullanılamadığında fırlatılır"""
+
+class PoolTimeoutError(PoolError):
+    """Belirtilen süre içinde havuzdan bağlantı alınamadığında fırlatılır"""
+
+class WriteIntentClaimedError(Exception):
+    """Çift yazımın niyet kaydı onarıcı tarafından alındığında fırlatılır"""
+
+    def __init__(self, intent_id):
+        super().__init__(f"Yazım niyeti onarıcıya geçti: {intent_id}")
+        self.intent_id = intent_id
+
+class _Connection(extensions.connection):
+    """Oturumda hazırlanmış (PREPARE) ifadelerin adlarını tutan bağlantı"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+class _PooledConnection:
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn, created_at):
+        self.conn = conn
+        self.created_at = created_at
+        self.last_used = created_at
+
+class ConnectionPool:
+    """Thread-safe, sağlık kontrollü PostgreSQL bağlantı havuzu
+
+    Boştaki bağlantılar LIFO sırasıyla verilir, böylece sık kullanılan
+    bağlantılar sıcak kalır ve fazlalıklar max_idle sonunda kapanır.
+    Ömrü max_lifetime'ı aşan bağlantılar yenilenir, validation_interval'dan
+    uzun boşta kalanlar kullanılmadan önce `SELECT 1` ile doğrulanır.
+    connect_kwargs psycopg2.connect'e aynen iletilir (ör. connect_timeout).
+    """
+
+    def __init__(self, dsn, min_size=1, max_size=10, acquire_timeout=5.0,
+                 max_lifetime=1800.0, max_idle=300.0, validation_interval=30.0,
+                 connect_kwargs=None):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Geçersiz havuz boyutu: min={min_size}, max={max_size}")
+        self.dsn = dsn
+        self.connect_kwargs = dict(connect_kwargs or {})
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.validation_interval = validation_interval
+
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._in_use = {}
+        self._size = 0
+        self._waiting = 0
+        self._closed = False
+
+        # İstatistikler
+        self._acquired = 0
+        self._created = 0
+        self._discarded = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, connection_factory=_Connection, **self.connect_kwargs)
         conn.autocommit = True
         return conn
-    except Exception as e:
-        logger.error(f"Veritabanı bağlantısı hatası: {str(e)}")
+
+    def open(self):
+        """Havuzu min_size kadar bağlantıyla önceden doldurur"""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                entry = _PooledConnection(self._connect(), time.monotonic())
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._created += 1
+                self._idle.append(entry)
+                self._cond.notify()
+
+    def _is_usable(self, entry, now):
+        if entry.conn.closed:
+            return False
+        if now - entry.created_at > self.max_lifetime:
+            return False
+        if now - entry.last_used > self.validation_interval:
+            try:
+                with entry.conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+            except Exception as e:
+                logger.warning("Havuzdaki bağlantı doğrulanamadı, yenileniyor: %s", e)
+                return False
+        return True
+
+    def _close_entry(self, entry):
+        try:
+            entry.conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._discarded += 1
+            self._cond.notify()
+
+    def _prune_idle(self, now):
+        """min_size üzerindeki, max_idle'dan uzun süredir boşta kalan bağlantıları ayırır"""
+        stale = []
+        while self._idle and self._size - len(stale) > self.min_size:
+            oldest = self._idle[0]
+            if now - oldest.last_used <= self.max_idle:
+                break
+            stale.append(self._idle.popleft())
+        return stale
+
+    def getconn(self, timeout=None):
+        """Havuzdan bir bağlantı alır
+
+        Args:
+            timeout (float, optional): Bekleme süresi, verilmezse acquire_timeout
+
+        Returns:
+            connection: autocommit modunda psycopg2 bağlantısı
+        """
+        start = time.monotonic()
+        deadline = start + (self.acquire_timeout if timeout is None else timeout)
+        while True:
+            entry = None
+            with self._cond:
+                stale = self._prune_idle(time.monotonic())
+                while True:
+                    if self._closed:
+                        raise PoolError("Bağlantı havuzu kapatıldı")
+                    if self._idle:
+                        entry = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(
+                            f"{self.max_size} bağlantılık havuzdan bağlantı alınamadı"
+                        )
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+            for old in stale:
+                self._close_entry(old)
+
+            now = time.monotonic()
+            if entry is None:
+                try:
+                    entry = _PooledConnection(self._connect(), now)
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._created += 1
+            elif not self._is_usable(entry, now):
+                self._close_entry(entry)
+                continue
+
+            waited = time.monotonic() - start
+            DB_POOL_ACQUIRE_DURATION.observe(waited)
+            with self._cond:
+                self._in_use[id(entry.conn)] = entry
+                self._acquired += 1
+                self._wait_total += waited
+                if waited > self._wait_max:
+                    self._wait_max = waited
+            return entry.conn
+
+    def putconn(self, conn, discard=False):
+        """Bağlantıyı havuza iade eder, bozuk veya süresi dolmuşsa kapatır"""
+        with self._cond:
+            entry = self._in_use.pop(id(conn), None)
+        if entry is None:
+            raise PoolError("Bu bağlantı havuza ait değil")
+
+        now = time.monotonic()
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                if not conn.autocommit:
+                    conn.autocommit = True
+            except Exception:
+                discard = True
+        if discard or conn.closed or self._closed or now - entry.created_at > self.max_lifetime:
+            self._close_entry(entry)
+            return
+
+        entry.last_used = now
+        with self._cond:
+            self._idle.append(entry)
+            self._cond.notify()
+
+    def close(self):
+        """Havuzu kapatır ve boştaki tüm bağlantıları kapatır"""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for entry in idle:
+            self._close_entry(entry)
+
+    def stats(self):
+        """Havuz boyutlandırması için anlık istatistikleri döndürür"""
+        with self._cond:
+            acquired = self._acquired
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+                "waiting": self._waiting,
+                "acquired_total": acquired,
+                "created_total": self._created,
+                "discarded_total": self._discarded,
+                "timeouts_total": self._timeouts,
+                "avg_wait_ms": round(self._wait_total / acquired * 1000, 3) if acquired else 0.0,
+                "max_wait_ms": round(self._wait_max * 1000, 3),
+            }
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def _connect_kwargs():
+    """Bağlantı kurma ve ifade zaman aşımlarını psycopg2.connect argümanlarına çevirir"""
+    kwargs = {}
+    if DB_CONNECT_TIMEOUT > 0:
+        kwargs["connect_timeout"] = DB_CONNECT_TIMEOUT
+    if DB_STATEMENT_TIMEOUT > 0:
+        # Oturumun varsayılanı olur; uzun işler SET LOCAL / RESET ile kaldırır
+        kwargs["options"] = f"-c statement_timeout={int(DB_STATEMENT_TIMEOUT * 1000)}"
+    return kwargs
+
+def open_listen_connection():
+    """Havuz dışında, LISTEN için uzun ömürlü bir autocommit bağlantı açar
+
+    Sessizce kopan bağlantıların fark edilmesi için TCP keepalive açılır.
+    """
+    conn = psycopg2.connect(
+        DATABASE_URL,
+        keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3,
+        **_connect_kwargs()
+    )
+    conn.autocommit = True
+    return conn
+
+def get_pool():
+    """Bu süreç (gunicorn worker'ı) için bağlantı havuzunu döndürür
+
+    Havuz ilk kullanımda oluşturulur. Fork sonrası ebeveynden devralınan
+    havuz kullanılmaz; soketleri paylaşmamak için yeni bir havuz açılır.
+    """
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            _pool = ConnectionPool(
+                DATABASE_URL,
+                min_size=DB_POOL_MIN_SIZE,
+                max_size=DB_POOL_MAX_SIZE,
+                acquire_timeout=DB_POOL_ACQUIRE_TIMEOUT,
+                max_lifetime=DB_POOL_MAX_LIFETIME,
+                max_idle=DB_POOL_MAX_IDLE,
+                validation_interval=DB_POOL_VALIDATION_INTERVAL,
+                connect_kwargs=_connect_kwargs(),
+            )
+            _pool_pid = pid
+            logger.info("Veritabanı bağlantı havuzu oluşturuldu (min=%s, max=%s)", DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE)
+        return _pool
+
+def close_pool():
+    """Süreç kapanırken primary ve replika havuzlarını kapatır"""
+    global _pool, _router
+    stop_replica_monitor()
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.close()
+        _pool = None
+        if _router is not None and _router_pid == os.getpid():
+            _router.close()
+        _router = None
+
+def get_pool_stats():
+    """Havuz istatistiklerini döndürür, havuz henüz oluşturulmadıysa None"""
+    pool = _pool
+    if pool is None or _pool_pid != os.getpid():
+        return None
+    return pool.stats()
+
+def _timed(statement):
+    """SQL ifadesinin süresini db_query_duration_seconds metriğine kaydeder"""
+    return DB_QUERY_DURATION.time(statement=statement)
+
+_POOL_CONNECTIONS = gauge("db_pool_connections", "Havuzdaki bağlantılar", ("state",))
+_POOL_WAITING = gauge("db_pool_waiting", "Bağlantı bekleyen çağrılar")
+_POOL_TIMEOUTS = counter("db_pool_timeouts_total", "Zaman aşımına uğrayan bağlantı istekleri")
+
+@REGISTRY.register_collector
+def _collect_pool_metrics():
+    stats = get_pool_stats()
+    if stats is None:
+        return
+    _POOL_CONNECTIONS.set(stats["idle"], state="idle")
+    _POOL_CONNECTIONS.set(stats["in_use"], state="in_use")
+    _POOL_WAITING.set(stats["waiting"])
+    _POOL_TIMEOUTS.set_total(stats["timeouts_total"])
+
+def _is_db_failure(exc):
+    # Bağlantı hataları ve zaman aşımları (QueryCanceledError da OperationalError'dır);
+    # kısıt ihlalleri veya havuzun kendi doluluğu veritabanı arızası sayılmaz
+    return isinstance(exc, psycopg2.OperationalError)
+
+def _is_retryable_db_error(exc):
+    # Zaman aşımına uğrayan sorguyu tekrarlamak yükü yalnızca artırır
+    return isinstance(exc, psycopg2.OperationalError) and not isinstance(exc, extensions.QueryCanceledError)
+
+# Havuz zaman aşımı yerel doluluktur; veritabanının sağlığı hakkında bilgi vermez
+_db_breaker = circuit_breaker("db", _is_db_failure, lambda exc: isinstance(exc, PoolError))
+
+# Yalnızca okuma fonksiyonları yeniden denenir
+_read_retry = RetryPolicy("db", _is_retryable_db_error, attempts=DB_RETRY_ATTEMPTS)
+
+@contextmanager
+def get_connection():
+    """Havuzdan bağlantı alır ve blok bitince iade eder
+
+    Blok içindeki bağlantı hataları ve zaman aşımları veritabanı devre
+    kesicisine yazılır; devre açıkken havuza gidilmeden CircuitOpenError fırlatılır.
+    """
+    pool = get_pool()
+    with _db_breaker.guard():
+        try:
+            conn = pool.getconn()
+        except Exception as e:
+            logger.error("Veritabanı bağlantısı hatası: %s", e)
+            raise
+        try:
+            yield conn
+        except psycopg2.OperationalError:
+            # Sunucu bağlantıyı kopardıysa bağlantıyı havuza geri koyma
+            pool.putconn(conn, discard=True)
+            raise
+        except BaseException:
+            pool.putconn(conn)
+            raise
+        else:
+            pool.putconn(conn)
+
+# Okuma/yazma ayrımı: yazımlar ve tutarlılık gerektiren okumalar her zaman
+# primary'ye (DATABASE_URL) gider. Eskimeye dayanıklı okumalar
+# (get_read_connection) gecikmesi DB_REPLICA_MAX_LAG'ı aşmayan sağlıklı bir
+# replikaya yönlenir; uygun replika yoksa primary kullanılır. Bir kullanıcının
+# yazımından sonra DB_READ_YOUR_WRITES_WINDOW süresince o kullanıcı adına
+# yapılan okumalar primary'ye sabitlenir.
+
+# Replika akış replikasyonuyla primary'yi izliyorsa gecikme, alınmış ancak
+# henüz uygulanmamış WAL varken son uygulanan transaction'ın yaşıdır. WAL
+# alıcısı çalışmıyorsa (bağlantı kopmuş) gecikme bilinmez sayılır. Recovery
+# modunda olmayan bir sunucu (ör. mantıksal replika) gecikmesiz kabul edilir.
+_REPLICA_LAG_SQL = """
+    SELECT pg_is_in_recovery(),
+           CASE
+               WHEN NOT pg_is_in_recovery() THEN 0
+               WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver) THEN NULL
+               WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+               ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+           END
+"""
+
+def _replica_name(url, index):
+    """Metrik ve loglarda parola içermeden kullanılacak replika adı"""
+    try:
+        params = extensions.parse_dsn(url)
+    except Exception:
+        return f"replica{index}"
+    return f"{params.get('host', 'localhost')}:{params.get('port', 5432)}"
+
+class _Replica:
+    __slots__ = ("name", "pool", "healthy", "lag", "checked_at", "error")
+
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        # İlk ölçüme kadar okuma almaz
+        self.healthy = False
+        self.lag = None
+        self.checked_at = None
+        self.error = None
+
+class ReplicaRouter:
+    """Okuma sorgularını sağlıklı ve yeterince güncel replikalar arasında sırayla dağıtır
+
+    Replikaların durumu check_all ile (izleme thread'inden) güncellenir;
+    yönlendirme yalnızca son ölçüme bakar ve veritabanına gitmez. Okuma
+    sırasında bağlantı hatası alan replika bir sonraki başarılı ölçüme kadar
+    devre dışı kalır.
+
+    Args:
+        urls (list): Replika bağlantı adresleri
+        max_lag (float): Okuma alabilecek en fazla gecikme (saniye)
+        pool_kwargs (dict): Her replika havuzu için ConnectionPool argümanları
+    """
+
+    def __init__(self, urls, max_lag, pool_kwargs):
+        self.max_lag = max_lag
+        self.replicas = [
+            _Replica(_replica_name(url, index), ConnectionPool(url, **pool_kwargs))
+            for index, url in enumerate(urls)
+        ]
+        self._lock = threading.Lock()
+        self._next = 0
+        self._standalone_warned = set()
+
+    def _eligible(self, replica):
+        return replica.healthy and replica.lag is not None and replica.lag <= self.max_lag
+
+    def choose(self):
+        """Okuma için bir replika seçer, uygun replika yoksa None döner"""
+        with self._lock:
+            eligible = [replica for replica in self.replicas if self._eligible(replica)]
+            if not eligible:
+                return None
+            self._next += 1
+            return eligible[self._next % len(eligible)]
+
+    def check(self, replica):
+        """Replikaya bağlanıp gecikmesini ölçer ve durumunu günceller"""
+        try:
+            conn = replica.pool.getconn()
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(_REPLICA_LAG_SQL)
+                    in_recovery, lag = cur.fetchone()
+            except BaseException as e:
+                replica.pool.putconn(conn, discard=isinstance(e, psycopg2.OperationalError))
+                raise
+            replica.pool.putconn(conn)
+        except Exception as e:
+            self.mark_failed(replica, e)
+            return
+        if not in_recovery and replica.name not in self._standalone_warned:
+            self._standalone_warned.add(replica.name)
+            logger.warning("Replika %s recovery modunda değil, gecikmesiz kabul ediliyor", replica.name)
+        with self._lock:
+            was_eligible = self._eligible(replica)
+            replica.healthy = True
+            replica.lag = float(lag) if lag is not None else None
+            replica.checked_at = time.time()
+            replica.error = None
+            eligible = self._eligible(replica)
+        if eligible and not was_eligible:
+            logger.info("Replika %s okumalara açıldı (gecikme %.3f sn)", replica.name, replica.lag)
+        elif was_eligible and not eligible:
+            logger.warning("Replika %s gecikmesi eşiği aştı (%s sn), okumalar diğer sunuculara yönleniyor",
+                           replica.name, replica.lag)
+
+    def check_all(self):
+        for replica in self.replicas:
+            self.check(replica)
+
+    def mark_failed(self, replica, exc):
+        """Replikayı bir sonraki başarılı ölçüme kadar devre dışı bırakır"""
+        with self._lock:
+            was_healthy = replica.healthy
+            replica.healthy = False
+            replica.checked_at = time.time()
+            replica.error = str(exc)
+        if was_healthy:
+            logger.warning("Replika %s kullanılamıyor, okumalar primary'ye yönleniyor: %s", replica.name, exc)
+
+    def stats(self):
+        with self._lock:
+            return [
+                {
+                    "name": replica.name,
+                    "healthy": replica.healthy,
+                    "eligible": self._eligible(replica),
+                    "lag_seconds": replica.lag,
+                    "checked_at": replica.checked_at,
+                    "error": replica.error,
+                    "pool": replica.pool.stats(),
+                }
+                for replica in self.replicas
+            ]
+
+    def close(self):
+        for replica in self.replicas:
+            replica.pool.close()
+
+_router = None
+_router_pid = None
+
+def get_replica_router():
+    """Bu süreç için replika yönlendiricisini döndürür; replika tanımlı değilse None"""
+    global _router, _router_pid
+    if not DATABASE_REPLICA_URLS:
+        return None
+    pid = os.getpid()
+    if _router is not None and _router_pid == pid:
+        return _router
+    with _pool_lock:
+        if _router is None or _router_pid != pid:
+            _router = ReplicaRouter(
+                DATABASE_REPLICA_URLS,
+                DB_REPLICA_MAX_LAG,
+                dict(
+                    min_size=0,
+                    max_size=DB_REPLICA_POOL_MAX_SIZE,
+                    acquire_timeout=DB_POOL_ACQUIRE_TIMEOUT,
+                    max_lifetime=DB_POOL_MAX_LIFETIME,
+                    max_idle=DB_POOL_MAX_IDLE,
+                    validation_interval=DB_POOL_VALIDATION_INTERVAL,
+                    connect_kwargs=_connect_kwargs(),
+                )
+            )
+            _router_pid = pid
+            logger.info("%s okuma replikası tanımlandı", len(DATABASE_REPLICA_URLS))
+        return _router
+
+def get_replica_stats():
+    """Replika durumlarını döndürür, replika tanımlı değilse None"""
+    router = _router
+    if router is None or _router_pid != os.getpid():
+        return None
+    return router.stats()
+
+_monitor = None
+_monitor_stop = threading.Event()
+
+def _monitor_loop(router):
+    while not _monitor_stop.is_set():
+        try:
+            router.check_all()
+        except Exception as e:
+            logger.exception("Replika izleme hatası: %s", e)
+        _monitor_stop.wait(DB_REPLICA_CHECK_INTERVAL)
+
+def start_replica_monitor():
+    """Replikaların sağlık ve gecikmesini DB_REPLICA_CHECK_INTERVAL aralıkla ölçen thread'i başlatır
+
+    İzleme çalışmıyorsa replikalar ölçülmez ve tüm okumalar primary'ye gider.
+    """
+    global _monitor
+    router = get_replica_router()
+    if router is None or (_monitor is not None and _monitor.is_alive()):
+        return
+    router.check_all()
+    _monitor_stop.clear()
+    _monitor = threading.Thread(target=_monitor_loop, args=(router,), name="db-replica-monitor", daemon=True)
+    _monitor.start()
+
+def stop_replica_monitor(timeout=5.0):
+    global _monitor
+    _monitor_stop.set()
+    if _monitor is not None:
+        _monitor.join(timeout)
+    _monitor = None
+
+# Son yazımı DB_READ_YOUR_WRITES_WINDOW içinde olan kullanıcılar
+_primary_pins = TTLCache(100000, ttl=DB_READ_YOUR_WRITES_WINDOW)
+# İsteğin okumalarının hangi kullanıcı adına yapıldığı (api.verify_token atar)
+_read_session = contextvars.ContextVar("db_read_session", default=None)
+
+def set_read_session(firebase_uid):
+    """Geçerli isteğin okumalarını verilen kullanıcıya bağlar (read-your-writes için)"""
+    _read_session.set(firebase_uid)
+
+def pin_primary(*firebase_uids):
+    """Kullanıcıların okumalarını DB_READ_YOUR_WRITES_WINDOW süresince primary'ye sabitler"""
+    if not DATABASE_REPLICA_URLS:
+        return
+    for uid in firebase_uids:
+        if uid:
+            _primary_pins.set(uid, True)
+
+def _is_pinned(key):
+    for uid in (key, _read_session.get()):
+        if uid and _primary_pins.get(uid) is not None:
+            return True
+    return False
+
+@contextmanager
+def get_read_connection(pin_key=None):
+    """Eskimeye dayanıklı okumalar için bağlantı alır
+
+    Uygun bir replika varsa onun havuzundan, yoksa get_connection ile
+    primary'den bağlantı verilir. Okuma geçerli istekteki kullanıcı veya
+    pin_key adına yapılıyorsa ve bu kullanıcı yakın zamanda yazdıysa primary
+    kullanılır. Replikada bağlantı hatası alınırsa replika devre dışı kalır ve
+    hata fırlatılır; yeniden deneme primary'ye gider.
+
+    Args:
+        pin_key (str, optional): Okumanın ait olduğu kullanıcının firebase_uid'si
+    """
+    router = get_replica_router()
+    replica = None
+    if router is not None:
+        if _is_pinned(pin_key):
+            DB_READ_ROUTES.inc(target="primary", reason="pinned")
+        else:
+            replica = router.choose()
+            if replica is None:
+                DB_READ_ROUTES.inc(target="primary", reason="no_replica")
+    if replica is not None:
+        try:
+            conn = replica.pool.getconn()
+        except Exception as e:
+            router.mark_failed(replica, e)
+            DB_READ_ROUTES.inc(target="primary", reason="failover")
+            replica = None
+    if replica is None:
+        with get_connection() as conn:
+            yield conn
+        return
+
+    DB_READ_ROUTES.inc(target="replica", reason="healthy")
+    try:
+        yield conn
+    except psycopg2.OperationalError as e:
+        replica.pool.putconn(conn, discard=True)
+        if not isinstance(e, extensions.QueryCanceledError):
+            router.mark_failed(replica, e)
+        raise
+    except BaseException:
+        replica.pool.putconn(conn)
         raise
+    else:
+        replica.pool.putconn(conn)
+
+_REPLICA_HEALTHY = gauge("db_replica_healthy", "Replika okuma alabiliyor mu (1 evet, 0 hayır)", ("replica",))
+_REPLICA_LAG = gauge("db_replica_lag_seconds", "Replikanın son ölçülen gecikmesi", ("replica",))
+
+@REGISTRY.register_collector
+def _collect_replica_metrics():
+    for stats in get_replica_stats() or ():
+        _REPLICA_HEALTHY.set(1 if stats["eligible"] else 0, replica=stats["name"])
+        if stats["lag_seconds"] is not None:
+            _REPLICA_LAG.set(stats["lag_seconds"], replica=stats["name"])
+
+@dataclass
+class UserRecord:
+    """users tablosundaki bir kullanıcı satırı
+
+    Cursor'ın döndürdüğü tuple'dan doğrudan oluşturulur; __slots__ sayesinde
+    satır başına sözlük ayrılmaz. Yanıtlarda serialization.dumps ile
+    doğrudan JSON nesnesine çevrilir.
+    """
+    __slots__ = ("id", "firebase_uid", "email", "display_name", "created_at", "updated_at")
+
+    id: int
+    firebase_uid: str
+    email: Optional[str]
+    display_name: Optional[str]
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+# UserRecord alan sırası; kullanıcı döndüren tüm sorgular bu kolonları seçer
+_USER_COLUMNS = "id, firebase_uid, email, display_name, created_at, updated_at"
+
+def _user_records(rows):
+    return [UserRecord(*row) for row in rows]
+
+# Satır yoksa ekler, varsa yalnızca verilen alanları günceller. Sürümlü bir
+# yazım, satırda daha yeni (veya aynı) bir sürüm varsa uygulanmaz ve satır döndürmez.
+_UPSERT_USER_SQL = """
+    INSERT INTO users (firebase_uid, email, display_name, source_version, created_at)
+    VALUES %s
+    ON CONFLICT (firebase_uid) DO UPDATE
+    SET email = COALESCE(EXCLUDED.email, users.email),
+        display_name = COALESCE(EXCLUDED.display_name, users.display_name),
+        source_version = COALESCE(EXCLUDED.source_version, users.source_version),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE EXCLUDED.source_version IS NULL
+       OR users.source_version IS NULL
+       OR users.source_version < EXCLUDED.source_version
+    RETURNING id, firebase_uid, email, display_name, created_at, updated_at
+"""
+# (firebase_uid, email, display_name, source_version)
+_UPSERT_USER_TEMPLATE = "(%s, %s, %s, %s, CURRENT_TIMESTAMP)"
+
+# Sıcak yoldaki tek satırlık sorgular sunucu tarafında hazırlanır (PREPARE):
+# ayrıştırma ve planlama bağlantı başına bir kez yapılır, sonraki çağrılar
+# yalnızca EXECUTE gönderir. Ad -> (parametre tipleri, $n parametreli SQL)
+_PREPARED_STATEMENTS = {}
+
+def _register_statement(name, types, sql):
+    # Hazırlama kapalıyken veya transaction içinde aynı SQL pyformat ile çalıştırılır
+    fallback = re.sub(r"\$(\d+)", r"%(p\1)s", sql)
+    _PREPARED_STATEMENTS[name] = (types, sql, fallback)
+
+# Tek ifadede ekleme: çakışmada mevcut satırı döndürür (iki ayrı sorgu ve yarış olmadan)
+_register_statement("insert_user", ("text", "text", "text", "bigint"), """
+    WITH inserted AS (
+        INSERT INTO users (firebase_uid, email, display_name, source_version, created_at)
+        VALUES ($1, $2, $3, $4, CURRENT_TIMESTAMP)
+        ON CONFLICT (firebase_uid) DO NOTHING
+        RETURNING id, firebase_uid, email, display_name, created_at, updated_at
+    )
+    SELECT id, firebase_uid, email, display_name, created_at, updated_at, TRUE AS inserted FROM inserted
+    UNION ALL
+    SELECT id, firebase_uid, email, display_name, created_at, updated_at, FALSE AS inserted FROM users
+    WHERE firebase_uid = $1 AND NOT EXISTS (SELECT 1 FROM inserted)
+""")
+
+# Onarım: satırı Firebase'deki kayda eşitler; boş (None) alanlar da yazılır
+_register_statement("replace_user", ("text", "text", "text"), """
+    INSERT INTO users (firebase_uid, email, display_name, created_at)
+    VALUES ($1, $2, $3, CURRENT_TIMESTAMP)
+    ON CONFLICT (firebase_uid) DO UPDATE
+    SET email = EXCLUDED.email,
+        display_name = EXCLUDED.display_name,
+        updated_at = CURRENT_TIMESTAMP
+    RETURNING id, firebase_uid, email, display_name, created_at, updated_at
+""")
+
+_register_statement("select_user_by_uid", ("text",), f"""
+    SELECT {_USER_COLUMNS} FROM users WHERE firebase_uid = $1
+""")
+
+_register_statement(
+    "upsert_user", ("text", "text", "text", "bigint"),
+    _UPSERT_USER_SQL.replace("VALUES %s", "VALUES ($1, $2, $3, $4, CURRENT_TIMESTAMP)")
+)
+
+_register_statement("update_user", ("text", "text", "text", "bigint"), """
+    UPDATE users
+    SET email = COALESCE($2, email),
+        display_name = COALESCE($3, display_name),
+        source_version = COALESCE($4, source_version),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE firebase_uid = $1
+      AND ($4 IS NULL OR source_version IS NULL OR source_version < $4)
+    RETURNING id, firebase_uid, email, display_name, created_at, updated_at
+""")
+
+_register_statement("delete_user", ("text", "bigint"), """
+    DELETE FROM users WHERE firebase_uid = $1
+      AND ($2 IS NULL OR source_version IS NULL OR source_version <= $2)
+""")
+
+# Firebase'den alınan profil alanları (telefon, fotoğraf, disabled) yalnızca
+# satırın kaydedildikleri sürümü hâlâ geçerliyse ve $2 saniyeden yeniyse döner
+_register_statement("select_user_details_by_email", ("text", "float8"), """
+    SELECT u.id, u.firebase_uid, u.email, u.display_name, u.created_at, u.updated_at,
+           p.phone_number, p.photo_url, p.disabled
+    FROM users u
+    LEFT JOIN user_profiles p
+      ON p.firebase_uid = u.firebase_uid
+     AND p.user_version = COALESCE(u.updated_at, u.created_at)
+     AND p.synced_at > now() - make_interval(secs => $2)
+    WHERE lower(u.email) = lower($1)
+    LIMIT 1
+""")
+
+# Çift yazım niyeti; next_attempt_at dolana kadar onarıcı kayda dokunmaz
+_register_statement("insert_write_intent", ("text", "text", "float8"), """
+    INSERT INTO dual_write_intents (op, firebase_uid, next_attempt_at)
+    VALUES ($1, $2, now() + make_interval(secs => $3))
+    RETURNING id
+""")
+
+def _prepare(cur, name):
+    types, sql, _ = _PREPARED_STATEMENTS[name]
+    cur.execute(f"PREPARE {name} ({', '.join(types)}) AS {sql}")
+    cur.connection.prepared.add(name)
 
-def insert_user(firebase_uid, email=None, display_name=None):
+def _execute(cur, name, params):
+    """Kayıtlı bir ifadeyi bağlantıda hazırlayarak (ilk kullanımda) çalıştırır
+
+    PREPARE transaction'a bağlı olmadığından yalnızca autocommit modundaki
+    havuz bağlantılarında kullanılır; transaction içinde, havuz dışı
+    bağlantılarda veya DB_PREPARED_STATEMENTS=false iken SQL doğrudan çalışır.
+
+    Args:
+        cur: psycopg2 cursor'ı
+        name (str): _PREPARED_STATEMENTS içindeki ifade adı
+        params (tuple): $1, $2, ... sırasıyla parametreler
+    """
+    conn = cur.connection
+    prepared = getattr(conn, "prepared", None)
+    if not DB_PREPARED_STATEMENTS or prepared is None or not conn.autocommit:
+        cur.execute(_PREPARED_STATEMENTS[name][2], {f"p{i}": value for i, value in enumerate(params, 1)})
+        return
+    if name not in prepared:
+        _prepare(cur, name)
+    execute_sql = f"EXECUTE {name} ({', '.join(['%s'] * len(params))})"
+    try:
+        cur.execute(execute_sql, params)
+    except errors.InvalidSqlStatementName:
+        # Oturumdaki ifadeler sunucu tarafında silinmiş (DISCARD ALL, DEALLOCATE)
+        prepared.clear()
+        _prepare(cur, name)
+        cur.execute(execute_sql, params)
+
+def prepare_statements(conn):
+    """Kayıtlı tüm ifadeleri verilen bağlantıda hazırlar
+
+    Tablo veya kolonlar eksikse PREPARE hata verir; şema doğrulamasında
+    ifadelerin çalıştırılabildiğini denetlemek için de kullanılır.
+
+    Args:
+        conn: autocommit modunda psycopg2 bağlantısı
+
+    Returns:
+        list: Hazırlanan ifade adları
+    """
+    prepared = getattr(conn, "prepared", None)
+    with conn.cursor() as cur:
+        for name in _PREPARED_STATEMENTS:
+            if prepared is None:
+                types, sql, _ = _PREPARED_STATEMENTS[name]
+                cur.execute(f"PREPARE {name} ({', '.join(types)}) AS {sql}")
+            elif name not in prepared:
+                _prepare(cur, name)
+    return list(_PREPARED_STATEMENTS)
+
+def insert_user(firebase_uid, email=None, display_name=None, version=None):
     """Yeni bir kullanıcıyı veritabanına ekler
     
+    Kullanıcı zaten varsa mevcut kayıt değiştirilmeden döndürülür.
+    
     Args:
         firebase_uid (str): Firebase kullanıcı ID'si
         email (str, optional): Kullanıcı e-posta adresi
         display_name (str, optional): Kullanıcı görünen adı
+        version (int, optional): Kaynak olayın sürümü (milisaniye cinsinden zaman damgası)
         
     Returns:
-        dict: Eklenen kullanıcı bilgileri
+        UserRecord: Eklenen (veya zaten mevcut olan) kullanıcı
     """
     try:
-        conn = get_db_connection()
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            # Firebase UID'nin veritabanında olup olmadığını kontrol et
-            cur.execute("SELECT * FROM users WHERE firebase_uid = %s", (firebase_uid,))
-            existing_user = cur.fetchone()
-            
-            if existing_user:
-                logger.info(f"Kullanıcı zaten mevcut: {firebase_uid}")
-                return dict(existing_user)
-            
-            # Yeni kullanıcı ekle
-            cur.execute(
-                """
-                INSERT INTO users (firebase_uid, email, display_name, created_at)
-                VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
-                RETURNING id, firebase_uid, email, display_name, created_at
-                """,
-                (firebase_uid, email, display_name)
-            )
-            new_user = cur.fetchone()
-            logger.info(f"Yeni kullanıcı eklendi: {firebase_uid}")
-            return dict(new_user)
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                with _timed("insert_user"):
+                    _execute(cur, "insert_user", (firebase_uid, email, display_name, version))
+                    row = cur.fetchone()
+                if row is None:
+                    # Eşzamanlı bir ekleme bu ifadenin görüntüsünden sonra commit edildi
+                    with _timed("select_user_by_uid"):
+                        _execute(cur, "select_user_by_uid", (firebase_uid,))
+                        existing_user = cur.fetchone()
+                    logger.info("Kullanıcı zaten mevcut: %s", firebase_uid)
+                    return UserRecord(*existing_user) if existing_user else None
+
+                pin_primary(firebase_uid)
+                # Son kolon inserted bayrağıdır
+                if row[-1]:
+                    logger.info("Yeni kullanıcı eklendi: %s", firebase_uid)
+                else:
+                    logger.info("Kullanıcı zaten mevcut: %s", firebase_uid)
+                return UserRecord(*row[:-1])
     except Exception as e:
-        logger.error(f"Kullanıcı ekleme hatası: {str(e)}")
+        logger.error("Kullanıcı ekleme hatası: %s", e)
         raise
-    finally:
-        if conn:
-            conn.close()
 
-def update_user(firebase_uid, email=None, display_name=None):
+def replace_user(firebase_uid, email, display_name):
+    """Kullanıcı satırını verilen alanlarla değiştirir, yoksa ekler
+
+    update_user'dan farklı olarak None değerler mevcut alanı korumaz; Firebase'de
+    silinmiş bir görünen ad veritabanında da silinir.
+
+    Args:
+        firebase_uid (str): Firebase kullanıcı ID'si
+        email (str): E-posta adresi
+        display_name (str): Görünen ad
+
+    Returns:
+        UserRecord: Yazılan kullanıcı
+    """
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                with _timed("replace_user"):
+                    _execute(cur, "replace_user", (firebase_uid, email, display_name))
+                    row = cur.fetchone()
+        pin_primary(firebase_uid)
+        logger.info("Kullanıcı eşitlendi: %s", firebase_uid)
+        return UserRecord(*row)
+    except Exception as e:
+        logger.error("Kullanıcı eşitleme hatası: %s", e)
+        raise
+
+def update_user(firebase_uid, email=None, display_name=None, upsert=False, version=None):
     """Kullanıcı bilgilerini günceller
     
+    version verilirse güncelleme yalnızca satırdaki sürümden daha yeniyse
+    uygulanır; sırası bozuk gelen eski bir olay daha yeni veriyi ezemez.
+    
     Args:
         firebase_uid (str): Firebase kullanıcı ID'si
         email (str, optional): Yeni e-posta adresi
         display_name (str, optional): Yeni görünen ad
+        upsert (bool, optional): True ise kullanıcı yoksa eklenir
+        version (int, optional): Kaynak olayın sürümü (milisaniye cinsinden zaman damgası)
         
     Returns:
-        dict: Güncellenen kullanıcı bilgileri
+        UserRecord: Güncellenen kullanıcı; kullanıcı bulunamazsa veya olay
+            eskiyse None
     """
     try:
-        conn = get_db_connection()
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            # Kullanıcıyı güncelle
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                if upsert:
+                    with _timed("upsert_user"):
+                        _execute(cur, "upsert_user", (firebase_uid, email, display_name, version))
+                        row = cur.fetchone()
+                    if row is None:
+                        logger.info("Eski güncelleme atlandı: %s (sürüm %s)", firebase_uid, version)
+                        return None
+                    pin_primary(firebase_uid)
+                    logger.info("Kullanıcı güncellendi: %s", firebase_uid)
+                    return UserRecord(*row)
+
+                # Kullanıcıyı güncelle
+                with _timed("update_user"):
+                    _execute(cur, "update_user", (firebase_uid, email, display_name, version))
+                    updated_user = cur.fetchone()
+            
+                if updated_user:
+                    pin_primary(firebase_uid)
+                    logger.info("Kullanıcı güncellendi: %s", firebase_uid)
+                    return UserRecord(*updated_user)
+                else:
+                    logger.warning("Güncellenecek kullanıcı bulunamadı veya olay eski: %s", firebase_uid)
+                    return None
+    except Exception as e:
+        logger.error("Kullanıcı güncelleme hatası: %s", e)
+        raise
+
+@_read_retry.wrap("get_user_details_by_email")
+def get_user_details_by_email(email, max_age=USER_PROFILE_MAX_AGE):
+    """E-posta adresine göre kullanıcıyı ve kayıtlı profil alanlarını getirir
+
+    E-posta büyük/küçük harf duyarsız karşılaştırılır. Sonuç önbelleğe
+    alındığı için replika yerine primary'den okunur.
+
+    Args:
+        email (str): Kullanıcı e-posta adresi
+        max_age (float, optional): Profil alanlarının geçerli sayılacağı en uzun süre (saniye)
+
+    Returns:
+        tuple: (UserRecord, profil) ikilisi; profil phone_number, photo_url ve
+            disabled içeren sözlük veya kayıtlı değilse None. Kullanıcı
+            bulunamazsa (None, None)
+    """
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                with _timed("select_user_details_by_email"):
+                    _execute(cur, "select_user_details_by_email", (email, max_age))
+                    row = cur.fetchone()
+        if not row:
+            return None, None
+        user = UserRecord(*row[:6])
+        phone_number, photo_url, disabled = row[6:]
+        if disabled is None:
+            return user, None
+        return user, {"phone_number": phone_number, "photo_url": photo_url, "disabled": disabled}
+    except Exception as e:
+        logger.error("Kullanıcı getirme hatası: %s", e)
+        raise
+
+def save_user_profile(user, phone_number, photo_url, disabled):
+    """Firebase'den okunan profil alanlarını users satırının mevcut sürümüyle kaydeder
+
+    Kayıt satırın okunduğu sürüme (COALESCE(updated_at, created_at)) bağlanır;
+    satır bu arada güncellendiyse kayıt eşleşmez ve bir sonraki sorgu yeniden
+    Firebase'e gider. Satır silindiyse yabancı anahtar nedeniyle hata fırlatılır.
+
+    Args:
+        user (UserRecord): get_user_details_by_email'in döndürdüğü satır
+        phone_number (str): Telefon numarası
+        photo_url (str): Fotoğraf adresi
+        disabled (bool): Hesabın devre dışı olup olmadığı
+
+    Returns:
+        bool: Sürümü olmayan satırlar için False
+    """
+    user_version = user.updated_at or user.created_at
+    if user_version is None:
+        return False
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            with _timed("upsert_user_profile"):
+                cur.execute(
+                    """
+                    INSERT INTO user_profiles (firebase_uid, phone_number, photo_url, disabled, user_version)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (firebase_uid) DO UPDATE SET
+                        phone_number = EXCLUDED.phone_number,
+                        photo_url = EXCLUDED.photo_url,
+                        disabled = EXCLUDED.disabled,
+                        user_version = EXCLUDED.user_version,
+                        synced_at = now()
+                    """,
+                    (user.firebase_uid, phone_number, photo_url, disabled, user_version)
+                )
+    return True
+
+@_read_retry.wrap("find_existing_users")
+def find_existing_users(uids, emails):
+    """Verilen uid ve e-posta adreslerinden users tablosunda kayıtlı olanları döndürür
+
+    E-postalar büyük/küçük harf duyarsız karşılaştırılır.
+
+    Args:
+        uids (list): Firebase kullanıcı kimlikleri
+        emails (list): E-posta adresleri
+
+    Returns:
+        tuple: (kayıtlı uid'ler, küçük harfe çevrilmiş kayıtlı e-postalar) kümeleri
+    """
+    uids = list(uids)
+    emails = [email.lower() for email in emails]
+    if not uids and not emails:
+        return set(), set()
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                with _timed("select_existing_users"):
+                    cur.execute(
+                        """
+                        SELECT firebase_uid, lower(email) FROM users
+                        WHERE firebase_uid = ANY(%s) OR lower(email) = ANY(%s)
+                        """,
+                        (uids, emails)
+                    )
+                    rows = cur.fetchall()
+        requested_uids = set(uids)
+        requested_emails = set(emails)
+        return (
+            {uid for uid, _ in rows if uid in requested_uids},
+            {email for _, email in rows if email in requested_emails},
+        )
+    except Exception as e:
+        logger.error("Kullanıcı kontrol hatası: %s", e)
+        raise
+
+def _list_users_query(after_id=None, updated_since=None):
+    """Keyset sayfalama sorgusunu ve parametrelerini oluşturur (id sırasıyla)"""
+    conditions = []
+    params = []
+    if after_id is not None:
+        conditions.append("id > %s")
+        params.append(after_id)
+    if updated_since is not None:
+        conditions.append("COALESCE(updated_at, created_at) >= %s")
+        params.append(updated_since)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return f"SELECT {_USER_COLUMNS} FROM users {where} ORDER BY id", params
+
+@_read_retry.wrap("list_users")
+def list_users(after_id=None, limit=100, updated_since=None):
+    """Kullanıcıları id sırasıyla, keyset sayfalama ile listeler
+
+    OFFSET kullanılmaz; her sayfa önceki sayfanın son id'sinden devam eder ve
+    birincil anahtar indeksiyle sabit maliyette okunur.
+
+    Args:
+        after_id (int, optional): Bu id'den sonraki kullanıcılar döner
+        limit (int, optional): Sayfa boyutu
+        updated_since (datetime, optional): Yalnızca bu zamandan sonra
+            oluşturulan veya güncellenen kullanıcılar
+
+    Returns:
+        list: UserRecord listesi
+    """
+    query, params = _list_users_query(after_id, updated_since)
+    try:
+        with get_read_connection() as conn:
+            with conn.cursor() as cur:
+                with _timed("list_users"):
+                    cur.execute(query + " LIMIT %s", params + [limit])
+                    return _user_records(cur.fetchall())
+    except Exception as e:
+        logger.error("Kullanıcı listeleme hatası: %s", e)
+        raise
+
+def iter_user_batches(after_id=None, updated_since=None, batch_size=1000):
+    """Kullanıcıları sunucu taraflı (isimli) cursor ile parça parça döndüren generator
+
+    Tüm sonuç belleğe alınmaz; her adımda veritabanından en fazla batch_size
+    satır çekilir. Generator tüketildiğinde veya kapatıldığında (close)
+    transaction geri alınır ve bağlantı havuza iade edilir. Bağlantı akış
+    süresince tutulduğu için uzun dışa aktarımlar havuzdan bir bağlantı kullanır.
+
+    Args:
+        after_id (int, optional): Bu id'den sonraki kullanıcılar döner
+        updated_since (datetime, optional): Yalnızca bu zamandan sonra
+            oluşturulan veya güncellenen kullanıcılar
+        batch_size (int, optional): Bir seferde çekilecek satır sayısı
+
+    Yields:
+        list: En fazla batch_size UserRecord
+    """
+    query, params = _list_users_query(after_id, updated_since)
+    with get_read_connection() as conn:
+        # İsimli cursor'lar yalnızca transaction içinde çalışır
+        conn.autocommit = False
+        try:
+            with conn.cursor(name="users_export") as cur:
+                cur.itersize = batch_size
+                cur.execute(query, params)
+                while True:
+                    with _timed("fetch_users_batch"):
+                        rows = cur.fetchmany(batch_size)
+                    if not rows:
+                        return
+                    yield _user_records(rows)
+        finally:
+            conn.rollback()
+
+def _dedupe_users(users):
+    """Aynı uid'ye ait kayıtları sırayla birleştirir (sonraki dolu alan kazanır)
+
+    ON CONFLICT DO UPDATE aynı satıra tek ifadede iki kez dokunamaz. Sürüm
+    alanı (version) varsa en büyük sürüm korunur.
+    """
+    merged = {}
+    for user in users:
+        uid = user.get("firebase_uid") or user.get("uid")
+        previous = merged.get(uid)
+        email = user.get("email")
+        display_name = user.get("display_name")
+        version = user.get("version")
+        if previous is not None:
+            email = email if email is not None else previous[1]
+            display_name = display_name if display_name is not None else previous[2]
+            if previous[3] is not None and (version is None or previous[3] > version):
+                version = previous[3]
+        merged[uid] = (uid, email, display_name, version)
+    return list(merged.values())
+
+def _upsert_rows(cur, rows):
+    with _timed("upsert_users"):
+        return execute_values(
+            cur, _UPSERT_USER_SQL, rows,
+            template=_UPSERT_USER_TEMPLATE,
+            page_size=max(len(rows), 1),
+            fetch=True
+        )
+
+def upsert_users(users):
+    """Birden fazla kullanıcıyı tek bir INSERT ... ON CONFLICT ifadesiyle ekler/günceller
+    
+    Args:
+        users (list): firebase_uid (veya uid), email ve display_name içeren sözlükler
+        
+    Returns:
+        list: Eklenen veya güncellenen kullanıcılar (UserRecord)
+    """
+    rows = _dedupe_users(users)
+    if not rows:
+        return []
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                result = _user_records(_upsert_rows(cur, rows))
+                pin_primary(*(row[0] for row in rows))
+                logger.info("%s kullanıcı toplu olarak eklendi/güncellendi", len(result))
+                return result
+    except Exception as e:
+        logger.error("Toplu kullanıcı ekleme hatası: %s", e)
+        raise
+
+def insert_imported_users(users):
+    """Toplu aktarılan kullanıcıları ekler; aynı uid'ye sahip mevcut satırlara dokunmaz
+
+    Args:
+        users (list): uid, email ve display_name içeren sözlükler
+
+    Returns:
+        set: Eklenen uid'ler; eksik olanlar tabloda zaten vardı
+    """
+    rows = [(user["uid"], user.get("email"), user.get("display_name"), None) for user in users]
+    if not rows:
+        return set()
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                with _timed("insert_imported_users"):
+                    inserted = execute_values(
+                        cur,
+                        """
+                        INSERT INTO users (firebase_uid, email, display_name, source_version, created_at)
+                        VALUES %s
+                        ON CONFLICT (firebase_uid) DO NOTHING
+                        RETURNING firebase_uid
+                        """,
+                        rows,
+                        template=_UPSERT_USER_TEMPLATE,
+                        page_size=len(rows),
+                        fetch=True
+                    )
+                pin_primary(*(row[0] for row in rows))
+                logger.info("%s kullanıcı toplu olarak eklendi", len(inserted))
+                return {row[0] for row in inserted}
+    except Exception as e:
+        logger.error("Toplu kullanıcı ekleme hatası: %s", e)
+        raise
+
+def write_user_changes(cur, inserts=(), upserts=(), replaces=(), deletes=()):
+    """Önceden birleştirilmiş kullanıcı değişikliklerini verilen cursor üzerinde yazar
+
+    Her uid listelerden yalnızca birinde bulunmalıdır; transaction yönetimi
+    çağırana aittir.
+
+    Args:
+        cur: Açık cursor
+        inserts (list): (uid, email, display_name, version) - yoksa ekle, varsa dokunma
+        upserts (list): (uid, email, display_name, version) - yoksa ekle, varsa dolu alanları güncelle
+        replaces (list): (uid, email, display_name, version) - satırı tamamen bu değerlerle yaz
+        deletes (list): (uid, version) çiftleri
+
+    Sürümlü değişiklikler satırda daha yeni bir sürüm varsa uygulanmaz.
+
+    Returns:
+        int: Etkilenen satır sayısı
+    """
+    pin_primary(*(change[0] for changes in (inserts, upserts, replaces, deletes) for change in changes))
+    affected = 0
+    if inserts:
+        with _timed("insert_users"):
+            execute_values(
+                cur,
+                """
+                INSERT INTO users (firebase_uid, email, display_name, source_version, created_at)
+                VALUES %s
+                ON CONFLICT (firebase_uid) DO NOTHING
+                """,
+                list(inserts),
+                template=_UPSERT_USER_TEMPLATE,
+                page_size=len(inserts)
+            )
+        affected += cur.rowcount
+    if upserts:
+        affected += len(_upsert_rows(cur, list(upserts)))
+    if replaces:
+        with _timed("replace_users"):
+            execute_values(
+                cur,
+                """
+                INSERT INTO users (firebase_uid, email, display_name, source_version, created_at)
+                VALUES %s
+                ON CONFLICT (firebase_uid) DO UPDATE
+                SET email = EXCLUDED.email,
+                    display_name = EXCLUDED.display_name,
+                    source_version = EXCLUDED.source_version,
+                    created_at = EXCLUDED.created_at,
+                    updated_at = NULL
+                WHERE EXCLUDED.source_version IS NULL
+                   OR users.source_version IS NULL
+                   OR users.source_version < EXCLUDED.source_version
+                """,
+                list(replaces),
+                template=_UPSERT_USER_TEMPLATE,
+                page_size=len(replaces)
+            )
+        affected += cur.rowcount
+    if deletes:
+        affected += len(_delete_rows(cur, deletes))
+    return affected
+
+def _delete_rows(cur, deletes):
+    """(uid, version) çiftlerini siler; daha yeni sürümlü satırlara dokunmaz
+
+    Cursor RealDictCursor olmalıdır. Silinen uid'lerin kümesini döndürür.
+    """
+    uids = [uid for uid, _ in deletes]
+    versions = [version for _, version in deletes]
+    with _timed("delete_users"):
+        cur.execute(
+            """
+            DELETE FROM users u
+            USING unnest(%s::text[], %s::bigint[]) AS d(firebase_uid, version)
+            WHERE u.firebase_uid = d.firebase_uid
+              AND (d.version IS NULL OR u.source_version IS NULL OR u.source_version <= d.version)
+            RETURNING u.firebase_uid
+            """,
+            (uids, versions)
+        )
+        return {row["firebase_uid"] for row in cur.fetchall()}
+
+def prune_processed_events(limit=10000):
+    """Saklama süresi dolmuş işlenmiş olay kayıtlarından en fazla limit kadarını siler
+
+    Webhook isteklerinin transaction'ından ayrı, kendi kısa transaction'ında
+    çalışır; arka plan thread'inden çağrılır (write_repair).
+
+    Returns:
+        int: Silinen kayıt sayısı
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur, _timed("prune_processed_events"):
             cur.execute(
                 """
-                UPDATE users
-                SET email = COALESCE(%s, email), 
-                    display_name = COALESCE(%s, display_name),
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE firebase_uid = %s
-                RETURNING id, firebase_uid, email, display_name, updated_at
+                DELETE FROM processed_events WHERE event_id IN (
+                    SELECT event_id FROM processed_events
+                    WHERE processed_at < now() - make_interval(secs => %s)
+                    LIMIT %s
+                )
                 """,
-                (email, display_name, firebase_uid)
+                (WEBHOOK_DEDUPE_RETENTION_DAYS * 86400, limit)
             )
-            updated_user = cur.fetchone()
-            
-            if updated_user:
-                logger.info(f"Kullanıcı güncellendi: {firebase_uid}")
-                return dict(updated_user)
-            else:
-                logger.warning(f"Güncellenecek kullanıcı bulunamadı: {firebase_uid}")
-                return None
-    except Exception as e:
-        logger.error(f"Kullanıcı güncelleme hatası: {str(e)}")
-        raise
-    finally:
-        if conn:
-            conn.close()
+            return cur.rowcount
+
+def claim_events(cur, events):
+    """event_id taşıyan olayları processed_events tablosuna kaydeder
+
+    Kayıt, olayın uygulandığı transaction içinde yapılmalıdır; transaction geri
+    alınırsa olay da işlenmemiş sayılır ve tekrar teslimde yeniden uygulanır.
+
+    Args:
+        cur: Açık RealDictCursor
+        events (list): event_id, event_type, user_data ve version içeren sözlükler
+
+    Returns:
+        set: Daha önce işlenmiş (veya listede tekrar eden) olayların indeksleri
+    """
+    first = {}
+    duplicates = set()
+    for index, event in enumerate(events):
+        event_id = event.get("event_id")
+        if not event_id:
+            continue
+        if event_id in first:
+            duplicates.add(index)
+        else:
+            first[event_id] = index
+    if not first:
+        return duplicates
+    with _timed("claim_events"):
+        rows = execute_values(
+            cur,
+            """
+            INSERT INTO processed_events (event_id, firebase_uid, event_type, version)
+            VALUES %s
+            ON CONFLICT (event_id) DO NOTHING
+            RETURNING event_id
+            """,
+            [
+                (event_id, events[i]["user_data"]["uid"], events[i]["event_type"], events[i].get("version"))
+                for event_id, i in first.items()
+            ],
+            page_size=len(first),
+            fetch=True
+        )
+    claimed = {row["event_id"] for row in rows}
+    duplicates.update(i for event_id, i in first.items() if event_id not in claimed)
+    return duplicates
 
-def delete_user(firebase_uid):
+def tombstone_versions(cur, uids):
+    """Verilen kullanıcılar için kayıtlı en yeni silme olayının sürümünü döndürür
+
+    Cursor RealDictCursor olmalıdır.
+
+    Returns:
+        dict: uid -> silme sürümü
+    """
+    if not uids:
+        return {}
+    with _timed("select_tombstones"):
+        cur.execute(
+            """
+            SELECT firebase_uid, MAX(version) AS version FROM processed_events
+            WHERE event_type = 'delete' AND version IS NOT NULL AND firebase_uid = ANY(%s)
+            GROUP BY firebase_uid
+            """,
+            (list(uids),)
+        )
+        rows = cur.fetchall()
+    return {row["firebase_uid"]: row["version"] for row in rows}
+
+def delete_user(firebase_uid, version=None):
     """Kullanıcıyı veritabanından siler
     
     Args:
         firebase_uid (str): Firebase kullanıcı ID'si
+        version (int, optional): Kaynak olayın sürümü; satır daha yeniyse silinmez
         
     Returns:
         bool: İşlem başarılı ise True
     """
     try:
-        conn = get_db_connection()
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                with _timed("delete_user"):
+                    _execute(cur, "delete_user", (firebase_uid, version))
+                if cur.rowcount > 0:
+                    pin_primary(firebase_uid)
+                    logger.info("Kullanıcı silindi: %s", firebase_uid)
+                    return True
+                else:
+                    logger.warning("Silinecek kullanıcı bulunamadı: %s", firebase_uid)
+                    return False
+    except Exception as e:
+        logger.error("Kullanıcı silme hatası: %s", e)
+        raise
+
+def record_write_intent(op, firebase_uid):
+    """Firebase ile birlikte yapılacak bir kullanıcı yazımının niyetini kaydeder
+
+    Kayıt autocommit ile hemen kalıcı olur; Firebase yazımı tamamlanınca
+    apply_user_write'ın transaction'ında silinir. Silinmeden kalan
+    kayıtlar DUAL_WRITE_REPAIR_DELAY saniye sonra write_repair tarafından ele alınır.
+
+    Args:
+        op (str): "create", "update" veya "delete"
+        firebase_uid (str): Firebase kullanıcı ID'si
+
+    Returns:
+        int: Niyet kaydının ID'si
+    """
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                with _timed("insert_write_intent"):
+                    _execute(cur, "insert_write_intent", (op, firebase_uid, DUAL_WRITE_REPAIR_DELAY))
+                    return cur.fetchone()[0]
+    except Exception as e:
+        logger.error("Yazım niyeti kaydedilemedi (%s %s): %s", op, firebase_uid, e)
+        raise
+
+def clear_write_intent(intent_id):
+    """Niyet kaydını siler (Firebase yazımı reddettiğinde veya onarım bittiğinde)"""
+    with get_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("DELETE FROM users WHERE firebase_uid = %s", (firebase_uid,))
-            if cur.rowcount > 0:
-                logger.info(f"Kullanıcı silindi: {firebase_uid}")
-                return True
-            else:
-                logger.warning(f"Silinecek kullanıcı bulunamadı: {firebase_uid}")
-                return False
+            cur.execute("DELETE FROM dual_write_intents WHERE id = %s", (intent_id,))
+
+def _apply_user_write(cur, op, firebase_uid, email, display_name):
+    if op == "create":
+        with _timed("insert_user"):
+            _execute(cur, "insert_user", (firebase_uid, email, display_name, None))
+            row = cur.fetchone()
+        return UserRecord(*row[:-1]) if row else None
+    if op == "update":
+        with _timed("update_user"):
+            _execute(cur, "update_user", (firebase_uid, email, display_name, None))
+            row = cur.fetchone()
+        return UserRecord(*row) if row else None
+    if op == "delete":
+        with _timed("delete_user"):
+            _execute(cur, "delete_user", (firebase_uid, None))
+        return cur.rowcount > 0
+    raise ValueError(f"Bilinmeyen yazım türü: {op}")
+
+def apply_user_write(intent_id, op, firebase_uid, email=None, display_name=None):
+    """Firebase'de tamamlanan bir kullanıcı yazımını kısa bir transaction'da uygular
+
+    Niyet kaydı aynı transaction'da silinir; böylece yazım ve kaydın silinmesi
+    birlikte kalıcı olur. Kayıt yazılamamışsa (intent_id None) yalnızca
+    kullanıcı yazımı uygulanır. Kayıt onarıcı tarafından alınmışsa (attempts > 0)
+    yazım uygulanmaz, karar onarıcıya bırakılır; aksi halde onarıcının
+    telafisinden sonra eski bir yazım tabloya düşebilirdi. Transaction
+    yalnızca veritabanı ifadeleri boyunca açık kalır.
+
+    Args:
+        intent_id (int): record_write_intent'in döndürdüğü ID veya None
+        op (str): "create", "update" veya "delete"
+        firebase_uid (str): Firebase kullanıcı ID'si
+        email (str, optional): E-posta adresi
+        display_name (str, optional): Görünen ad
+
+    Returns:
+        create/update için UserRecord veya None, delete için bool
+
+    Raises:
+        WriteIntentClaimedError: Niyet kaydı onarıcıya geçmişse
+    """
+    try:
+        with get_connection() as conn:
+            conn.autocommit = False
+            try:
+                with conn.cursor() as cur:
+                    if intent_id is not None:
+                        cur.execute("DELETE FROM dual_write_intents WHERE id = %s AND attempts = 0", (intent_id,))
+                        if cur.rowcount == 0:
+                            raise WriteIntentClaimedError(intent_id)
+                    result = _apply_user_write(cur, op, firebase_uid, email, display_name)
+                with _timed("commit_user_write"):
+                    conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        pin_primary(firebase_uid)
+        return result
     except Exception as e:
-        logger.error(f"Kullanıcı silme hatası: {str(e)}")
+        logger.error("Kullanıcı yazımı uygulanamadı (%s %s): %s", op, firebase_uid, e)
         raise
-    finally:
-        if conn:
-            conn.close() 
\ No newline at end of file
+
+# Tekrar eden ve eski olaylar users tablosuna dokunulmadan başarılı sayılır
+DUPLICATE_EVENT_RESULT = {"status": "success", "message": "Olay daha önce işlendi", "skipped": "duplicate"}
+STALE_EVENT_RESULT = {"status": "success", "message": "Eski olay atlandı", "skipped": "stale"}
+
+def _validate_events(events, results):
+    """Geçersiz olayların sonucunu results listesine yazar"""
+    for index, event in enumerate(events):
+        if event.get("event_type") not in _BATCH_HANDLERS:
+            results[index] = {"status": "error", "message": "Bilinmeyen olay tipi"}
+        elif not (event.get("user_data") or {}).get("uid"):
+            results[index] = {"status": "error", "message": "Kullanıcı uid'si eksik"}
+
+def _suppress_tombstoned(cur, events, results):
+    """Kayıtlı bir silme olayından eski create/update olaylarını atlanmış sayar
+
+    Aynı istekteki silme olayları henüz uygulanmadığından yalnızca daha önce
+    işlenmiş silmeler dikkate alınır; istek içi sıra segmentlerle korunur.
+    """
+    candidates = [
+        index for index, event in enumerate(events)
+        if results[index] is None and event.get("event_type") != "delete" and event.get("version") is not None
+    ]
+    if not candidates:
+        return
+    tombstones = tombstone_versions(cur, {events[i]["user_data"]["uid"] for i in candidates})
+    for index in candidates:
+        deleted_at = tombstones.get(events[index]["user_data"]["uid"])
+        if deleted_at is not None and events[index]["version"] <= deleted_at:
+            results[index] = dict(STALE_EVENT_RESULT)
+
+def _segment_events(events, results):
+    """Sonucu henüz belirlenmemiş olayları sırayı bozmadan, aynı tipte ve aynı uid'yi tekrar etmeyen gruplara böler"""
+    segments = []
+    current_type = None
+    current = []
+    seen_uids = set()
+    for index, event in enumerate(events):
+        if results[index] is not None:
+            continue
+        event_type = event["event_type"]
+        user_data = event["user_data"]
+        uid = user_data["uid"]
+        if event_type != current_type or uid in seen_uids:
+            if current:
+                segments.append((current_type, current))
+            current_type = event_type
+            current = []
+            seen_uids = set()
+        current.append((index, user_data, event.get("version")))
+        seen_uids.add(uid)
+    if current:
+        segments.append((current_type, current))
+    return segments
+
+def _batch_insert(cur, items, results):
+    with _timed("insert_users"):
+        rows = execute_values(
+            cur,
+            """
+            INSERT INTO users (firebase_uid, email, display_name, source_version, created_at)
+            VALUES %s
+            ON CONFLICT (firebase_uid) DO NOTHING
+            RETURNING id, firebase_uid, email, display_name, created_at, updated_at
+            """,
+            [(d.get("uid"), d.get("email"), d.get("display_name"), v) for _, d, v in items],
+            template=_UPSERT_USER_TEMPLATE,
+            page_size=len(items),
+            fetch=True
+        )
+    users = {row["firebase_uid"]: UserRecord(**row) for row in rows}
+    existing = [d.get("uid") for _, d, _ in items if d.get("uid") not in users]
+    if existing:
+        with _timed("select_users_by_uid"):
+            cur.execute(f"SELECT {_USER_COLUMNS} FROM users WHERE firebase_uid = ANY(%s)", (existing,))
+        for row in cur.fetchall():
+            users[row["firebase_uid"]] = UserRecord(**row)
+    for index, d, _ in items:
+        results[index] = {"status": "success", "message": "Kullanıcı eklendi", "user": users.get(d.get("uid"))}
+
+def _batch_update(cur, items, results):
+    rows = _upsert_rows(cur, [(d.get("uid"), d.get("email"), d.get("display_name"), v) for _, d, v in items])
+    users = {row["firebase_uid"]: UserRecord(**row) for row in rows}
+    for index, d, _ in items:
+        user = users.get(d.get("uid"))
+        if user is None:
+            # Satırda daha yeni bir sürüm var
+            results[index] = dict(STALE_EVENT_RESULT)
+        else:
+            results[index] = {"status": "success", "message": "Kullanıcı güncellendi", "user": user}
+
+def _batch_delete(cur, items, results):
+    deleted = _delete_rows(cur, [(d.get("uid"), v) for _, d, v in items])
+    for index, d, _ in items:
+        results[index] = {"status": "success", "message": "Kullanıcı silindi", "result": d.get("uid") in deleted}
+
+_BATCH_HANDLERS = {
+    "create": _batch_insert,
+    "update": _batch_update,
+    "delete": _batch_delete,
+}
+
+def apply_user_events(events):
+    """Birden fazla auth olayını tek bir transaction içinde uygular
+
+    Olaylar gelen sırayla işlenir; ardışık aynı tipteki olaylar tek bir
+    çok satırlı ifadeyle yazılır. event_id'si daha önce işlenmiş olaylar ve
+    sürümü satırdakinden (veya kayıtlı bir silmeden) eski olaylar users
+    tablosuna dokunmadan başarılı sayılır. Transaction başarısız olursa hiçbir
+    olay uygulanmaz ve hata yukarı fırlatılır.
+
+    Args:
+        events (list): {"event_type": str, "user_data": dict, "event_id": str,
+            "version": int} sözlükleri; event_id ve version isteğe bağlıdır
+
+    Returns:
+        list: Her olay için, olaylarla aynı sırada işlem sonucu
+    """
+    results = [None] * len(events)
+    _validate_events(events, results)
+    if all(result is not None for result in results):
+        return results
+    try:
+        with get_connection() as conn:
+            conn.autocommit = False
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    valid = [i for i, result in enumerate(results) if result is None]
+                    for index in claim_events(cur, [events[i] for i in valid]):
+                        results[valid[index]] = dict(DUPLICATE_EVENT_RESULT)
+                    _suppress_tombstoned(cur, events, results)
+                    segments = _segment_events(events, results)
+                    for event_type, items in segments:
+                        _BATCH_HANDLERS[event_type](cur, items, results)
+                conn.commit()
+                pin_primary(*((events[index].get("user_data") or {}).get("uid") for index in valid))
+            except Exception:
+                conn.rollback()
+                raise
+        logger.info("%s olay %s adımda uygulandı", len(events), len(segments))
+        return results
+    except Exception as e:
+        logger.error("Toplu olay uygulama hatası: %s", e)
+        raise
+
+# Event loop'u bloklamamak için async sarmalayıcılar
+async def insert_user_async(firebase_uid, email=None, display_name=None, version=None):
+    """insert_user'ı veritabanı thread havuzunda çalıştırır"""
+    return await run_db(insert_user, firebase_uid, email=email, display_name=display_name, version=version)
+
+async def update_user_async(firebase_uid, email=None, display_name=None, upsert=False, version=None):
+    """update_user'ı veritabanı thread havuzunda çalıştırır"""
+    return await run_db(update_user, firebase_uid, email=email, display_name=display_name, upsert=upsert, version=version)
+
+async def find_existing_users_async(uids, emails):
+    """find_existing_users'ı veritabanı thread havuzunda çalıştırır"""
+    return await run_db(find_existing_users, uids, emails)
+
+async def insert_imported_users_async(users):
+    """insert_imported_users'ı veritabanı thread havuzunda çalıştırır"""
+    return await run_db(insert_imported_users, users)
+
+async def get_user_details_by_email_async(email):
+    """get_user_details_by_email'i veritabanı thread havuzunda çalıştırır"""
+    return await run_db(get_user_details_by_email, email)
+
+async def save_user_profile_async(user, phone_number, photo_url, disabled):
+    """save_user_profile'ı veritabanı thread havuzunda çalıştırır"""
+    return await run_db(save_user_profile, user, phone_number, photo_url, disabled)
+
+async def delete_user_async(firebase_uid, version=None):
+    """delete_user'ı veritabanı thread havuzunda çalıştırır"""
+    return await run_db(delete_user, firebase_uid, version=version)
@@ -0,0 +1,100 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from admission import downstream_slot
+from config import DB_EXECUTOR_MAX_WORKERS, FIREBASE_EXECUTOR_MAX_WORKERS, CPU_EXECUTOR_MAX_WORKERS
+from metrics import EXECUTOR_IN_FLIGHT
+
+# Bloklayan psycopg2 ve Firebase Admin çağrıları event loop'u dondurmasın diye
+# her bağımlılık için ayrı, sınırlı bir thread havuzunda çalıştırılır. Yavaş bir
+# Firebase çağrısı veritabanı thread'lerini, yavaş bir sorgu da Firebase
+# thread'lerini tüketemez; fazla istekler kuyrukta bekler. CPU yoğun işler
+# (hashlib GIL'i bırakır) çekirdek sayısıyla sınırlı ayrı bir havuzda çalışır.
+_EXECUTOR_SIZES = {
+    "db": DB_EXECUTOR_MAX_WORKERS,
+    "firebase": FIREBASE_EXECUTOR_MAX_WORKERS,
+    "cpu": CPU_EXECUTOR_MAX_WORKERS,
+}
+
+_executors = {}
+_executors_pid = None
+_executors_lock = threading.Lock()
+
+def get_executor(name):
+    """Verilen bağımlılık için bu sürece ait thread havuzunu döndürür"""
+    global _executors, _executors_pid
+    pid = os.getpid()
+    if _executors_pid != pid:
+        with _executors_lock:
+            if _executors_pid != pid:
+                # Fork sonrası ebeveynin thread'leri çocuğa geçmez
+                _executors = {}
+                _executors_pid = pid
+    executor = _executors.get(name)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                executor = ThreadPoolExecutor(
+                    max_workers=_EXECUTOR_SIZES[name],
+                    thread_name_prefix=f"{name}-worker"
+                )
+                _executors[name] = executor
+    return executor
+
+async def run_blocking(name, func, *args, **kwargs):
+    """Bloklayan bir fonksiyonu ilgili thread havuzunda çalıştırıp sonucunu bekler
+
+    Çağrı önce bağımlılığın eşzamanlılık sınırından geçer (admission); istek
+    içinde sınır ve bekleme kuyruğu doluysa Overloaded fırlatılır.
+
+    Args:
+        name (str): Thread havuzu adı ("db" veya "firebase")
+        func (callable): Çalıştırılacak fonksiyon
+
+    Returns:
+        Fonksiyonun dönüş değeri
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, func, *args, **kwargs)
+    async with downstream_slot(name):
+        EXECUTOR_IN_FLIGHT.inc(executor=name)
+        try:
+            return await loop.run_in_executor(get_executor(name), call)
+        finally:
+            EXECUTOR_IN_FLIGHT.dec(executor=name)
+
+async def run_db(func, *args, **kwargs):
+    """Veritabanı çağrısını veritabanı thread havuzunda çalıştırır"""
+    return await run_blocking("db", func, *args, **kwargs)
+
+async def run_firebase(func, *args, **kwargs):
+    """Firebase Admin çağrısını Firebase thread havuzunda çalıştırır"""
+    return await run_blocking("firebase", func, *args, **kwargs)
+
+async def run_cpu(func, *args, **kwargs):
+    """CPU yoğun bir fonksiyonu CPU thread havuzunda çalıştırır
+
+    Bir bağımlılığı beklemediği için giriş kontrolünden geçmez; sınırı havuz
+    boyutudur (CPU_EXECUTOR_MAX_WORKERS), fazla çağrılar havuzun kuyruğunda bekler.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, func, *args, **kwargs)
+    EXECUTOR_IN_FLIGHT.inc(executor="cpu")
+    try:
+        return await loop.run_in_executor(get_executor("cpu"), call)
+    finally:
+        EXECUTOR_IN_FLIGHT.dec(executor="cpu")
+
+def shutdown_executors(wait=True):
+    """Süreç kapanırken thread havuzlarını kapatır"""
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=wait)
@@ -1,44 +1,350 @@
 import firebase_admin
 from firebase_admin import credentials, auth
+from firebase_admin import exceptions as firebase_exceptions
 import os
 import json
+import time
+import threading
+import hashlib
+import asyncio
+import contextvars
+import uuid
 import logging
-from config import FIREBASE_CREDENTIALS_PATH
-from database import insert_user, update_user, delete_user
-
-# Loglama ayarları
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from config import (
+    FIREBASE_CREDENTIALS_PATH,
+    ensure_firebase_credentials_file,
+    TOKEN_CACHE_ENABLED,
+    TOKEN_CACHE_MAX_SIZE,
+    TOKEN_CACHE_MAX_TTL,
+    TOKEN_CHECK_REVOKED,
+    TOKEN_REVOCATION_CHECK_INTERVAL,
+    USER_CACHE_ENABLED,
+    USER_CACHE_MAX_SIZE,
+    USER_CACHE_TTL,
+    WEBHOOK_DEDUPE_CACHE_SIZE,
+    WEBHOOK_DEDUPE_RETENTION_DAYS,
+    BULK_IMPORT_CHUNK_SIZE,
+    BULK_IMPORT_CONCURRENCY,
+    BULK_IMPORT_HASH_ROUNDS,
+    FIREBASE_HTTP_TIMEOUT,
+    FIREBASE_RETRY_ATTEMPTS,
+)
+from cache import TTLCache, UserLookupCache
+from metrics import REGISTRY, DUAL_WRITES, counter, firebase_timer, gauge
+from database import (
+    insert_user, update_user, replace_user, delete_user,
+    record_write_intent, apply_user_write, clear_write_intent, WriteIntentClaimedError,
+    apply_user_events, DUPLICATE_EVENT_RESULT, STALE_EVENT_RESULT,
+    find_existing_users_async, insert_imported_users_async,
 )
+from database import get_user_details_by_email as db_get_user_details_by_email
+from database import save_user_profile
+from executor import get_executor, run_blocking, run_cpu, run_db, run_firebase
+from resilience import RetryPolicy, circuit_breaker
+
 logger = logging.getLogger(__name__)
 
+# SDK ağ ve sunucu hatalarını bu tiplere çevirir (requests zaman aşımı ->
+# DeadlineExceededError, bağlantı hatası -> UnavailableError). Kullanıcı
+# bulunamadı, geçersiz token gibi yanıtlar servisin sağlıklı olduğunu gösterir.
+_FIREBASE_FAILURES = (
+    firebase_exceptions.UnavailableError,
+    firebase_exceptions.DeadlineExceededError,
+    firebase_exceptions.InternalError,
+    firebase_exceptions.UnknownError,
+    firebase_exceptions.ResourceExhaustedError,
+)
+_FIREBASE_RETRYABLE = (
+    firebase_exceptions.UnavailableError,
+    firebase_exceptions.DeadlineExceededError,
+    firebase_exceptions.InternalError,
+)
+# Tekrarlandığında aynı sonucu veren çağrılar; create_user (uid'siz) ve
+# delete_user (ikinci deneme UserNotFoundError döner) yeniden denenmez.
+# import_users kayıtları uid ile yazdığı için tekrarı aynı durumu üretir.
+_IDEMPOTENT_CALLS = frozenset({
+    "verify_id_token", "get_user", "get_user_by_email", "list_users", "update_user", "import_users",
+})
+
+_firebase_breaker = circuit_breaker("firebase", lambda exc: isinstance(exc, _FIREBASE_FAILURES))
+_firebase_retry = RetryPolicy(
+    "firebase", lambda exc: isinstance(exc, _FIREBASE_RETRYABLE), attempts=FIREBASE_RETRY_ATTEMPTS
+)
+
+def _outcome(func, *args, **kwargs):
+    """Fonksiyonun sonucunu, hata fırlatırsa istisnayı döndürür"""
+    try:
+        return func(*args, **kwargs)
+    except Exception as e:
+        return e
+
+# Aynı akışın sync ve async sürümleri ayrışmasın diye akışlar bir kez,
+# bağımlılık çağrılarını _Call olarak üreten generator'lar halinde yazılır.
+# _run_flow çağrıları bu thread'de, _run_flow_async ise ilgili thread
+# havuzunda (run_blocking) yürütür. Liste halinde üretilen çağrılar eşzamanlı
+# çalışır ve hataları sonuç olarak döner; tek bir çağrının hatası akışa fırlatılır.
+
+class _Call:
+    """Akışın bir bağımlılık çağrısı
+
+    Args:
+        executor (str): Çağrının async yolda çalışacağı thread havuzu ("db" veya "firebase")
+        func (callable): Çalıştırılacak fonksiyon
+    """
+
+    __slots__ = ("executor", "func", "args", "kwargs")
+
+    def __init__(self, executor, func, *args, **kwargs):
+        self.executor = executor
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+    def __call__(self):
+        return self.func(*self.args, **self.kwargs)
+
+def _run_flow(flow):
+    """Akışı çağıran thread'de yürütür
+
+    Eşzamanlı çağrıların sonuncusu bu thread'de, diğerleri kendi thread
+    havuzlarında çalışır.
+    """
+    value = error = None
+    while True:
+        try:
+            step = flow.send(value) if error is None else flow.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        value = error = None
+        if isinstance(step, list):
+            futures = [
+                get_executor(call.executor).submit(contextvars.copy_context().run, _outcome, call)
+                for call in step[:-1]
+            ]
+            last = _outcome(step[-1])
+            value = [future.result() for future in futures] + [last]
+        else:
+            try:
+                value = step()
+            except Exception as e:
+                error = e
+
+async def _run_flow_async(flow):
+    """Akışı event loop'ta yürütür; çağrılar run_blocking ile thread havuzlarında çalışır"""
+    value = error = None
+    while True:
+        try:
+            step = flow.send(value) if error is None else flow.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        value = error = None
+        if isinstance(step, list):
+            value = await asyncio.gather(
+                *(run_blocking(call.executor, call) for call in step), return_exceptions=True
+            )
+        else:
+            try:
+                value = await run_blocking(step.executor, step)
+            except Exception as e:
+                error = e
+
+def _leave_for_repair(op, uid, intent_id):
+    """Yarım kalan yazımı onarıcıya bırakır; niyet kaydı yoksa yenisini yazmaya çalışır"""
+    DUAL_WRITES.inc(op=op, outcome="repair")
+    if intent_id is not None:
+        return
+    try:
+        record_write_intent(op, uid)
+    except Exception as e:
+        logger.error("Yazım niyeti yeniden kaydedilemedi (%s %s): %s", op, uid, e)
+
+def _firebase_user_summary(user):
+    """Firebase UserRecord'dan API yanıtında kullanılan özeti oluşturur"""
+    return {
+        "uid": user.uid,
+        "email": user.email,
+        "display_name": user.display_name
+    }
+
+def _firebase_user_details(user):
+    """Firebase UserRecord'dan e-posta sorgusu yanıtını oluşturur"""
+    return {
+        "uid": user.uid,
+        "email": user.email,
+        "display_name": user.display_name,
+        "phone_number": user.phone_number,
+        "photo_url": user.photo_url,
+        "disabled": user.disabled
+    }
+
+def _db_user_details(db_user, profile):
+    """users satırı ve user_profiles kaydından _firebase_user_details ile aynı yanıtı oluşturur"""
+    return {
+        "uid": db_user.firebase_uid,
+        "email": db_user.email,
+        "display_name": db_user.display_name,
+        **profile
+    }
+
+def _profile_fields(user):
+    return user["phone_number"], user["photo_url"], user["disabled"]
+
+def _import_records(users):
+    """Şifreleri hash'leyip auth.ImportUserRecord listesini oluşturur (CPU thread havuzunda çalışır)
+
+    Returns:
+        tuple: (kaydı oluşturulan kullanıcıların sırası, kayıtlar,
+            (sıra, hata mesajı) listesi, şifre hash'lendi mi)
+    """
+    positions = []
+    records = []
+    errors = []
+    hashed = False
+    for i, user in enumerate(users):
+        kwargs = {}
+        if user.get("password"):
+            salt = os.urandom(16)
+            kwargs["password_hash"] = hashlib.pbkdf2_hmac(
+                "sha256", user["password"].encode("utf-8"), salt, BULK_IMPORT_HASH_ROUNDS
+            )
+            kwargs["password_salt"] = salt
+            hashed = True
+        try:
+            records.append(auth.ImportUserRecord(
+                uid=user["uid"],
+                email=user.get("email"),
+                display_name=user.get("display_name"),
+                **kwargs
+            ))
+        except ValueError as e:
+            errors.append((i, str(e)))
+            continue
+        positions.append(i)
+    return positions, records, errors, hashed
+
+# İstemcisi ayrılan toplu aktarımlarda çalışmaya devam eden parçalar
+# (görevlerin tamamlanmadan çöp toplanmaması için referans tutulur)
+_detached_chunks = set()
+
+# E-posta sorguları için süreç içi önbellek. Bu worker'daki yazma yolları
+# kaydı hemen geçersiz kılar; diğer worker'lardaki değişiklikler en geç
+# USER_CACHE_TTL saniye sonra görülür.
+user_lookup_cache = UserLookupCache(USER_CACHE_MAX_SIZE, USER_CACHE_TTL) if USER_CACHE_ENABLED else None
+
+def invalidate_cached_user(uid=None, email=None):
+    """Kullanıcıya ait önbellek kaydını siler"""
+    if user_lookup_cache is not None:
+        user_lookup_cache.invalidate(uid=uid, email=email)
+
+def _cache_user(email, user):
+    if user_lookup_cache is not None:
+        user_lookup_cache.set(email, user)
+
+def _cached_user(email):
+    if user_lookup_cache is None:
+        return None
+    return user_lookup_cache.get(email)
+
+# Son işlenen webhook olay kimlikleri: aynı worker'a gelen tekrar teslimler
+# veritabanına gitmeden onaylanır. Diğer worker'lar için processed_events tablosu esastır.
+recent_event_ids = TTLCache(WEBHOOK_DEDUPE_CACHE_SIZE, ttl=WEBHOOK_DEDUPE_RETENTION_DAYS * 86400)
+
+def is_recent_event(event_id):
+    """Olay bu süreçte yakın zamanda işlendiyse True döner"""
+    return bool(event_id) and recent_event_ids.get(event_id) is not None
+
+def remember_events(events, results):
+    """Başarıyla işlenen (veya kuyruğa alınan) olayların kimliklerini kaydeder"""
+    for event, result in zip(events, results):
+        event_id = event.get("event_id")
+        if event_id and result and result.get("status") == "success":
+            recent_event_ids.set(event_id, True)
+
+_CACHE_LOOKUPS = counter("cache_lookups_total", "Önbellek isabet/ıska sayıları", ("cache", "result"))
+_CACHE_SIZE = gauge("cache_entries", "Önbellekteki kayıt sayısı", ("cache",))
+
+@REGISTRY.register_collector
+def _collect_cache_metrics():
+    caches = {"user": user_lookup_cache, "webhook_event": recent_event_ids}
+    if FirebaseService._instance is not None:
+        caches["token"] = FirebaseService._instance._token_cache
+    for name, cache in caches.items():
+        if cache is None:
+            continue
+        stats = cache.stats()
+        _CACHE_LOOKUPS.set_total(stats["hits"], cache=name, result="hit")
+        _CACHE_LOOKUPS.set_total(stats["misses"], cache=name, result="miss")
+        _CACHE_SIZE.set(stats["size"], cache=name)
+
 class FirebaseService:
     _instance = None
     
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super(FirebaseService, cls).__new__(cls)
-            cls._instance._initialize()
+            instance = super(FirebaseService, cls).__new__(cls)
+            # SDK import anında değil, ilk ihtiyaçta (veya arka plandaki ısınmada) başlatılır
+            instance.app = None
+            instance._initialized = False
+            instance._init_lock = threading.Lock()
+            # Aynı token'ın imzasını her istekte yeniden doğrulamamak için önbellek
+            instance._token_cache = TTLCache(TOKEN_CACHE_MAX_SIZE) if TOKEN_CACHE_ENABLED else None
+            cls._instance = instance
         return cls._instance
+
+    @property
+    def initialized(self):
+        return self._initialized
+
+    def initialize(self):
+        """Firebase Admin SDK'yi henüz başlatılmadıysa thread-safe olarak başlatır"""
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    self._initialize()
+                    self._initialized = True
+        return self.app
+
+    def _call_firebase(self, call, func, *args, **kwargs):
+        """Firebase Admin çağrısını SDK'nin başlatıldığından emin olarak, devre kesiciden geçirerek ve süresini ölçerek çalıştırır
+
+        Idempotent çağrılar geçici hatalarda jitter'lı bekleme ile yeniden denenir.
+        """
+        if not self._initialized:
+            self.initialize()
+        if call in _IDEMPOTENT_CALLS:
+            return _firebase_retry.call(call, self._attempt_firebase, call, func, *args, **kwargs)
+        return self._attempt_firebase(call, func, *args, **kwargs)
+
+    def _attempt_firebase(self, call, func, *args, **kwargs):
+        with _firebase_breaker.guard(), firebase_timer(call):
+            return func(*args, **kwargs)
     
     def _initialize(self):
         """Firebase Admin SDK'yi başlatır"""
         try:
+            # Ortam değişkeninden gelen credentials içeriğini gerekirse dosyaya yaz
+            ensure_firebase_credentials_file()
+
             # Credentials dosyasının varlığını kontrol et
             if not os.path.exists(FIREBASE_CREDENTIALS_PATH):
                 raise FileNotFoundError(f"Firebase credentials dosyası bulunamadı: {FIREBASE_CREDENTIALS_PATH}")
             
             # Firebase Admin SDK'yi başlat
             cred = credentials.Certificate(FIREBASE_CREDENTIALS_PATH)
-            self.app = firebase_admin.initialize_app(cred)
+            # SDK'nin varsayılan HTTP zaman aşımı yoktur; yavaş bir yanıt thread'i süresiz bekletir
+            self.app = firebase_admin.initialize_app(cred, {"httpTimeout": FIREBASE_HTTP_TIMEOUT})
             logger.info("Firebase Admin SDK başarıyla başlatıldı")
         except Exception as e:
-            logger.error(f"Firebase başlatma hatası: {str(e)}")
+            logger.error("Firebase başlatma hatası: %s", e)
             raise
     
     def verify_id_token(self, id_token):
         """Firebase ID token'ı doğrular
+
+        Doğrulanan token'lar, token'ın SHA-256 özeti anahtar olacak şekilde
+        kendi `exp` zamanına kadar (TOKEN_CACHE_MAX_TTL ile daha kısa tutulabilir)
+        önbellekte saklanır. İptal kontrolü açıksa önbellekteki kayıt en fazla
+        TOKEN_REVOCATION_CHECK_INTERVAL saniye kullanılır.
         
         Args:
             id_token (str): Firebase ID token
@@ -46,12 +352,44 @@ class FirebaseService:
         Returns:
             dict: Doğrulanmış token bilgileri
         """
+        cache_key, cached = self._cached_token(id_token)
+        if cached is not None:
+            return cached
+        return self._verify_and_cache(id_token, cache_key)
+
+    def _verify_and_cache(self, id_token, cache_key):
+        """Token'ı Firebase ile doğrular ve cache_key verilmişse önbelleğe yazar"""
         try:
-            decoded_token = auth.verify_id_token(id_token)
-            return decoded_token
+            decoded_token = self._call_firebase("verify_id_token", auth.verify_id_token, id_token, check_revoked=TOKEN_CHECK_REVOKED)
         except Exception as e:
-            logger.error(f"Token doğrulama hatası: {str(e)}")
+            logger.error("Token doğrulama hatası: %s", e)
             raise
+
+        if cache_key is not None:
+            ttl = decoded_token.get("exp", 0) - time.time()
+            if TOKEN_CACHE_MAX_TTL > 0:
+                ttl = min(ttl, TOKEN_CACHE_MAX_TTL)
+            if TOKEN_CHECK_REVOKED:
+                ttl = min(ttl, TOKEN_REVOCATION_CHECK_INTERVAL)
+            self._token_cache.set(cache_key, decoded_token, ttl=ttl)
+        return decoded_token
+
+    def _cached_token(self, id_token):
+        """Token'ın önbellek anahtarını ve önbellekteki doğrulanmış içeriğini döndürür
+
+        Returns:
+            tuple: (anahtar, içerik); önbellek kapalıysa (None, None), ıskada (anahtar, None)
+        """
+        if self._token_cache is None:
+            return None, None
+        cache_key = hashlib.sha256(id_token.encode("utf-8")).digest()
+        return cache_key, self._token_cache.get(cache_key)
+
+    def token_cache_stats(self):
+        """Token önbelleği istatistiklerini döndürür, önbellek kapalıysa None"""
+        if self._token_cache is None:
+            return None
+        return self._token_cache.stats()
     
     def create_user(self, email, password, display_name=None):
         """Firebase'de yeni kullanıcı oluşturur ve PostgreSQL'e kaydeder
@@ -64,33 +402,7 @@ class FirebaseService:
         Returns:
             dict: Oluşturulan kullanıcı bilgileri
         """
-        try:
-            # Firebase'de kullanıcı oluştur
-            user = auth.create_user(
-                email=email,
-                password=password,
-                display_name=display_name
-            )
-            
-            # PostgreSQL'e kullanıcıyı kaydet
-            db_user = insert_user(
-                firebase_uid=user.uid,
-                email=email,
-                display_name=display_name
-            )
-            
-            logger.info(f"Kullanıcı başarıyla oluşturuldu: {user.uid}")
-            return {
-                "firebase_user": {
-                    "uid": user.uid,
-                    "email": user.email,
-                    "display_name": user.display_name
-                },
-                "db_user": db_user
-            }
-        except Exception as e:
-            logger.error(f"Kullanıcı oluşturma hatası: {str(e)}")
-            raise
+        return _run_flow(self._create_user_flow(email, password, display_name))
     
     def update_user_info(self, uid, email=None, display_name=None):
         """Firebase ve PostgreSQL'de kullanıcı bilgilerini günceller
@@ -103,6 +415,43 @@ class FirebaseService:
         Returns:
             dict: Güncellenen kullanıcı bilgileri
         """
+        return _run_flow(self._update_user_flow(uid, email, display_name))
+    
+    def delete_user_account(self, uid):
+        """Firebase ve PostgreSQL'den kullanıcıyı siler
+        
+        Args:
+            uid (str): Firebase kullanıcı ID'si
+            
+        Returns:
+            bool: İşlem başarılı ise True
+        """
+        return _run_flow(self._delete_user_flow(uid))
+
+    def _create_user_flow(self, email, password, display_name):
+        try:
+            # uid önceden üretilir; niyet kaydı Firebase çağrısıyla aynı anda yazılır
+            uid = uuid.uuid4().hex
+            user, db_user = yield from self._dual_write_flow(
+                "create", uid, email, display_name,
+                "create_user", auth.create_user,
+                uid=uid,
+                email=email,
+                password=password,
+                display_name=display_name
+            )
+            
+            invalidate_cached_user(uid=user.uid, email=email)
+            logger.info("Kullanıcı başarıyla oluşturuldu: %s", user.uid)
+            return {
+                "firebase_user": _firebase_user_summary(user),
+                "db_user": db_user
+            }
+        except Exception as e:
+            logger.error("Kullanıcı oluşturma hatası: %s", e)
+            raise
+
+    def _update_user_flow(self, uid, email, display_name):
         try:
             # Güncelleme parametrelerini oluştur
             update_params = {}
@@ -111,119 +460,473 @@ class FirebaseService:
             if display_name is not None:
                 update_params['display_name'] = display_name
             
-            # Firebase'de kullanıcıyı güncelle
-            if update_params:
-                user = auth.update_user(uid, **update_params)
-                
-                # PostgreSQL'de kullanıcıyı güncelle
-                db_user = update_user(
-                    firebase_uid=uid,
-                    email=email,
-                    display_name=display_name
-                )
-                
-                logger.info(f"Kullanıcı başarıyla güncellendi: {uid}")
-                return {
-                    "firebase_user": {
-                        "uid": user.uid,
-                        "email": user.email,
-                        "display_name": user.display_name
-                    },
-                    "db_user": db_user
-                }
-            else:
+            if not update_params:
                 logger.warning("Güncelleme için parametre belirtilmedi")
                 return None
+
+            # Firebase'de ve PostgreSQL'de kullanıcıyı güncelle
+            user, db_user = yield from self._dual_write_flow(
+                "update", uid, email, display_name,
+                "update_user", auth.update_user, uid, **update_params
+            )
+            
+            invalidate_cached_user(uid=uid, email=email)
+            logger.info("Kullanıcı başarıyla güncellendi: %s", uid)
+            return {
+                "firebase_user": _firebase_user_summary(user),
+                "db_user": db_user
+            }
         except Exception as e:
-            logger.error(f"Kullanıcı güncelleme hatası: {str(e)}")
+            logger.error("Kullanıcı güncelleme hatası: %s", e)
             raise
-    
-    def delete_user_account(self, uid):
-        """Firebase ve PostgreSQL'den kullanıcıyı siler
-        
+
+    def _delete_user_flow(self, uid):
+        try:
+            # Firebase'den ve PostgreSQL'den kullanıcıyı sil
+            yield from self._dual_write_flow("delete", uid, None, None, "delete_user", auth.delete_user, uid)
+            
+            invalidate_cached_user(uid=uid)
+            logger.info("Kullanıcı başarıyla silindi: %s", uid)
+            return True
+        except Exception as e:
+            logger.error("Kullanıcı silme hatası: %s", e)
+            raise
+
+    def _dual_write_flow(self, op, uid, email, display_name, call, func, /, *args, **kwargs):
+        """Niyet kaydı ile Firebase çağrısını eşzamanlı yürütüp veritabanı yazımını karara bağlar
+
+        Niyet kaydı kısa bir autocommit ifadesidir ve Firebase çağrısıyla aynı
+        anda yazılır; Firebase çağrısı sürerken transaction veya satır kilidi
+        tutulmaz. Firebase yanıtından sonra yazım tek bir veritabanı adımında
+        uygulanır, böylece istek süresi iki tur kadardır: niyet kaydı ile
+        Firebase çağrısının büyüğü ve kısa yazım transaction'ı.
+
+        Returns:
+            tuple: (Firebase sonucu, veritabanı yazımının sonucu)
+        """
+        intent_id, firebase_result = yield [
+            _Call("db", record_write_intent, op, uid),
+            _Call("firebase", self._call_firebase, call, func, *args, **kwargs),
+        ]
+        return (yield _Call(
+            "db", self._settle_dual_write, op, uid, intent_id, firebase_result, email, display_name
+        ))
+
+    def _settle_dual_write(self, op, uid, intent_id, firebase_result, email=None, display_name=None):
+        """Firebase çağrısının sonucuna göre veritabanı yazımını uygular veya niyeti geri çeker
+
+        Firebase başarılıysa yazım ve niyet kaydının silinmesi kısa bir
+        transaction'da uygulanır. Firebase yazımı kesin olarak reddettiyse niyet
+        kaydı silinir. Firebase'in sonucu belirsizse (zaman aşımı, sunucu
+        hatası) veya veritabanı yazımı başarısızsa niyet kaydı bırakılır;
+        write_repair Firebase'deki duruma göre yazımı tamamlar veya telafi eder.
+        Niyet kaydı yazılamamışsa onarım gereken durumda yeniden yazılmaya çalışılır.
+
         Args:
+            op (str): "create", "update" veya "delete"
             uid (str): Firebase kullanıcı ID'si
-            
+            intent_id: Niyet kaydının ID'si veya record_write_intent'in fırlattığı istisna
+            firebase_result: Firebase çağrısının sonucu veya fırlattığı istisna
+            email (str, optional): Veritabanına yazılacak e-posta adresi
+            display_name (str, optional): Veritabanına yazılacak görünen ad
+
         Returns:
-            bool: İşlem başarılı ise True
+            tuple: (Firebase sonucu, veritabanı yazımının sonucu)
+
+        Raises:
+            Exception: Firebase hatası; Firebase başarılıysa veritabanı hatası
         """
+        if isinstance(intent_id, BaseException):
+            logger.warning("Yazım niyeti kaydedilemedi (%s %s): %s", op, uid, intent_id)
+            intent_id = None
+
+        if isinstance(firebase_result, BaseException):
+            if isinstance(firebase_result, _FIREBASE_FAILURES):
+                # İstek Firebase'e ulaşmış ve uygulanmış olabilir; karar onarıcıda
+                logger.warning("Firebase %s sonucu belirsiz (%s), onarıma bırakıldı: %s", op, uid, firebase_result)
+                _leave_for_repair(op, uid, intent_id)
+                raise firebase_result
+            if intent_id is not None:
+                try:
+                    clear_write_intent(intent_id)
+                except Exception as e:
+                    # Kayıt kalırsa onarıcı Firebase'deki (değişmemiş) durumu yeniden yazar
+                    logger.warning("Yazım niyeti silinemedi (%s): %s", intent_id, e)
+            DUAL_WRITES.inc(op=op, outcome="rolled_back")
+            raise firebase_result
+
         try:
-            # Firebase'den kullanıcıyı sil
-            auth.delete_user(uid)
-            
-            # PostgreSQL'den kullanıcıyı sil
-            db_result = delete_user(uid)
-            
-            logger.info(f"Kullanıcı başarıyla silindi: {uid}")
-            return True
+            db_result = apply_user_write(intent_id, op, uid, email, display_name)
+        except WriteIntentClaimedError:
+            # Onarıcı Firebase çağrısı bitmeden karar vermiş olabilir; son durum
+            # için yeni bir kayıt bırakılır
+            logger.warning("Firebase %s yanıtı gecikti (%s), yeniden onarıma bırakıldı", op, uid)
+            _leave_for_repair(op, uid, None)
+            raise
         except Exception as e:
-            logger.error(f"Kullanıcı silme hatası: {str(e)}")
+            logger.error("Veritabanı %s yazımı tamamlanamadı (%s), onarıma bırakıldı: %s", op, uid, e)
+            _leave_for_repair(op, uid, intent_id)
             raise
-    
-    def get_user_by_email(self, email):
+        DUAL_WRITES.inc(op=op, outcome="committed")
+        return firebase_result, db_result
+
+    def repair_user_write(self, op, uid):
+        """Yarım kalmış bir çift yazımı Firebase'deki duruma göre tamamlar veya telafi eder
+
+        Kalan bir create niyeti istemcinin hata aldığı anlamına gelir; kullanıcı
+        iki taraftan da silinir. update ve delete için PostgreSQL satırı
+        Firebase'deki güncel kayda eşitlenir (Firebase'de yoksa silinir).
+
+        Args:
+            op (str): "create", "update" veya "delete"
+            uid (str): Firebase kullanıcı ID'si
+
+        Returns:
+            str: Uygulanan işlem ("compensated", "synced" veya "deleted")
+        """
+        if op == "create":
+            try:
+                self._call_firebase("delete_user", auth.delete_user, uid)
+            except auth.UserNotFoundError:
+                pass
+            delete_user(uid)
+            action = "compensated"
+        else:
+            try:
+                user = self._call_firebase("get_user", auth.get_user, uid)
+            except auth.UserNotFoundError:
+                delete_user(uid)
+                action = "deleted"
+            else:
+                replace_user(uid, user.email, user.display_name)
+                action = "synced"
+        invalidate_cached_user(uid=uid)
+        logger.info("Yarım kalan %s yazımı onarıldı (%s): %s", op, uid, action)
+        return action
+
+    def get_user_by_email(self, email, fresh=False):
         """E-posta adresine göre kullanıcı bilgilerini getirir
         
+        Önce süreç içi önbelleğe, sonra primary'deki users tablosuna bakılır;
+        e-posta büyük/küçük harf duyarsızdır. users'ta tutulmayan profil
+        alanları (phone_number, photo_url, disabled) user_profiles'ta güncel
+        değilse veya fresh=True ise Firebase çağrılır; okunan alanlar satırın
+        sürümüyle user_profiles'a yazılır.
+        
         Args:
             email (str): Kullanıcı e-posta adresi
+            fresh (bool, optional): True ise doğrudan Firebase'den okunur
             
         Returns:
             dict: Kullanıcı bilgileri
         """
+        return _run_flow(self._user_lookup_flow(email, fresh))
+
+    def _user_lookup_flow(self, email, fresh):
+        # Önbellek isabeti çağrı üretmeden döner; async yolda thread'e geçilmez
         try:
-            user = auth.get_user_by_email(email)
-            return {
-                "uid": user.uid,
-                "email": user.email,
-                "display_name": user.display_name,
-                "phone_number": user.phone_number,
-                "photo_url": user.photo_url,
-                "disabled": user.disabled
-            }
+            db_user = None
+            if not fresh:
+                user = _cached_user(email)
+                if user is not None:
+                    return user
+                db_user, profile = yield _Call("db", db_get_user_details_by_email, email)
+                if profile is not None:
+                    user = _db_user_details(db_user, profile)
+                    _cache_user(email, user)
+                    return user
+
+            user = _firebase_user_details((yield _Call(
+                "firebase", self._call_firebase, "get_user_by_email", auth.get_user_by_email, email
+            )))
+            if db_user is not None and db_user.firebase_uid == user["uid"]:
+                try:
+                    yield _Call("db", save_user_profile, db_user, *_profile_fields(user))
+                except Exception as e:
+                    logger.warning("Profil alanları kaydedilemedi (%s): %s", user["uid"], e)
+            _cache_user(email, user)
+            return user
         except auth.UserNotFoundError:
-            logger.warning(f"Kullanıcı bulunamadı: {email}")
+            logger.warning("Kullanıcı bulunamadı: %s", email)
             return None
         except Exception as e:
-            logger.error(f"Kullanıcı getirme hatası: {str(e)}")
+            logger.error("Kullanıcı getirme hatası: %s", e)
             raise
+
+    async def import_users_chunk_async(self, users):
+        """Kullanıcıları tek bir auth.import_users çağrısıyla Firebase'e aktarır ve PostgreSQL'e toplu yazar
+
+        Şifreler PBKDF2-SHA256 ile CPU thread havuzunda hash'lenip aktarılır.
+        import_users e-posta tekilliğini kontrol etmediği ve aynı uid'li kaydın
+        üzerine yazdığı için users tablosunda kayıtlı e-postalar (büyük/küçük
+        harf duyarsız) ve uid'ler aktarılmaz. Veritabanı çağrıları veritabanı
+        havuzunda ve giriş kontrolünden geçerek çalışır.
+
+        Args:
+            users (list): index, uid, email, password ve display_name içeren
+                sözlükler (en fazla 1000)
+
+        Returns:
+            list: Her kullanıcı için {"index", "uid", "email", "status", "message"}
+        """
+        results = [
+            {"index": user["index"], "uid": user["uid"], "email": user.get("email"), "status": "success"}
+            for user in users
+        ]
+
+        def fail(positions, message):
+            for i in positions:
+                results[i]["status"] = "error"
+                results[i]["message"] = message
+
+        try:
+            existing_uids, existing_emails = await find_existing_users_async(
+                [user["uid"] for user in users],
+                [user["email"] for user in users if user.get("email")]
+            )
+        except Exception as e:
+            fail(range(len(users)), str(e))
+            return results
+
+        candidates = []
+        for i, user in enumerate(users):
+            if user["uid"] in existing_uids:
+                fail([i], "uid zaten kayıtlı")
+            elif user.get("email") and user["email"].lower() in existing_emails:
+                fail([i], "E-posta adresi zaten kayıtlı")
+            else:
+                candidates.append(i)
+        if not candidates:
+            return results
+
+        positions, records, errors, hashed = await run_cpu(_import_records, [users[i] for i in candidates])
+        for position, message in errors:
+            fail([candidates[position]], message)
+        positions = [candidates[position] for position in positions]
+        if not records:
+            return results
+
+        hash_alg = auth.UserImportHash.pbkdf2_sha256(rounds=BULK_IMPORT_HASH_ROUNDS) if hashed else None
+        try:
+            import_result = await run_firebase(self._call_firebase, "import_users", auth.import_users, records, hash_alg=hash_alg)
+        except Exception as e:
+            logger.error("Toplu kullanıcı aktarma hatası: %s", e)
+            fail(positions, str(e))
+            return results
+        for error in import_result.errors:
+            fail([positions[error.index]], error.reason)
+
+        imported = [i for i in positions if results[i]["status"] == "success"]
+        if imported:
+            try:
+                inserted = await insert_imported_users_async([users[i] for i in imported])
+            except Exception as e:
+                # Firebase'deki kayıtlar toplu eşitleme (reconcile) ile veritabanına alınabilir
+                inserted = set()
+                fail(imported, f"Firebase'e aktarıldı, veritabanına yazılamadı: {e}")
+            else:
+                # Kontrolden sonra aynı uid başka bir yoldan eklendi; mevcut satıra dokunulmadı
+                fail([i for i in imported if users[i]["uid"] not in inserted], "Firebase'e aktarıldı, uid veritabanında zaten kayıtlı")
+            for i in imported:
+                if users[i]["uid"] not in inserted:
+                    results[i]["firebase_imported"] = True
+                invalidate_cached_user(uid=users[i]["uid"], email=users[i].get("email"))
+        logger.info("Toplu aktarım: %s/%s kullanıcı aktarıldı", sum(1 for r in results if r["status"] == "success"), len(users))
+        return results
+
+    def user_cache_stats(self):
+        """E-posta sorgu önbelleği istatistiklerini döndürür, önbellek kapalıysa None"""
+        if user_lookup_cache is None:
+            return None
+        return user_lookup_cache.stats()
     
-    def handle_auth_event(self, event_type, user_data):
+    def handle_auth_event(self, event_type, user_data, event_id=None, version=None):
         """Firebase Auth olaylarını işler ve PostgreSQL'e yansıtır
         
+        event_id verilen olaylar tekrar teslimlere karşı kaydedilir; version
+        verilen olaylar satırdaki sürümden eskiyse uygulanmaz.
+        
         Args:
             event_type (str): Olay tipi (create, update, delete)
             user_data (dict): Kullanıcı verileri
+            event_id (str, optional): Olayın benzersiz kimliği
+            version (int, optional): Olayın kaynak sürümü (milisaniye cinsinden zaman damgası)
             
         Returns:
             dict: İşlem sonucu
         """
+        if event_id:
+            # Olay kaydı ve yazım aynı transaction içinde yapılmalı
+            return self.handle_auth_events([{
+                "event_type": event_type,
+                "user_data": user_data,
+                "event_id": event_id,
+                "version": version,
+            }])[0]
+
+        invalidate_cached_user(uid=user_data.get("uid"), email=user_data.get("email"))
         try:
             if event_type == "create":
                 # Yeni kullanıcı oluşturuldu
                 db_user = insert_user(
                     firebase_uid=user_data.get("uid"),
                     email=user_data.get("email"),
-                    display_name=user_data.get("display_name")
+                    display_name=user_data.get("display_name"),
+                    version=version
                 )
                 return {"status": "success", "message": "Kullanıcı eklendi", "user": db_user}
             
             elif event_type == "update":
-                # Kullanıcı güncellendi
+                # Kullanıcı güncellendi; oluşturma olayı kaçırıldıysa kullanıcı eklenir
                 db_user = update_user(
                     firebase_uid=user_data.get("uid"),
                     email=user_data.get("email"),
-                    display_name=user_data.get("display_name")
+                    display_name=user_data.get("display_name"),
+                    upsert=True,
+                    version=version
                 )
+                if db_user is None:
+                    return dict(STALE_EVENT_RESULT)
                 return {"status": "success", "message": "Kullanıcı güncellendi", "user": db_user}
             
             elif event_type == "delete":
                 # Kullanıcı silindi
-                success = delete_user(user_data.get("uid"))
+                success = delete_user(user_data.get("uid"), version=version)
                 return {"status": "success", "message": "Kullanıcı silindi", "result": success}
             
             else:
-                logger.warning(f"Bilinmeyen olay tipi: {event_type}")
+                logger.warning("Bilinmeyen olay tipi: %s", event_type)
                 return {"status": "error", "message": "Bilinmeyen olay tipi"}
         
         except Exception as e:
-            logger.error(f"Auth olay işleme hatası: {str(e)}")
-            return {"status": "error", "message": str(e)} 
\ No newline at end of file
+            logger.error("Auth olay işleme hatası: %s", e)
+            return {"status": "error", "message": str(e)}
+
+    def handle_auth_events(self, events):
+        """Birden fazla Firebase Auth olayını tek transaction içinde PostgreSQL'e yansıtır
+        
+        Args:
+            events (list): {"event_type": str, "user_data": dict, "event_id": str,
+                "version": int} sözlükleri; event_id ve version isteğe bağlıdır
+            
+        Returns:
+            list: Her olay için, olaylarla aynı sırada işlem sonucu
+        """
+        results = [None] * len(events)
+        pending = []
+        for index, event in enumerate(events):
+            if is_recent_event(event.get("event_id")):
+                results[index] = dict(DUPLICATE_EVENT_RESULT)
+            else:
+                pending.append(index)
+                user_data = event.get("user_data") or {}
+                invalidate_cached_user(uid=user_data.get("uid"), email=user_data.get("email"))
+        if not pending:
+            return results
+        batch = [events[i] for i in pending]
+        try:
+            applied = apply_user_events(batch)
+        except Exception as e:
+            logger.error("Toplu auth olay işleme hatası: %s", e)
+            applied = [{"status": "error", "message": str(e)} for _ in batch]
+        remember_events(batch, applied)
+        for index, result in zip(pending, applied):
+            results[index] = result
+        return results
+
+    # Async API: Firebase Admin ve veritabanı çağrıları ayrı thread havuzlarında
+    # çalışır, böylece event loop yavaş bir çağrı yüzünden bloklanmaz.
+
+    async def verify_id_token_async(self, id_token):
+        """verify_id_token'ın async karşılığı
+
+        Önbellek isabeti event loop üzerinde döner; Firebase thread havuzuna ve
+        eşzamanlılık slotuna yalnızca ıskada gidilir.
+        """
+        cache_key, cached = self._cached_token(id_token)
+        if cached is not None:
+            return cached
+        return await run_firebase(self._verify_and_cache, id_token, cache_key)
+
+    # Yazımlar iptal edilse de (istemci bağlantıyı kapatsa da) karar adımı
+    # tamamlansın diye akış shield ile korunur.
+
+    async def create_user_async(self, email, password, display_name=None):
+        """create_user'ın async karşılığı"""
+        return await asyncio.shield(_run_flow_async(self._create_user_flow(email, password, display_name)))
+
+    async def update_user_info_async(self, uid, email=None, display_name=None):
+        """update_user_info'nun async karşılığı"""
+        return await asyncio.shield(_run_flow_async(self._update_user_flow(uid, email, display_name)))
+
+    async def delete_user_account_async(self, uid):
+        """delete_user_account'ın async karşılığı"""
+        return await asyncio.shield(_run_flow_async(self._delete_user_flow(uid)))
+
+    async def get_user_by_email_async(self, email, fresh=False):
+        """get_user_by_email'in async karşılığı; önbellek isabetleri thread'e geçmeden döner"""
+        return await _run_flow_async(self._user_lookup_flow(email, fresh))
+
+    async def handle_auth_event_async(self, event_type, user_data, event_id=None, version=None):
+        """handle_auth_event'in async karşılığı"""
+        return await run_db(self.handle_auth_event, event_type, user_data, event_id, version)
+
+    async def handle_auth_events_async(self, events):
+        """handle_auth_events'in async karşılığı"""
+        return await run_db(self.handle_auth_events, events)
+
+    async def bulk_create_users_async(self, users, chunk_size=BULK_IMPORT_CHUNK_SIZE, concurrency=BULK_IMPORT_CONCURRENCY):
+        """Kullanıcıları en fazla chunk_size'lık parçalar halinde, aynı anda en fazla concurrency parça ile aktarır
+
+        uid verilmeyen kullanıcılara rastgele uid atanır. İstekte tekrar eden
+        e-posta adresleri (büyük/küçük harf duyarsız) aktarılmaz. Parçalar
+        sonuçları tüketildikçe başlatılır; istemci akışı yarıda bırakırsa yeni
+        parça başlatılmaz, çalışmakta olanlar tamamlanır.
+
+        Args:
+            users (list): email, password, display_name ve isteğe bağlı uid içeren sözlükler
+            chunk_size (int, optional): import_users çağrısı başına kullanıcı (en fazla 1000)
+            concurrency (int, optional): Aynı anda çalışan import_users çağrısı
+
+        Yields:
+            list: Tamamlanan her parçadaki kullanıcıların sonuçları (tamamlanma sırasıyla)
+        """
+        seen_emails = set()
+        prepared = []
+        duplicates = []
+        for index, user in enumerate(users):
+            uid = user.get("uid") or uuid.uuid4().hex
+            email = user.get("email")
+            key = email.lower() if email else None
+            if key is not None and key in seen_emails:
+                duplicates.append({
+                    "index": index, "uid": uid, "email": email,
+                    "status": "error", "message": "E-posta adresi istekte tekrar ediyor"
+                })
+                continue
+            if key is not None:
+                seen_emails.add(key)
+            prepared.append(dict(user, index=index, uid=uid))
+        if duplicates:
+            yield duplicates
+
+        starts = iter(range(0, len(prepared), chunk_size))
+        running = set()
+        try:
+            while True:
+                for start in starts:
+                    running.add(asyncio.ensure_future(self.import_users_chunk_async(prepared[start:start + chunk_size])))
+                    if len(running) >= concurrency:
+                        break
+                if not running:
+                    break
+                done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            if running:
+                # Firebase'e gönderilmiş parçalar veritabanına da yazılsın diye iptal edilmez
+                logger.warning("Toplu aktarım yarıda bırakıldı; %s parça tamamlanacak, kalanlar başlatılmayacak", len(running))
+                _detached_chunks.update(running)
+                for task in running:
+                    task.add_done_callback(_detached_chunks.discard)
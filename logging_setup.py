@@ -0,0 +1,214 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from config import (
+    LOG_LEVEL, LOG_FORMAT, LOG_QUEUE_SIZE, LOG_RATE_LIMIT,
+    LOG_SAMPLE_WINDOW, LOG_SAMPLE_BURST, LOG_SAMPLE_EVERY
+)
+from metrics import LOG_RECORDS
+
+# İstek yolunda log kaydı yalnızca filtrelenip kuyruğa eklenir; mesajın
+# biçimlendirilmesi, traceback üretimi ve stderr'e yazma arka plan
+# thread'inde yapılır. Mesajlar `logger.info("... %s", değer)` biçiminde
+# yazılmalıdır: örnekleme şablon (record.msg) üzerinden yapılır ve atılan
+# kayıtlar hiç biçimlendirilmez.
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# LogRecord'un kendi alanları; geri kalanlar `extra` ile verilmiştir
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "suppressed"}
+
+class JsonFormatter(logging.Formatter):
+    """Her kaydı tek satırlık bir JSON nesnesine dönüştürür"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "pid": record.process,
+            "thread": record.threadName,
+        }
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class SamplingFilter(logging.Filter):
+    """WARNING altı kayıtlar için logger başına hız sınırı ve tekrar örneklemesi
+
+    WARNING ve üstü kayıtlar her zaman geçer. Aynı mesaj şablonu bir pencere
+    içinde ilk `burst` kez yazılır, sonra her `every` kayıttan biri yazılır;
+    yazılan kayıt o ana kadar atlanan kayıt sayısını `suppressed` alanında taşır.
+
+    Args:
+        rate (float): Logger başına saniyede izin verilen kayıt (0 = sınırsız)
+        window (float): Örnekleme penceresi (saniye)
+        burst (int): Pencere başına örneklenmeden yazılacak kayıt sayısı
+        every (int): Pencere aşıldıktan sonra kaç kayıttan birinin yazılacağı
+    """
+
+    _MAX_KEYS = 10000
+
+    def __init__(self, rate=0.0, window=10.0, burst=20, every=100):
+        super().__init__()
+        self.rate = rate
+        self.window = window
+        self.burst = burst
+        self.every = max(1, every)
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._samples = {}
+
+    def _reset_lock(self):
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            state = None
+            if self.every > 1:
+                key = (record.name, record.msg)
+                state = self._samples.get(key)
+                if state is None or now - state[0] >= self.window:
+                    if state is None and len(self._samples) >= self._MAX_KEYS:
+                        self._samples.clear()
+                    # [pencere başlangıcı, pencere içindeki kayıt, atlanan kayıt]
+                    state = self._samples[key] = [now, 0, state[2] if state else 0]
+                state[1] += 1
+                if state[1] > self.burst and (state[1] - self.burst) % self.every:
+                    state[2] += 1
+                    LOG_RECORDS.inc(level=record.levelname, outcome="sampled")
+                    return False
+
+            if self.rate > 0:
+                bucket = self._buckets.get(record.name)
+                if bucket is None:
+                    bucket = self._buckets[record.name] = [self.rate, now]
+                tokens = min(self.rate, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+                if tokens < 1.0:
+                    bucket[0] = tokens
+                    if state is not None:
+                        state[2] += 1
+                    LOG_RECORDS.inc(level=record.levelname, outcome="rate_limited")
+                    return False
+                bucket[0] = tokens - 1.0
+
+            if state is not None and state[2]:
+                record.suppressed = state[2]
+                state[2] = 0
+        return True
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """Kayıtları biçimlendirmeden kuyruğa ekleyen handler
+
+    Kuyruk doluysa WARNING altı kayıtlar atılır; WARNING ve üstü kayıtlar
+    yer açılana kadar beklenerek eklenir ve hiçbir zaman atılmaz. Dinleyici
+    durdurulduktan sonra kayıtlar doğrudan hedef handler'a yazılır.
+    """
+
+    def __init__(self, log_queue, target):
+        super().__init__(log_queue)
+        self.target = target
+        self.stopped = False
+
+    def prepare(self, record):
+        # Biçimlendirme dinleyici thread'inde yapılır
+        return record
+
+    def enqueue(self, record):
+        if self.stopped:
+            self.target.handle(record)
+        elif record.levelno >= logging.WARNING:
+            self.queue.put(record)
+        else:
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                LOG_RECORDS.inc(level=record.levelname, outcome="dropped")
+                return
+        LOG_RECORDS.inc(level=record.levelname, outcome="emitted")
+
+_lock = threading.Lock()
+_handler = None
+_listener = None
+
+def _start_listener():
+    global _listener
+    _listener = logging.handlers.QueueListener(_handler.queue, _handler.target, respect_handler_level=True)
+    _listener.start()
+
+def _after_fork_in_child():
+    # Dinleyici thread'i fork'la çocuk sürece geçmez; kuyruğu ve thread'i yeniden kur
+    global _lock
+    _lock = threading.Lock()
+    if _handler is None or _handler.stopped:
+        return
+    for log_filter in _handler.filters:
+        if isinstance(log_filter, SamplingFilter):
+            log_filter._reset_lock()
+    _handler.queue = queue.Queue(LOG_QUEUE_SIZE)
+    _start_listener()
+
+def configure_logging():
+    """Kök logger'ı kuyruk tabanlı, örneklemeli handler ile yapılandırır
+
+    Birden çok kez çağrılabilir; yalnızca ilk çağrı etkilidir.
+    """
+    global _handler
+    with _lock:
+        if _handler is not None:
+            return
+        target = logging.StreamHandler(sys.stderr)
+        target.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+        handler = QueueHandler(queue.Queue(LOG_QUEUE_SIZE), target)
+        handler.addFilter(SamplingFilter(
+            rate=LOG_RATE_LIMIT,
+            window=LOG_SAMPLE_WINDOW,
+            burst=LOG_SAMPLE_BURST,
+            every=LOG_SAMPLE_EVERY,
+        ))
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL)
+        _handler = handler
+        _start_listener()
+    atexit.register(shutdown_logging)
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_after_fork_in_child)
+
+def shutdown_logging():
+    """Kuyrukta bekleyen kayıtları yazar ve dinleyici thread'ini durdurur"""
+    global _listener
+    with _lock:
+        if _handler is None or _handler.stopped:
+            return
+        _handler.stopped = True
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+    _handler.target.flush()
@@ -0,0 +1,264 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Prometheus metin formatında çalışan, bağımlılıksız ve düşük maliyetli
+# ölçüm altyapısı. Her metrik kendi kilidini kullanır; sıcak yolda yalnızca
+# bir sözlük araması ve birkaç toplama yapılır.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} için etiketler: {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+class Counter(_Metric):
+    """Yalnızca artan sayaç"""
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value, **labels):
+        """Başka bir yerde tutulan toplamı aktarır (kazıma anındaki toplayıcılar için)
+
+        Kaynak sıfırlanırsa (ör. havuz yeniden oluşturulursa) değer düşer;
+        Prometheus bunu sayaç sıfırlanması olarak ele alır.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Gauge(_Metric):
+    """Artıp azalabilen anlık değer"""
+    type_name = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(_Metric):
+    """Kova (bucket) tabanlı süre/boyut dağılımı"""
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Blok süresini saniye cinsinden kaydeder"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_value(self, key, value):
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class Registry:
+    """Metrikleri ve kazıma (scrape) anında çalışan toplayıcıları tutar"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        """Kazıma öncesinde çağrılacak fonksiyonu ekler (ör. havuz istatistiklerini gauge'lara yazmak için)"""
+        with self._lock:
+            self._collectors.append(collector)
+        return collector
+
+    def render(self):
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics)
+        for collector in collectors:
+            collector()
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+def gauge(name, documentation, labelnames=()):
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+# Uygulama metrikleri
+HTTP_REQUEST_DURATION = histogram(
+    "http_request_duration_seconds", "HTTP istek süresi", ("method", "route", "status"))
+HTTP_REQUESTS_IN_FLIGHT = gauge(
+    "http_requests_in_flight", "İşlenmekte olan HTTP istekleri")
+EXECUTOR_IN_FLIGHT = gauge(
+    "executor_calls_in_flight", "Thread havuzunda çalışan veya sırada bekleyen çağrılar", ("executor",))
+FIREBASE_CALL_DURATION = histogram(
+    "firebase_call_duration_seconds", "Firebase Admin çağrı süresi", ("call", "outcome"))
+DB_QUERY_DURATION = histogram(
+    "db_query_duration_seconds", "SQL ifadesi süresi", ("statement",))
+DB_POOL_ACQUIRE_DURATION = histogram(
+    "db_pool_acquire_seconds", "Havuzdan bağlantı alma bekleme süresi")
+WEBHOOK_EVENTS = counter(
+    "webhook_events_total", "İşlenen webhook olayları", ("event_type", "outcome"))
+LOG_RECORDS = counter(
+    "log_records_total", "Log kayıtları (emitted, sampled, rate_limited, dropped)", ("level", "outcome"))
+ADMISSION_REJECTED = counter(
+    "admission_rejected_total", "Giriş kontrolünde reddedilen istekler (client/route: 429, db/firebase: 503)", ("limit", "reason"))
+DEPENDENCY_RETRIES = counter(
+    "dependency_retries_total", "Idempotent çağrıların yeniden denemeleri", ("dependency", "call"))
+BREAKER_TRANSITIONS = counter(
+    "circuit_breaker_transitions_total", "Devre kesici durum geçişleri", ("dependency", "state"))
+CHANGE_EVENTS = counter(
+    "user_change_events_total", "Akış istemcilerine gönderilen değişiklik olayları (live, replay)", ("source",))
+CHANGE_CLIENT_OVERFLOWS = counter(
+    "user_change_client_overflows_total", "Tamponu dolduğu için tablodan okumaya geçirilen akış istemcileri")
+DUAL_WRITES = counter(
+    "dual_writes_total", "Firebase + PostgreSQL çift yazımlarının sonucu (committed, rolled_back, repair)", ("op", "outcome"))
+DB_READ_ROUTES = counter(
+    "db_read_routes_total", "Okuma sorgularının yönlendirildiği sunucu ve nedeni", ("target", "reason"))
+DUAL_WRITE_REPAIRS = counter(
+    "dual_write_repairs_total", "Yarım kalmış çift yazımların onarımı (repaired, failed)", ("op", "outcome"))
+
+@contextmanager
+def firebase_timer(call):
+    """Firebase Admin çağrısının süresini sonucuyla birlikte kaydeder"""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "success"
+    finally:
+        FIREBASE_CALL_DURATION.observe(time.perf_counter() - start, call=call, outcome=outcome)
+
+def record_webhook_results(events, results):
+    """Webhook olay sonuçlarını olay tipi ve sonuca göre sayar"""
+    for event, result in zip(events, results):
+        event_type = event.get("event_type")
+        if event_type not in ("create", "update", "delete"):
+            event_type = "unknown"
+        outcome = "error"
+        if result and result.get("status") == "success":
+            # Tekrar eden ve eski olaylar "duplicate"/"stale" olarak sayılır
+            outcome = result.get("skipped") or ("queued" if result.get("queued") else "success")
+        WEBHOOK_EVENTS.inc(event_type=event_type, outcome=outcome)
+
+class MetricsMiddleware:
+    """Rota bazında istek süresini ve eşzamanlı istek sayısını ölçen ASGI middleware'i
+
+    Rota etiketi eşleşen yolun şablonudur (ör. /users/{uid}); böylece etiket
+    sayısı sınırlı kalır.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        start = time.perf_counter()
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                method=scope.get("method", ""),
+                route=getattr(route, "path", "unmatched"),
+                status=status_code
+            )
@@ -0,0 +1,391 @@
+"""Firebase Authentication ile PostgreSQL users tablosunu toplu olarak eşitler
+
+Kaçırılan webhook'lardan sonra tabloyu yeniden senkronize etmek için kullanılır:
+
+    python reconcile.py --dry-run            # yalnızca farkları raporla
+    python reconcile.py                      # farkları uygula
+    python reconcile.py --resume <run_id>    # yarıda kalan çalıştırmaya devam et
+    python reconcile.py --source-file users.jsonl --dry-run
+
+Akış üç adımdan oluşur: Firebase `list_users` sayfaları bir generator olarak
+okunur, her sayfa `COPY` ile staging tablosuna yüklenir ve tüm sayfalar
+bittiğinde `users` tablosuna küme tabanlı ekleme/güncelleme/silme uygulanır.
+Sayfa okuma ile veritabanı yüklemesi ayrı thread'lerde paralel yürür; bellekte
+en fazla `--prefetch` kadar sayfa tutulur. Her sayfanın yüklenmesi ve
+checkpoint aynı transaction'da yazıldığı için çalıştırma kaldığı yerden
+sürdürülebilir. `--dry-run` staging verisini silmez; raporlanan run_id
+`--resume` ile verilerek aynı farklar sonradan uygulanabilir.
+"""
+import argparse
+import io
+import json
+import logging
+import queue
+import sys
+import threading
+import uuid
+from database import get_connection
+from logging_setup import configure_logging
+
+logger = logging.getLogger(__name__)
+
+_RECONCILE_DDL = """
+    CREATE UNLOGGED TABLE IF NOT EXISTS reconcile_staging (
+        run_id TEXT NOT NULL,
+        firebase_uid TEXT NOT NULL,
+        email TEXT,
+        display_name TEXT,
+        PRIMARY KEY (run_id, firebase_uid)
+    );
+    CREATE TABLE IF NOT EXISTS reconcile_checkpoints (
+        run_id TEXT PRIMARY KEY,
+        started_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        next_page_token TEXT,
+        pages INTEGER NOT NULL DEFAULT 0,
+        users BIGINT NOT NULL DEFAULT 0,
+        listing_complete BOOLEAN NOT NULL DEFAULT FALSE,
+        applied_at TIMESTAMPTZ
+    );
+"""
+
+_SAMPLE_SIZE = 20
+
+class _Page:
+    """Firebase ListUsersPage ile aynı arayüze sahip basit sayfa"""
+
+    def __init__(self, users, next_page_token):
+        self.users = users
+        self.next_page_token = next_page_token
+
+class _User:
+    __slots__ = ("uid", "email", "display_name")
+
+    def __init__(self, uid, email=None, display_name=None):
+        self.uid = uid
+        self.email = email
+        self.display_name = display_name
+
+def jsonl_user_source(path):
+    """Her satırında {"uid", "email", "display_name"} bulunan bir dosyayı
+    `auth.list_users` ile aynı imzaya sahip bir kaynağa dönüştürür
+
+    Firebase'e bağlanmadan deneme ve test için kullanılır. Sayfa token'ı
+    dosyadaki satır numarasıdır.
+    """
+    def list_users(page_token=None, max_results=1000):
+        start = int(page_token) if page_token else 0
+        users = []
+        with open(path, encoding="utf-8") as f:
+            for line_no, line in enumerate(f):
+                if line_no < start or not line.strip():
+                    continue
+                if len(users) == max_results:
+                    return _Page(users, str(line_no))
+                data = json.loads(line)
+                users.append(_User(data["uid"], data.get("email"), data.get("display_name")))
+        return _Page(users, None)
+    return list_users
+
+def iter_user_pages(list_users, page_size=1000, page_token=None):
+    """Kullanıcı kaynağını sayfa sayfa okuyan generator
+
+    Args:
+        list_users (callable): `auth.list_users` imzasında kaynak
+        page_size (int): Sayfa başına kullanıcı sayısı (Firebase için en fazla 1000)
+        page_token (str, optional): Başlanacak sayfa token'ı
+
+    Yields:
+        tuple: ([(uid, email, display_name), ...], sonraki sayfa token'ı veya None)
+    """
+    while True:
+        page = list_users(page_token=page_token, max_results=page_size)
+        rows = [(user.uid, user.email, user.display_name) for user in page.users]
+        page_token = page.next_page_token or None
+        yield rows, page_token
+        if page_token is None:
+            return
+
+def ensure_reconcile_tables():
+    """Staging ve checkpoint tablolarını oluşturur"""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(_RECONCILE_DDL)
+
+def _load_checkpoint(run_id):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT next_page_token, pages, users, listing_complete, applied_at FROM reconcile_checkpoints WHERE run_id = %s",
+                (run_id,)
+            )
+            return cur.fetchone()
+
+def _start_run(run_id):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("INSERT INTO reconcile_checkpoints (run_id) VALUES (%s)", (run_id,))
+
+def _csv_field(value):
+    # None açıkça \N olarak, diğer değerler tırnak içinde yazılır; COPY
+    # tırnaklı alanı hiçbir zaman NULL saymaz, böylece boş görünen ad ("")
+    # NULL'dan ayrılır ve fark olarak raporlanmaz
+    if value is None:
+        return "\\N"
+    return '"' + str(value).replace('"', '""') + '"'
+
+def _staging_csv(run_id, rows):
+    """Sayfayı COPY ... (FORMAT csv, NULL '\\N') için CSV metnine çevirir"""
+    buffer = io.StringIO()
+    for uid, email, display_name in rows:
+        buffer.write(",".join(_csv_field(value) for value in (run_id, uid, email, display_name)))
+        buffer.write("\n")
+    buffer.seek(0)
+    return buffer
+
+def _copy_page(run_id, rows, next_page_token):
+    """Sayfayı COPY ile staging tablosuna yükler ve checkpoint'i aynı transaction'da ilerletir"""
+    buffer = _staging_csv(run_id, rows)
+
+    with get_connection() as conn:
+        conn.autocommit = False
+        try:
+            with conn.cursor() as cur:
+                cur.copy_expert(
+                    "COPY reconcile_staging (run_id, firebase_uid, email, display_name) "
+                    "FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                    buffer
+                )
+                cur.execute(
+                    """
+                    UPDATE reconcile_checkpoints
+                    SET next_page_token = %s,
+                        pages = pages + 1,
+                        users = users + %s,
+                        listing_complete = %s,
+                        updated_at = now()
+                    WHERE run_id = %s
+                    """,
+                    (next_page_token, len(rows), next_page_token is None, run_id)
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+def _put(out, item, stop):
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _fetch_pages(pages, out, stop):
+    """Sayfaları okuyup sınırlı kuyruğa koyan üretici thread"""
+    try:
+        for page in pages:
+            if not _put(out, page, stop):
+                return
+        _put(out, None, stop)
+    except BaseException as e:
+        _put(out, e, stop)
+
+def load_staging(run_id, list_users, page_size=1000, page_token=None, prefetch=2):
+    """Kaynağın tüm sayfalarını staging tablosuna yükler
+
+    Sayfalar bir thread'de okunurken önceki sayfa veritabanına yüklenir.
+
+    Returns:
+        int: Bu çağrıda yüklenen kullanıcı sayısı
+    """
+    pages = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+    producer = threading.Thread(
+        target=_fetch_pages,
+        args=(iter_user_pages(list_users, page_size, page_token), pages, stop),
+        name="reconcile-fetch",
+        daemon=True
+    )
+    producer.start()
+    loaded = 0
+    try:
+        while True:
+            item = pages.get()
+            if item is None:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            rows, next_page_token = item
+            _copy_page(run_id, rows, next_page_token)
+            loaded += len(rows)
+            logger.info("Staging'e %s kullanıcı yüklendi (toplam %s)", len(rows), loaded)
+    finally:
+        stop.set()
+        producer.join()
+    return loaded
+
+# Listeleme sırasında oluşturulan veya webhook ile güncellenen kayıtlara
+# dokunmamak için yalnızca çalıştırma başlamadan önceki satırlar değiştirilir.
+_DIFF_QUERIES = {
+    "insert": """
+        FROM reconcile_staging s
+        WHERE s.run_id = %(run_id)s
+          AND NOT EXISTS (SELECT 1 FROM users u WHERE u.firebase_uid = s.firebase_uid)
+    """,
+    "update": """
+        FROM reconcile_staging s
+        JOIN users u ON u.firebase_uid = s.firebase_uid
+        WHERE s.run_id = %(run_id)s
+          AND (u.email IS DISTINCT FROM s.email OR u.display_name IS DISTINCT FROM s.display_name)
+          AND COALESCE(u.updated_at, u.created_at) < %(started_at)s
+    """,
+    "delete": """
+        FROM users u
+        WHERE NOT EXISTS (
+            SELECT 1 FROM reconcile_staging s
+            WHERE s.run_id = %(run_id)s AND s.firebase_uid = u.firebase_uid
+        )
+          AND u.created_at < %(started_at)s
+    """,
+}
+
+def diff_report(cur, params):
+    """Her değişiklik türü için sayı ve örnek uid'leri döndürür"""
+    uid_column = {"insert": "s.firebase_uid", "update": "u.firebase_uid", "delete": "u.firebase_uid"}
+    report = {}
+    for kind, body in _DIFF_QUERIES.items():
+        cur.execute(f"SELECT COUNT(*) {body}", params)
+        count = cur.fetchone()[0]
+        cur.execute(f"SELECT {uid_column[kind]} {body} ORDER BY 1 LIMIT {_SAMPLE_SIZE}", params)
+        report[kind] = {"count": count, "sample": [row[0] for row in cur.fetchall()]}
+    return report
+
+def apply_diff(cur, params, delete=True):
+    """Farkları tek transaction içinde küme tabanlı ifadelerle uygular"""
+    applied = {}
+    cur.execute(
+        f"""
+        INSERT INTO users (firebase_uid, email, display_name, created_at)
+        SELECT s.firebase_uid, s.email, s.display_name, CURRENT_TIMESTAMP
+        {_DIFF_QUERIES["insert"]}
+        ON CONFLICT (firebase_uid) DO NOTHING
+        """,
+        params
+    )
+    applied["insert"] = cur.rowcount
+    cur.execute(
+        """
+        UPDATE users u
+        SET email = s.email, display_name = s.display_name, updated_at = CURRENT_TIMESTAMP
+        FROM reconcile_staging s
+        WHERE s.run_id = %(run_id)s
+          AND u.firebase_uid = s.firebase_uid
+          AND (u.email IS DISTINCT FROM s.email OR u.display_name IS DISTINCT FROM s.display_name)
+          AND COALESCE(u.updated_at, u.created_at) < %(started_at)s
+        """,
+        params
+    )
+    applied["update"] = cur.rowcount
+    if delete:
+        cur.execute(
+            """
+            DELETE FROM users u
+            WHERE NOT EXISTS (
+                SELECT 1 FROM reconcile_staging s
+                WHERE s.run_id = %(run_id)s AND s.firebase_uid = u.firebase_uid
+            )
+              AND u.created_at < %(started_at)s
+            """,
+            params
+        )
+        applied["delete"] = cur.rowcount
+    return applied
+
+def reconcile(list_users, run_id=None, dry_run=False, delete=True, page_size=1000, prefetch=2):
+    """Kaynağı users tablosuyla eşitler
+
+    Args:
+        list_users (callable): `auth.list_users` imzasında kullanıcı kaynağı
+        run_id (str, optional): Sürdürülecek çalıştırma; verilmezse yenisi başlar
+        dry_run (bool): True ise farklar yalnızca raporlanır
+        delete (bool): False ise kaynakta olmayan kullanıcılar silinmez
+        page_size (int): Sayfa boyutu
+        prefetch (int): Bellekte bekletilecek en fazla sayfa
+
+    Returns:
+        dict: Çalıştırma özeti ve fark raporu
+    """
+    ensure_reconcile_tables()
+    if run_id is None:
+        run_id = uuid.uuid4().hex
+        _start_run(run_id)
+        checkpoint = (None, 0, 0, False, None)
+    else:
+        checkpoint = _load_checkpoint(run_id)
+        if checkpoint is None:
+            raise ValueError(f"Çalıştırma bulunamadı: {run_id}")
+    next_page_token, pages, users, listing_complete, applied_at = checkpoint
+    if applied_at is not None:
+        raise ValueError(f"Çalıştırma zaten uygulanmış: {run_id}")
+
+    if not listing_complete:
+        logger.info("Firebase kullanıcıları staging'e yükleniyor (run_id=%s, sayfa=%s)", run_id, pages)
+        load_staging(run_id, list_users, page_size, next_page_token, prefetch)
+
+    with get_connection() as conn:
+        conn.autocommit = False
+        try:
+            with conn.cursor() as cur:
+                # Tüm tabloya uygulanan ifadeler varsayılan DB_STATEMENT_TIMEOUT'u aşabilir
+                cur.execute("SET LOCAL statement_timeout = 0")
+                cur.execute("SELECT started_at, users FROM reconcile_checkpoints WHERE run_id = %s", (run_id,))
+                started_at, total = cur.fetchone()
+                params = {"run_id": run_id, "started_at": started_at}
+                report = diff_report(cur, params)
+                result = {"run_id": run_id, "source_users": total, "dry_run": dry_run, "diff": report}
+                if not dry_run:
+                    result["applied"] = apply_diff(cur, params, delete=delete)
+                    cur.execute("DELETE FROM reconcile_staging WHERE run_id = %s", (run_id,))
+                    cur.execute("UPDATE reconcile_checkpoints SET applied_at = now() WHERE run_id = %s", (run_id,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    logger.info("Eşitleme tamamlandı: %s", json.dumps(result, default=str))
+    return result
+
+def main(argv=None):
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Firebase Auth ile users tablosunu eşitler")
+    parser.add_argument("--dry-run", action="store_true", help="Farkları uygulamadan raporla")
+    parser.add_argument("--resume", metavar="RUN_ID", help="Yarıda kalan çalıştırmaya devam et")
+    parser.add_argument("--no-delete", action="store_true", help="Firebase'de olmayan kullanıcıları silme")
+    parser.add_argument("--page-size", type=int, default=1000, help="list_users sayfa boyutu (en fazla 1000)")
+    parser.add_argument("--prefetch", type=int, default=2, help="Bellekte bekletilecek en fazla sayfa")
+    parser.add_argument("--source-file", help="Firebase yerine JSONL dosyasından oku")
+    args = parser.parse_args(argv)
+
+    if args.source_file:
+        list_users = jsonl_user_source(args.source_file)
+    else:
+        from firebase_admin import auth
+        from firebase_service import FirebaseService
+        FirebaseService().initialize()
+        list_users = auth.list_users
+
+    result = reconcile(
+        list_users,
+        run_id=args.resume,
+        dry_run=args.dry_run,
+        delete=not args.no_delete,
+        page_size=args.page_size,
+        prefetch=args.prefetch
+    )
+    json.dump(result, sys.stdout, indent=2, default=str)
+    sys.stdout.write("\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import functools
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from admission import Overloaded
+from config import (
+    RETRY_BASE_DELAY, RETRY_MAX_DELAY, RETRY_MAX_ELAPSED,
+    BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT,
+)
+from metrics import REGISTRY, DEPENDENCY_RETRIES, BREAKER_TRANSITIONS, gauge
+
+logger = logging.getLogger(__name__)
+
+# Firebase ve veritabanı çağrıları için devre kesiciler ve yeniden deneme.
+# Zaman aşımları istemci katmanında uygulanır (Firebase httpTimeout,
+# PostgreSQL connect_timeout/statement_timeout); böylece yavaşlayan bir
+# bağımlılık thread'i serbest bırakılmadan bekletemez. Burada yalnızca
+# başarısızlıkların sayılması ve yeniden deneme kararı verilir.
+
+class CircuitOpenError(Overloaded):
+    """Devre kesici açıkken çağrı yapılmadan fırlatılır (503 + Retry-After)"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(name, "circuit_open", retry_after)
+        self.detail = f"Bağımlılık geçici olarak kullanılamıyor ({name}), lütfen daha sonra tekrar deneyin"
+
+class CircuitBreaker:
+    """Art arda başarısızlıklarda bağımlılığa giden çağrıları bir süre hızlıca reddeden devre kesici
+
+    closed: çağrılar geçer; failure_threshold art arda başarısızlıkta open olur.
+    open: çağrılar CircuitOpenError ile hemen reddedilir; reset_timeout sonunda half_open olur.
+    half_open: en fazla half_open_max_calls deneme çağrısı geçer; başarılıysa
+    closed, başarısızsa yeniden open olur.
+
+    Args:
+        name (str): Bağımlılık adı ("firebase" veya "db")
+        is_failure (callable): İstisnanın bağımlılık arızası sayılıp sayılmayacağı;
+            arıza sayılmayan istisnalar (ör. kullanıcı bulunamadı) başarılı yanıttır
+        is_ignored (callable, optional): Bağımlılığa ulaşılamadan oluşan ve
+            sonucu hiçbir yöne etkilememesi gereken istisnalar (ör. havuz zaman aşımı)
+        failure_threshold (int): Devreyi açan art arda başarısızlık sayısı
+        reset_timeout (float): Açık devrenin deneme çağrısına izin vermeden önce bekleyeceği süre (saniye)
+        half_open_max_calls (int): Yarı açık durumda aynı anda izin verilen deneme çağrısı
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, is_failure, is_ignored=None, failure_threshold=5, reset_timeout=30.0,
+                 half_open_max_calls=1):
+        self.name = name
+        self.is_failure = is_failure
+        self.is_ignored = is_ignored
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._rejected = 0
+
+    def _transition(self, state):
+        # Kilit altında çağrılır
+        if state == self._state:
+            return
+        logger.warning("Devre kesici %s: %s -> %s", self.name, self._state, state)
+        self._state = state
+        BREAKER_TRANSITIONS.inc(dependency=self.name, state=state)
+        if state == self.OPEN:
+            self._opened_at = time.monotonic()
+        if state != self.HALF_OPEN:
+            self._probes = 0
+
+    def before_call(self):
+        """Çağrıya izin verilip verilmeyeceğine karar verir
+
+        Raises:
+            CircuitOpenError: Devre açıksa veya yarı açık durumda deneme kotası doluysa
+        """
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            if self._state == self.OPEN:
+                remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+                if remaining > 0:
+                    self._rejected += 1
+                    raise CircuitOpenError(self.name, remaining)
+                self._transition(self.HALF_OPEN)
+            if self._state == self.HALF_OPEN:
+                if self._probes >= self.half_open_max_calls:
+                    self._rejected += 1
+                    raise CircuitOpenError(self.name, 1.0)
+                self._probes += 1
+
+    def record_success(self):
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            self._failures = 0
+            if self._state == self.HALF_OPEN:
+                self._transition(self.CLOSED)
+
+    def record_failure(self):
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._transition(self.OPEN)
+
+    def record_ignored(self):
+        """Sonucu belirsiz çağrının yarı açık deneme hakkını geri verir"""
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def record(self, exc):
+        """Çağrının sonucunu kaydeder; exc None ise başarılıdır"""
+        if exc is None:
+            self.record_success()
+        elif self.is_ignored is not None and self.is_ignored(exc):
+            self.record_ignored()
+        elif self.is_failure(exc):
+            self.record_failure()
+        else:
+            self.record_success()
+
+    @contextmanager
+    def guard(self):
+        """Bloğu devre kesiciden geçirir ve sonucunu kaydeder"""
+        self.before_call()
+        try:
+            yield
+        except BaseException as e:
+            self.record(e)
+            raise
+        else:
+            self.record(None)
+
+    def stats(self):
+        with self._lock:
+            state = self._state
+            if state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                # Sonraki çağrı deneme olarak geçecek
+                state = self.HALF_OPEN
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "rejected_total": self._rejected,
+            }
+
+class RetryPolicy:
+    """Yalnızca idempotent çağrılar için tam jitter'lı üstel geri çekilmeli yeniden deneme
+
+    Args:
+        name (str): Bağımlılık adı (metrik etiketi)
+        is_retryable (callable): İstisnanın yeniden denenip denenmeyeceği
+        attempts (int): İlk çağrı dahil en fazla deneme sayısı
+        base_delay (float): İlk bekleme üst sınırı (saniye); her denemede iki katına çıkar
+        max_delay (float): Tek bekleme için üst sınır (saniye)
+        max_elapsed (float): Bu süre dolduktan sonra yeni deneme başlatılmaz (saniye)
+    """
+
+    def __init__(self, name, is_retryable, attempts=3, base_delay=RETRY_BASE_DELAY,
+                 max_delay=RETRY_MAX_DELAY, max_elapsed=RETRY_MAX_ELAPSED):
+        self.name = name
+        self.is_retryable = is_retryable
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_elapsed = max_elapsed
+
+    def call(self, call, func, *args, **kwargs):
+        """func'ı çağırır; yeniden denenebilir hatalarda bekleyip tekrar dener
+
+        Args:
+            call (str): Çağrı adı (log ve metrik etiketi)
+            func (callable): Çağrılacak fonksiyon
+        """
+        start = time.monotonic()
+        attempt = 1
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                if attempt >= self.attempts or not self.is_retryable(e):
+                    raise
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+                if time.monotonic() - start + delay > self.max_elapsed:
+                    raise
+                logger.warning("%s çağrısı başarısız (%s/%s), %.2f sn sonra yeniden denenecek: %s",
+                               call, attempt, self.attempts, delay, e)
+                DEPENDENCY_RETRIES.inc(dependency=self.name, call=call)
+                time.sleep(delay)
+                attempt += 1
+
+    def wrap(self, call):
+        """Fonksiyonu bu politikayla yeniden deneyen bir dekoratör döndürür"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                return self.call(call, func, *args, **kwargs)
+            return wrapper
+        return decorator
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def circuit_breaker(name, is_failure, is_ignored=None):
+    """Verilen bağımlılık için devre kesiciyi oluşturur veya mevcut olanı döndürür"""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(
+                name, is_failure, is_ignored,
+                failure_threshold=BREAKER_FAILURE_THRESHOLD,
+                reset_timeout=BREAKER_RESET_TIMEOUT
+            )
+        return breaker
+
+def get_breaker_stats():
+    """Bağımlılık başına devre kesici durumunu döndürür"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.stats() for breaker in breakers}
+
+_BREAKER_STATE = gauge("circuit_breaker_state", "Devre kesici durumu (0 closed, 1 half_open, 2 open)", ("dependency",))
+_STATE_VALUES = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+
+@REGISTRY.register_collector
+def _collect_breaker_metrics():
+    for name, stats in get_breaker_stats().items():
+        _BREAKER_STATE.set(_STATE_VALUES[stats["state"]], dependency=name)
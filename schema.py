@@ -0,0 +1,478 @@
+"""users tablosunun şemasını oluşturur ve doğrular
+
+Uygulama açılışında ısınma adımı olarak çalışır; ayrıca komut satırından
+kullanılabilir:
+
+    python schema.py bootstrap    # tablo, kolonlar ve indeksleri oluştur, sonra doğrula
+    python schema.py verify       # yalnızca doğrula; eksik varsa 1 ile çıkar
+
+Her webhook `firebase_uid` ile, e-posta sorguları `lower(email)` ile satır arar;
+bu indeksler yoksa büyük bir tabloda her istek sıralı taramaya dönüşür.
+Doğrulama bu indeksler eksik veya geçersizse (yarıda kalmış bir
+`CREATE INDEX CONCURRENTLY`) SchemaError fırlatır ve sıcak yoldaki hazır
+ifadelerin (database._PREPARED_STATEMENTS) hazırlanabildiğini denetler.
+CHANGES_ENABLED açıkken değişiklik akışının tablosu ve tetikleyicisi de
+oluşturulur ve doğrulanır; kapalıyken tetikleyiciler kaldırılır.
+Firebase + PostgreSQL çift yazımlarının niyet tablosu (dual_write_intents) ve
+e-posta sorgusunun profil tablosu (user_profiles) her zaman oluşturulur.
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from config import CHANGES_ENABLED, SCHEMA_LOCK_TIMEOUT
+from database import get_connection, prepare_statements
+from logging_setup import configure_logging
+
+logger = logging.getLogger(__name__)
+
+class SchemaError(Exception):
+    """Beklenen tablo, kolon veya indeks eksik olduğunda fırlatılır"""
+
+class SchemaLockTimeoutError(SchemaError):
+    """Şema kilidi SCHEMA_LOCK_TIMEOUT içinde alınamadığında fırlatılır"""
+
+USERS_DDL = """
+    CREATE TABLE IF NOT EXISTS users (
+        id SERIAL PRIMARY KEY,
+        firebase_uid TEXT NOT NULL UNIQUE,
+        email TEXT,
+        display_name TEXT,
+        source_version BIGINT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP
+    )
+"""
+
+REQUIRED_USER_COLUMNS = ("id", "firebase_uid", "email", "display_name", "source_version", "created_at", "updated_at")
+
+# Uygulamanın oluşturduğu indeksler; yarıda kalan CONCURRENTLY denemeleri
+# geçersiz (indisvalid = false) olarak kalır ve yeniden oluşturulmadan önce silinir
+_USER_INDEXES = ("users_firebase_uid_key", "users_email_lower_idx", "users_changed_at_idx")
+
+# İşlenmiş webhook olayları: tekrar teslimleri ayıklar. Silme olayı kayıtları
+# saklama süresi boyunca o kullanıcı için daha eski create/update olaylarını engeller.
+_WEBHOOK_SCHEMA_DDL = """
+    ALTER TABLE users ADD COLUMN IF NOT EXISTS source_version BIGINT;
+    CREATE TABLE IF NOT EXISTS processed_events (
+        event_id TEXT PRIMARY KEY,
+        firebase_uid TEXT NOT NULL,
+        event_type TEXT NOT NULL,
+        version BIGINT,
+        processed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    CREATE INDEX IF NOT EXISTS processed_events_processed_at_idx ON processed_events (processed_at);
+    CREATE INDEX IF NOT EXISTS processed_events_tombstone_idx ON processed_events (firebase_uid, version)
+        WHERE event_type = 'delete';
+"""
+
+# Değişiklik akışı: users'taki her satır değişikliği user_changes'e bir kayıt
+# ekler ve aynı transaction'da NOTIFY ile yayınlanır (bildirim commit'te
+# gönderilir, geri alınan transaction'lar yayınlanmaz). İçeriği değişmeyen
+# UPDATE'ler kaydedilmez. Bildirim içeriği ile tablodan okunan olay aynı
+# fonksiyonla (user_change_payload) üretilir.
+CHANGES_CHANNEL = "user_changes"
+
+_CHANGELOG_DDL = f"""
+    CREATE TABLE IF NOT EXISTS user_changes (
+        seq BIGSERIAL PRIMARY KEY,
+        op TEXT NOT NULL,
+        firebase_uid TEXT NOT NULL,
+        changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    CREATE INDEX IF NOT EXISTS user_changes_changed_at_idx ON user_changes (changed_at);
+    CREATE OR REPLACE FUNCTION user_change_payload(c user_changes) RETURNS text AS $$
+        SELECT json_build_object('seq', c.seq, 'op', c.op, 'uid', c.firebase_uid, 'changed_at', c.changed_at)::text
+    $$ LANGUAGE sql STABLE;
+    CREATE OR REPLACE FUNCTION record_user_change() RETURNS trigger AS $$
+    DECLARE
+        change user_changes%ROWTYPE;
+    BEGIN
+        INSERT INTO user_changes (op, firebase_uid)
+        VALUES (lower(TG_OP), CASE WHEN TG_OP = 'DELETE' THEN OLD.firebase_uid ELSE NEW.firebase_uid END)
+        RETURNING * INTO change;
+        PERFORM pg_notify('{CHANGES_CHANNEL}', user_change_payload(change));
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    DO $$
+    BEGIN
+        -- Tetikleyici her açılışta yeniden oluşturulmaz; DROP/CREATE tabloyu kilitler
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgrelid = 'users'::regclass AND tgname = 'users_change_log') THEN
+            CREATE TRIGGER users_change_log AFTER INSERT OR DELETE ON users
+                FOR EACH ROW EXECUTE PROCEDURE record_user_change();
+        END IF;
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgrelid = 'users'::regclass AND tgname = 'users_change_log_update') THEN
+            CREATE TRIGGER users_change_log_update AFTER UPDATE ON users
+                FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE PROCEDURE record_user_change();
+        END IF;
+    END;
+    $$;
+"""
+
+_CHANGELOG_TRIGGERS = ("users_change_log", "users_change_log_update")
+
+# Akış kapatıldığında tetikleyiciler kalırsa her yazım user_changes'e kayıt
+# ekler ve NOTIFY gönderir; tabloyu budayan ChangeHub da çalışmaz.
+# DROP TRIGGER tabloyu kilitlediği için yalnızca tetikleyici varsa çalışır.
+_DROP_CHANGELOG_DDL = """
+    DO $$
+    DECLARE
+        name text;
+    BEGIN
+        FOR name IN
+            SELECT tgname FROM pg_trigger
+            WHERE tgrelid = 'users'::regclass AND tgname IN ('users_change_log', 'users_change_log_update')
+        LOOP
+            EXECUTE format('DROP TRIGGER %I ON users', name);
+        END LOOP;
+    END;
+    $$;
+"""
+
+# Çift yazım niyet kayıtları: Firebase ve users yazımı birlikte tamamlanınca
+# aynı transaction'da silinir; kalan kayıtlar write_repair tarafından onarılır
+_DUAL_WRITE_DDL = """
+    CREATE TABLE IF NOT EXISTS dual_write_intents (
+        id BIGSERIAL PRIMARY KEY,
+        op TEXT NOT NULL,
+        firebase_uid TEXT NOT NULL,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        next_attempt_at TIMESTAMPTZ NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT
+    );
+    CREATE INDEX IF NOT EXISTS dual_write_intents_next_attempt_idx ON dual_write_intents (next_attempt_at);
+    CREATE INDEX IF NOT EXISTS dual_write_intents_uid_idx ON dual_write_intents (firebase_uid);
+"""
+
+# E-posta sorgusunun profil alanları: users tablosunda tutulmayan alanlar
+# Firebase'den okununca satırın o anki sürümüyle (user_version) kaydedilir.
+# Satır güncellenince sürüm değişir ve kayıt kendiliğinden geçersiz olur.
+_USER_PROFILES_DDL = """
+    CREATE TABLE IF NOT EXISTS user_profiles (
+        firebase_uid TEXT PRIMARY KEY REFERENCES users (firebase_uid) ON DELETE CASCADE,
+        phone_number TEXT,
+        photo_url TEXT,
+        disabled BOOLEAN NOT NULL,
+        user_version TIMESTAMP NOT NULL,
+        synced_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+def _leading_column_indexes(cur, table, column):
+    """Tablonun ilk kolonu verilen kolon olan geçerli indekslerini döndürür"""
+    cur.execute(
+        """
+        SELECT c.relname, i.indisunique, i.indnatts, i.indpred IS NULL AS total
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+        WHERE i.indrelid = %s::regclass
+          AND i.indisvalid
+          AND a.attname = %s
+        """,
+        (table, column)
+    )
+    return [
+        {"name": name, "unique": unique, "columns": columns, "total": total}
+        for name, unique, columns, total in cur.fetchall()
+    ]
+
+def _unique_uid_index(cur):
+    for index in _leading_column_indexes(cur, "users", "firebase_uid"):
+        if index["unique"] and index["columns"] == 1 and index["total"]:
+            return index["name"]
+    return None
+
+def _email_index(cur):
+    """E-posta sorgusunun kullandığı lower(email) ifade indeksinin adını döndürür"""
+    cur.execute(
+        """
+        SELECT c.relname
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = 'users'::regclass
+          AND i.indisvalid
+          AND i.indpred IS NULL
+          AND i.indkey[0] = 0
+          AND pg_get_indexdef(i.indexrelid, 1, true) = 'lower(email)'
+        """
+    )
+    row = cur.fetchone()
+    return row[0] if row else None
+
+@contextmanager
+def _without_statement_timeout(cur):
+    """Büyük tablolarda dakikalar sürebilen CREATE INDEX için oturumun zaman aşımını kaldırır"""
+    cur.execute("SET statement_timeout = 0")
+    try:
+        yield
+    finally:
+        if not cur.connection.closed:
+            cur.execute("RESET statement_timeout")
+
+@contextmanager
+def _advisory_lock(cur, name, timeout, poll_interval=1.0):
+    """Oturum düzeyinde advisory lock alır; başka bir süreç tutuyorsa bırakmasını bekler
+
+    Kilit pg_try_advisory_lock ile yoklanır. Bloklayan pg_advisory_lock
+    bekleyen oturumun açık snapshot'ı yüzünden diğer süreçteki CREATE INDEX
+    CONCURRENTLY'yi bekletir ve kilitlenmeye yol açar. Bağlantı autocommit
+    modunda olmalıdır.
+
+    Raises:
+        SchemaLockTimeoutError: Kilit timeout saniye içinde alınamazsa
+    """
+    deadline = time.monotonic() + timeout
+    waited = False
+    while True:
+        cur.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (name,))
+        if cur.fetchone()[0]:
+            break
+        if time.monotonic() >= deadline:
+            raise SchemaLockTimeoutError(f"Şema kilidi ({name}) {timeout:g} sn içinde alınamadı")
+        if not waited:
+            logger.info("Başka bir süreç şema kilidini (%s) tutuyor, bekleniyor", name)
+            waited = True
+        time.sleep(poll_interval)
+    try:
+        yield
+    finally:
+        if not cur.connection.closed:
+            cur.execute("SELECT pg_advisory_unlock(hashtext(%s))", (name,))
+
+def ensure_users_table(cur):
+    """users tablosunu yoksa oluşturur"""
+    cur.execute(USERS_DDL)
+
+def ensure_user_indexes(cur):
+    """ON CONFLICT (firebase_uid) ifadelerinin dayandığı benzersiz indeksi, e-posta ve değişiklik zamanı indekslerini garanti eder
+
+    firebase_uid üzerinde tek kolonlu benzersiz bir indeks (veya UNIQUE kısıtı)
+    yoksa tabloyu kilitlemeden CONCURRENTLY oluşturulur. Tabloda yinelenen
+    uid'ler varsa indeks oluşturulamaz ve hata fırlatılır.
+
+    bootstrap_schema'nın şema kilidi altında çalışır. Böylece başka bir
+    worker'ın hâlâ oluşturduğu (henüz geçersiz görünen) indeks silinmez ve
+    eşzamanlı oluşturmalar birbirini kilitlemez.
+    """
+    try:
+        with _without_statement_timeout(cur):
+            cur.execute(
+                """
+                SELECT c.relname
+                FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE i.indrelid = 'users'::regclass
+                  AND NOT i.indisvalid
+                  AND c.relname = ANY(%s)
+                """,
+                (list(_USER_INDEXES),)
+            )
+            for (name,) in cur.fetchall():
+                logger.warning("Geçersiz indeks yeniden oluşturulacak: %s", name)
+                cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+            if not _unique_uid_index(cur):
+                logger.info("users.firebase_uid benzersiz indeksi oluşturuluyor")
+                cur.execute("DROP INDEX CONCURRENTLY IF EXISTS users_firebase_uid_key")
+                cur.execute("CREATE UNIQUE INDEX CONCURRENTLY users_firebase_uid_key ON users (firebase_uid)")
+            # Büyük/küçük harf duyarsız e-posta sorguları için
+            if not _email_index(cur):
+                logger.info("users lower(email) indeksi oluşturuluyor")
+                cur.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS users_email_lower_idx ON users (lower(email))")
+            # GET /users?updated_since=... ile artımlı okumalar için
+            cur.execute(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS users_changed_at_idx ON users ((COALESCE(updated_at, created_at)))"
+            )
+    except Exception as e:
+        logger.error("İndeks oluşturma hatası: %s", e)
+        raise
+
+def ensure_webhook_schema(cur):
+    """users.source_version kolonunu ve processed_events tablosunu oluşturur"""
+    try:
+        cur.execute(_WEBHOOK_SCHEMA_DDL)
+    except Exception as e:
+        logger.error("Webhook şeması oluşturma hatası: %s", e)
+        raise
+
+def ensure_dual_write_schema(cur):
+    """dual_write_intents tablosunu oluşturur"""
+    try:
+        cur.execute(_DUAL_WRITE_DDL)
+    except Exception as e:
+        logger.error("Çift yazım şeması oluşturma hatası: %s", e)
+        raise
+
+def ensure_user_profiles(cur):
+    """user_profiles tablosunu oluşturur; users.firebase_uid benzersiz indeksine dayanır"""
+    try:
+        cur.execute(_USER_PROFILES_DDL)
+    except Exception as e:
+        logger.error("Profil tablosu oluşturma hatası: %s", e)
+        raise
+
+def ensure_changelog(cur):
+    """user_changes tablosunu, kayıt fonksiyonunu ve users tetikleyicilerini oluşturur"""
+    try:
+        cur.execute(_CHANGELOG_DDL)
+    except Exception as e:
+        logger.error("Değişiklik kaydı şeması oluşturma hatası: %s", e)
+        raise
+
+def drop_changelog_triggers(cur):
+    """users tetikleyicilerini kaldırır; user_changes tablosu ve kayıtları bırakılır"""
+    try:
+        cur.execute(_DROP_CHANGELOG_DDL)
+    except Exception as e:
+        logger.error("Değişiklik kaydı tetikleyicilerini kaldırma hatası: %s", e)
+        raise
+
+def bootstrap_schema():
+    """Tabloyu, eksik kolonları ve indeksleri oluşturur; tüm adımlar tekrar çalıştırılabilir
+
+    Her worker açılışta bu adımı çalıştırır. Tüm adımlar tek bir advisory lock
+    altında aynı oturumda yürür: eşzamanlı CREATE OR REPLACE FUNCTION ve
+    tetikleyici oluşturma birbiriyle çakışmaz, kilidi bekleyen worker şemayı
+    hazır bulur.
+
+    Raises:
+        SchemaLockTimeoutError: Başka bir worker kilidi SCHEMA_LOCK_TIMEOUT'tan uzun tutarsa
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur, _advisory_lock(cur, "schema.bootstrap", SCHEMA_LOCK_TIMEOUT):
+            ensure_users_table(cur)
+            ensure_webhook_schema(cur)
+            ensure_dual_write_schema(cur)
+            ensure_user_indexes(cur)
+            ensure_user_profiles(cur)
+            if CHANGES_ENABLED:
+                ensure_changelog(cur)
+            else:
+                drop_changelog_triggers(cur)
+    logger.info("Veritabanı şeması hazır")
+
+def verify_schema():
+    """Tablonun, kolonların, sıcak yol indekslerinin ve hazır ifadelerin varlığını doğrular
+
+    users_changed_at_idx eksikse yalnızca uyarı verilir; bu indeks yalnızca
+    GET /users?updated_since=... sorgularını hızlandırır.
+
+    Returns:
+        dict: Bulunan indeksler, hazırlanan ifadeler ve uyarılar
+
+    Raises:
+        SchemaError: Tablo, kolon, indeks eksikse veya ifadeler hazırlanamıyorsa
+    """
+    problems = []
+    warnings = []
+    report = {"indexes": {}, "prepared_statements": [], "warnings": warnings}
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT to_regclass('users') IS NOT NULL,
+                       to_regclass('processed_events') IS NOT NULL,
+                       to_regclass('dual_write_intents') IS NOT NULL,
+                       to_regclass('user_profiles') IS NOT NULL
+                """
+            )
+            has_users, has_processed_events, has_intents, has_profiles = cur.fetchone()
+            if not has_users:
+                raise SchemaError("users tablosu bulunamadı")
+            if not has_processed_events:
+                problems.append("processed_events tablosu bulunamadı")
+            if not has_intents:
+                problems.append("dual_write_intents tablosu bulunamadı")
+            if not has_profiles:
+                problems.append("user_profiles tablosu bulunamadı")
+
+            cur.execute(
+                """
+                SELECT column_name FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = 'users'
+                """
+            )
+            columns = {row[0] for row in cur.fetchall()}
+            missing = [column for column in REQUIRED_USER_COLUMNS if column not in columns]
+            if missing:
+                problems.append(f"users tablosunda eksik kolonlar: {', '.join(missing)}")
+
+            uid_index = _unique_uid_index(cur)
+            if uid_index:
+                report["indexes"]["firebase_uid"] = uid_index
+            else:
+                problems.append("users.firebase_uid üzerinde geçerli, tek kolonlu benzersiz indeks yok")
+            email_index = _email_index(cur)
+            if email_index:
+                report["indexes"]["email"] = email_index
+            else:
+                problems.append("users lower(email) üzerinde geçerli indeks yok")
+
+            cur.execute(
+                """
+                SELECT i.indisvalid FROM pg_index i
+                WHERE i.indexrelid = to_regclass('users_changed_at_idx')
+                """
+            )
+            row = cur.fetchone()
+            if row and row[0]:
+                report["indexes"]["changed_at"] = "users_changed_at_idx"
+            else:
+                warnings.append("users_changed_at_idx yok veya geçersiz; updated_since sorguları sıralı tarama yapar")
+
+            if CHANGES_ENABLED:
+                cur.execute(
+                    """
+                    SELECT to_regclass('user_changes') IS NOT NULL,
+                           ARRAY(SELECT tgname::text FROM pg_trigger
+                                 WHERE tgrelid = 'users'::regclass AND tgname = ANY(%s) AND tgenabled <> 'D')
+                    """,
+                    (list(_CHANGELOG_TRIGGERS),)
+                )
+                has_changelog, triggers = cur.fetchone()
+                missing = [name for name in _CHANGELOG_TRIGGERS if name not in triggers]
+                if not has_changelog:
+                    problems.append("user_changes tablosu bulunamadı")
+                elif missing:
+                    problems.append(f"users üzerinde eksik veya devre dışı tetikleyiciler: {', '.join(missing)}")
+                else:
+                    report["changelog_triggers"] = list(_CHANGELOG_TRIGGERS)
+
+        if not problems:
+            try:
+                report["prepared_statements"] = prepare_statements(conn)
+            except Exception as e:
+                problems.append(f"Hazır ifadeler oluşturulamadı: {e}")
+
+    for warning in warnings:
+        logger.warning("Şema uyarısı: %s", warning)
+    if problems:
+        for problem in problems:
+            logger.error("Şema hatası: %s", problem)
+        raise SchemaError("; ".join(problems))
+    return report
+
+def main(argv=None):
+    configure_logging()
+    parser = argparse.ArgumentParser(description="users tablosu şemasını oluşturur veya doğrular")
+    parser.add_argument("command", choices=("bootstrap", "verify"), help="bootstrap: oluştur ve doğrula, verify: yalnızca doğrula")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "bootstrap":
+            bootstrap_schema()
+        report = verify_schema()
+    except SchemaError as e:
+        json.dump({"status": "error", "error": str(e)}, sys.stdout, indent=2, ensure_ascii=False)
+        sys.stdout.write("\n")
+        sys.exit(1)
+    json.dump({"status": "ok", **report}, sys.stdout, indent=2, ensure_ascii=False)
+    sys.stdout.write("\n")
+
+if __name__ == "__main__":
+    main()
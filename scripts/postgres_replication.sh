@@ -0,0 +1,4 @@
+#!/bin/bash
+# docker-compose.replica.yml: replikanın pg_basebackup ve akış bağlantısına izin verir
+set -e
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
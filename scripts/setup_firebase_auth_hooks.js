@@ -7,30 +7,117 @@ const SERVICE_URL = 'https://apims.onrender.com';
 // Güvenli bir webhook anahtarı - Render'da aynı değeri kullanmalısınız
 const WEBHOOK_SECRET = 'sizin-gizli-webhook-anahtariniz';
 
-// Kullanıcı oluşturulduğunda tetiklenir
-exports.userCreated = functions.auth.user().onCreate((user) => {
-  console.log('Yeni kullanıcı oluşturuldu:', user.uid);
-  
-  return fetch(`${SERVICE_URL}/webhook/auth`, {
+// Toplu gönderim modu: true ise aynı function instance'ında aynı anda işlenen
+// olaylar tek bir POST /webhook/auth/batch isteğiyle gönderilir.
+//
+// DİKKAT: Aşağıdaki functions.auth.user() tetikleyicileri 1. nesil
+// fonksiyonlardır ve her instance aynı anda yalnızca bir olay işler; instance
+// başına bellekte biriken kuyruk hiçbir zaman birden fazla olay içermez. Bu
+// dosyadaki tetikleyicilerle BATCH_MODE her kullanıcı için yine ayrı bir POST
+// gönderir (yalnızca BATCH_MAX_WAIT_MS kadar gecikir), bu yüzden false kalmalıdır.
+// Toplu gönderim yalnızca sendEvent'i eşzamanlı çağrı alan bir ortamdan
+// kullanırken işe yarar: concurrency > 1 olan 2. nesil bir fonksiyon (ör.
+// olayları Pub/Sub/Eventarc üzerinden alan bir aktarıcı) veya olayları bir
+// kuyruktan toplu okuyan bir tüketici.
+const BATCH_MODE = false;
+// Bir toplu istekte gönderilecek en fazla olay sayısı
+const BATCH_MAX_SIZE = 100;
+// İlk olaydan sonra toplu isteğin gönderilmeden önce bekleneceği en uzun süre (ms)
+const BATCH_MAX_WAIT_MS = 200;
+
+function postJson(path, payload) {
+  return fetch(`${SERVICE_URL}${path}`, {
     method: 'POST',
     headers: {
       'Content-Type': 'application/json',
       'X-Webhook-Signature': WEBHOOK_SECRET
     },
-    body: JSON.stringify({
-      event_type: 'create',
-      user_data: {
-        uid: user.uid,
-        email: user.email,
-        display_name: user.displayName
-      }
-    })
+    body: JSON.stringify(payload)
   })
   .then(response => {
     if (!response.ok) {
       throw new Error(`HTTP hata! Durum: ${response.status}`);
     }
     return response.json();
+  });
+}
+
+let pendingEvents = [];
+let flushTimer = null;
+let batchWarned = false;
+
+// Biriken olayları tek istekte gönderir ve her olayın promise'ini kendi sonucuyla çözer
+function flushBatch() {
+  if (flushTimer) {
+    clearTimeout(flushTimer);
+    flushTimer = null;
+  }
+  const batch = pendingEvents;
+  pendingEvents = [];
+  if (batch.length === 0) {
+    return;
+  }
+
+  postJson('/webhook/auth/batch', batch.map(item => item.event))
+    .then(data => {
+      batch.forEach((item, index) => {
+        const result = data.results[index];
+        if (result && result.status === 'success') {
+          item.resolve(result);
+        } else {
+          item.reject(new Error(`Olay işlenemedi: ${result ? result.message : 'sonuç yok'}`));
+        }
+      });
+    })
+    .catch(error => {
+      batch.forEach(item => item.reject(error));
+    });
+}
+
+// Olayı gönderir; toplu modda olay kuyruğa eklenir ve toplu istek tamamlanınca çözülür.
+// Function, promise çözülene kadar beklediği için olay instance kapanmadan gönderilir.
+function sendEvent(event) {
+  if (!BATCH_MODE) {
+    return postJson('/webhook/auth', event);
+  }
+
+  return new Promise((resolve, reject) => {
+    pendingEvents.push({ event, resolve, reject });
+    if (!batchWarned && pendingEvents.length === 1 && !process.env.K_CONFIGURATION) {
+      // 1. nesil fonksiyonlarda (K_CONFIGURATION tanımsız) olaylar birikmez
+      batchWarned = true;
+      console.warn('BATCH_MODE 1. nesil fonksiyonda etkisiz: her olay ayrı bir toplu istekle gönderilecek');
+    }
+    if (pendingEvents.length >= BATCH_MAX_SIZE) {
+      flushBatch();
+    } else if (!flushTimer) {
+      flushTimer = setTimeout(flushBatch, BATCH_MAX_WAIT_MS);
+    }
+  });
+}
+
+// Olay kimliği ve sürümü: Firebase aynı olayı yeniden denediğinde eventId
+// değişmez, böylece servis tekrarları ayıklar; olay zamanı (ms) sürüm olarak
+// kullanılır ve sırası bozuk gelen eski olaylar daha yeni veriyi ezmez
+function eventMeta(context) {
+  return {
+    event_id: context.eventId,
+    version: Date.parse(context.timestamp)
+  };
+}
+
+// Kullanıcı oluşturulduğunda tetiklenir
+exports.userCreated = functions.auth.user().onCreate((user, context) => {
+  console.log('Yeni kullanıcı oluşturuldu:', user.uid);
+  
+  return sendEvent({
+    ...eventMeta(context),
+    event_type: 'create',
+    user_data: {
+      uid: user.uid,
+      email: user.email,
+      display_name: user.displayName
+    }
   })
   .then(data => {
     console.log('Kullanıcı veritabanına kaydedildi:', data);
@@ -43,31 +130,19 @@ exports.userCreated = functions.auth.user().onCreate((user) => {
 });
 
 // Kullanıcı güncellendiğinde tetiklenir
-exports.userUpdated = functions.auth.user().onUpdate((change) => {
+exports.userUpdated = functions.auth.user().onUpdate((change, context) => {
   const before = change.before;
   const after = change.after;
   console.log('Kullanıcı güncellendi:', after.uid);
   
-  return fetch(`${SERVICE_URL}/webhook/auth`, {
-    method: 'POST',
-    headers: {
-      'Content-Type': 'application/json',
-      'X-Webhook-Signature': WEBHOOK_SECRET
-    },
-    body: JSON.stringify({
-      event_type: 'update',
-      user_data: {
-        uid: after.uid,
-        email: after.email,
-        display_name: after.displayName
-      }
-    })
-  })
-  .then(response => {
-    if (!response.ok) {
-      throw new Error(`HTTP hata! Durum: ${response.status}`);
+  return sendEvent({
+    ...eventMeta(context),
+    event_type: 'update',
+    user_data: {
+      uid: after.uid,
+      email: after.email,
+      display_name: after.displayName
     }
-    return response.json();
   })
   .then(data => {
     console.log('Kullanıcı veritabanında güncellendi:', data);
@@ -80,27 +155,15 @@ exports.userUpdated = functions.auth.user().onUpdate((change) => {
 });
 
 // Kullanıcı silindiğinde tetiklenir
-exports.userDeleted = functions.auth.user().onDelete((user) => {
+exports.userDeleted = functions.auth.user().onDelete((user, context) => {
   console.log('Kullanıcı silindi:', user.uid);
   
-  return fetch(`${SERVICE_URL}/webhook/auth`, {
-    method: 'POST',
-    headers: {
-      'Content-Type': 'application/json',
-      'X-Webhook-Signature': WEBHOOK_SECRET
-    },
-    body: JSON.stringify({
-      event_type: 'delete',
-      user_data: {
-        uid: user.uid
-      }
-    })
-  })
-  .then(response => {
-    if (!response.ok) {
-      throw new Error(`HTTP hata! Durum: ${response.status}`);
+  return sendEvent({
+    ...eventMeta(context),
+    event_type: 'delete',
+    user_data: {
+      uid: user.uid
     }
-    return response.json();
   })
   .then(data => {
     console.log('Kullanıcı veritabanından silindi:', data);
@@ -110,4 +173,4 @@ exports.userDeleted = functions.auth.user().onDelete((user) => {
     console.error('Webhook çağrısı başarısız:', error);
     throw error;
   });
-}); 
+});
@@ -0,0 +1,47 @@
+import dataclasses
+import json
+import logging
+from datetime import date, datetime
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+# Yanıtlar FastAPI'nin jsonable_encoder + json.dumps yolundan geçmeden
+# doğrudan bayta çevrilir. orjson kuruluysa dataclass (UserRecord), datetime
+# ve dict/list'leri C tarafında tek geçişte kodlar; kurulu değilse standart
+# json modülü aynı çıktıyı (boşluksuz, UTF-8) üretir.
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    logger.info("orjson bulunamadı, standart json kullanılacak")
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if dataclasses.is_dataclass(value):
+        # __slots__'lu kayıtlarda __dict__ yoktur; alanlar tek tek okunur
+        return {field.name: getattr(value, field.name) for field in dataclasses.fields(value)}
+    raise TypeError(f"{type(value).__name__} JSON'a dönüştürülemez")
+
+if orjson is not None:
+    def dumps(value):
+        """Değeri JSON olarak kodlar ve UTF-8 bayt döndürür"""
+        return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+else:
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_default)
+
+    def dumps(value):
+        """Değeri JSON olarak kodlar ve UTF-8 bayt döndürür"""
+        return _encoder.encode(value).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """İçeriği jsonable_encoder'a uğramadan serialization.dumps ile kodlayan yanıt sınıfı
+
+    Route'lar bu sınıfın örneğini doğrudan döndürdüğünde FastAPI yanıtı
+    yeniden doğrulamaz ve kodlamaz.
+    """
+
+    def render(self, content):
+        return dumps(content)
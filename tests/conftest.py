@@ -0,0 +1,45 @@
+import os
+import sys
+
+# Testler depo kökündeki düz modülleri (database, firebase_service, ...) içe aktarır
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import firebase_admin
+import pytest
+from firebase_admin import auth, credentials
+import firebase_service
+from benchmarks.fake_firebase import FakeFirebaseAuth, install, _PATCHED
+from firebase_service import FirebaseService
+from resilience import CircuitBreaker, RetryPolicy
+
+@pytest.fixture
+def fake(monkeypatch, tmp_path):
+    """Sahte Firebase'i kurar; servis, devre kesici ve yeniden deneme politikası test başına yenidir"""
+    for name in _PATCHED:
+        monkeypatch.setattr(auth, name, getattr(auth, name))
+    monkeypatch.setattr(credentials, "Certificate", credentials.Certificate)
+    monkeypatch.setattr(firebase_admin, "initialize_app", firebase_admin.initialize_app)
+    credentials_path = tmp_path / "firebase-credentials.json"
+    credentials_path.write_text("{}")
+    monkeypatch.setenv("FIREBASE_CREDENTIALS_PATH", str(credentials_path))
+    fake = install(FakeFirebaseAuth(latency=0, seed=1))
+    options = []
+    initialize_app = firebase_admin.initialize_app
+
+    def capture_initialize_app(credential=None, options_=None, name="[DEFAULT]"):
+        options.append(options_)
+        return initialize_app(credential, options_, name)
+
+    monkeypatch.setattr(firebase_admin, "initialize_app", capture_initialize_app)
+    fake.app_options = options
+
+    monkeypatch.setattr(firebase_service, "FIREBASE_CREDENTIALS_PATH", str(credentials_path))
+    monkeypatch.setattr(FirebaseService, "_instance", None)
+    breaker = CircuitBreaker("firebase", lambda exc: isinstance(exc, firebase_service._FIREBASE_FAILURES),
+                             failure_threshold=3, reset_timeout=0.05)
+    monkeypatch.setattr(firebase_service, "_firebase_breaker", breaker)
+    monkeypatch.setattr(firebase_service, "_firebase_retry", RetryPolicy(
+        "firebase", lambda exc: isinstance(exc, firebase_service._FIREBASE_RETRYABLE),
+        attempts=3, base_delay=0.001, max_delay=0.001, max_elapsed=5))
+    fake.breaker = breaker
+    return fake
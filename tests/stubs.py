@@ -0,0 +1,74 @@
+"""Testler için PostgreSQL bağlantı ve cursor taklitleri
+
+Gerçek veritabanı gerektirmez: çalıştırılan SQL ve parametreler kaydedilir,
+sonuçlar testin verdiği `respond(sql, params)` fonksiyonundan döner.
+"""
+from contextlib import contextmanager
+
+class StubCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.connection = conn
+        self._rows = []
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.conn.executed.append((sql, params))
+        if self.conn.fail_on is not None and self.conn.fail_on in sql:
+            raise self.conn.error
+        rows = self.conn.respond(sql, params) if self.conn.respond else None
+        self._rows = list(rows or [])
+        self.rowcount = len(self._rows)
+
+    def copy_expert(self, sql, file):
+        self.conn.copies.append((sql, file.read()))
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchmany(self, size):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+class StubConnection:
+    def __init__(self, respond=None, name="primary"):
+        self.name = name
+        self.respond = respond
+        self.executed = []
+        self.copies = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.autocommit = True
+        self.closed = False
+        self.fail_on = None
+        self.error = None
+        self.prepared = None
+
+    def cursor(self, *args, **kwargs):
+        return StubCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def sql(self):
+        return [sql for sql, _ in self.executed]
+
+def stub_get_connection(conn):
+    """database.get_connection yerine geçen, hep aynı bağlantıyı veren context manager"""
+    @contextmanager
+    def get_connection():
+        yield conn
+    return get_connection
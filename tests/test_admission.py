@@ -0,0 +1,42 @@
+import asyncio
+import admission
+from admission import AdmissionMiddleware
+
+class _Route:
+    def __init__(self, path):
+        self.path = path
+
+def _scope(path, client="10.0.0.1", forwarded=None):
+    headers = [(b"x-forwarded-for", forwarded.encode("latin-1"))] if forwarded else []
+    return {"type": "http", "method": "POST", "path": path, "client": (client, 1234), "headers": headers}
+
+def _retry_after(middleware, monkeypatch, path, **scope):
+    monkeypatch.setattr(admission, "_match_route", lambda s: _Route(path))
+    return asyncio.run(middleware._retry_after(_scope(path, **scope)))
+
+def test_webhook_routes_are_not_limited_per_client(monkeypatch):
+    middleware = AdmissionMiddleware(app=None)
+    for path in ("/webhook/auth", "/webhook/auth/batch"):
+        assert admission._route_limits(f"POST {path}")[0] == 0
+        assert all(_retry_after(middleware, monkeypatch, path) == 0 for _ in range(200))
+
+def test_unauthenticated_create_is_limited_per_client(monkeypatch):
+    middleware = AdmissionMiddleware(app=None)
+    waits = [_retry_after(middleware, monkeypatch, "/users") for _ in range(6)]
+    assert waits[:5] == [0.0] * 5
+    assert waits[5] > 0
+
+def test_clients_behind_proxy_get_separate_buckets(monkeypatch):
+    monkeypatch.setattr(admission, "RATE_LIMIT_PROXY_HOPS", 1)
+    middleware = AdmissionMiddleware(app=None)
+    for _ in range(5):
+        assert _retry_after(middleware, monkeypatch, "/users", forwarded="203.0.113.1") == 0
+    assert _retry_after(middleware, monkeypatch, "/users", forwarded="203.0.113.1") > 0
+    # Aynı vekil adresinden gelen başka bir istemci etkilenmez
+    assert _retry_after(middleware, monkeypatch, "/users", forwarded="203.0.113.2") == 0
+
+def test_client_address_uses_last_trusted_hop(monkeypatch):
+    scope = _scope("/users", client="10.0.0.1", forwarded="1.1.1.1, 203.0.113.9")
+    assert admission._client_address(scope) == "10.0.0.1"
+    monkeypatch.setattr(admission, "RATE_LIMIT_PROXY_HOPS", 1)
+    assert admission._client_address(scope) == "203.0.113.9"
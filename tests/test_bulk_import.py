@@ -0,0 +1,89 @@
+import asyncio
+import pytest
+import firebase_service
+from firebase_service import FirebaseService
+
+class _ImportResult:
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+
+class _ImportError:
+    def __init__(self, index, reason):
+        self.index = index
+        self.reason = reason
+
+@pytest.fixture
+def bulk(monkeypatch):
+    """Veritabanı kontrolünü, eklemeyi ve import_users çağrısını taklit eder"""
+    state = {"existing_uids": set(), "existing_emails": set(), "taken_uids": set(),
+             "checks": [], "inserted": [], "imports": [], "import_errors": [], "started": 0}
+
+    async def find_existing(uids, emails):
+        state["started"] += 1
+        state["checks"].append((list(uids), list(emails)))
+        return state["existing_uids"] & set(uids), state["existing_emails"] & {e.lower() for e in emails}
+
+    async def insert_imported(users):
+        state["inserted"].append([user["uid"] for user in users])
+        return {user["uid"] for user in users} - state["taken_uids"]
+
+    def call_firebase(self, call, func, records, hash_alg=None):
+        state["imports"].append(([record.uid for record in records], hash_alg is not None))
+        return _ImportResult(state["import_errors"])
+
+    monkeypatch.setattr(firebase_service, "find_existing_users_async", find_existing)
+    monkeypatch.setattr(firebase_service, "insert_imported_users_async", insert_imported)
+    monkeypatch.setattr(firebase_service, "BULK_IMPORT_HASH_ROUNDS", 1000)
+    monkeypatch.setattr(FirebaseService, "_call_firebase", call_firebase)
+    return state
+
+def _users(count, password=None):
+    return [{"uid": f"u{i}", "email": f"User{i}@X.com", "password": password, "display_name": None} for i in range(count)]
+
+async def _collect(generator):
+    return [result for results in [chunk async for chunk in generator] for result in results]
+
+def test_existing_emails_and_uids_are_not_imported(bulk):
+    bulk["existing_emails"] = {"user1@x.com"}
+    bulk["existing_uids"] = {"u2"}
+    results = asyncio.run(_collect(FirebaseService().bulk_create_users_async(_users(4), chunk_size=10)))
+    by_uid = {result["uid"]: result for result in results}
+    assert by_uid["u1"]["message"] == "E-posta adresi zaten kayıtlı"
+    assert by_uid["u2"]["message"] == "uid zaten kayıtlı"
+    assert bulk["imports"] == [(["u0", "u3"], False)]
+    assert bulk["inserted"] == [["u0", "u3"]]
+
+def test_duplicate_emails_in_request_are_case_insensitive(bulk):
+    users = [{"email": "a@x.com"}, {"email": "A@X.COM"}]
+    results = asyncio.run(_collect(FirebaseService().bulk_create_users_async(users)))
+    assert [result["status"] for result in sorted(results, key=lambda r: r["index"])] == ["success", "error"]
+
+def test_passwords_are_hashed_for_import(bulk):
+    results = asyncio.run(_collect(FirebaseService().bulk_create_users_async(_users(2, password="gizli-sifre"))))
+    assert all(result["status"] == "success" for result in results)
+    assert bulk["imports"] == [(["u0", "u1"], True)]
+
+def test_existing_row_is_not_overwritten(bulk):
+    bulk["taken_uids"] = {"u0"}
+    bulk["import_errors"] = [_ImportError(1, "geçersiz")]
+    results = asyncio.run(_collect(FirebaseService().bulk_create_users_async(_users(3), chunk_size=10)))
+    by_uid = {result["uid"]: result for result in results}
+    assert by_uid["u0"]["status"] == "error" and by_uid["u0"]["firebase_imported"]
+    assert by_uid["u1"]["message"] == "geçersiz"
+    assert by_uid["u2"]["status"] == "success" and "firebase_imported" not in by_uid["u2"]
+    assert bulk["inserted"] == [["u0", "u2"]]
+
+def test_chunks_start_lazily_and_stop_when_client_leaves(bulk):
+    async def run():
+        generator = FirebaseService().bulk_create_users_async(_users(10), chunk_size=2, concurrency=2)
+        first = await generator.__anext__()
+        await generator.aclose()
+        await asyncio.sleep(0.05)
+        return first
+
+    first = asyncio.run(run())
+    assert len(first) == 2
+    # İlk sonuç gelene kadar en fazla concurrency, ardından bir parça daha başlatılır
+    assert bulk["started"] <= 3
+    # Başlatılmış parçalar istemci ayrılsa da veritabanına yazılır
+    assert len(bulk["inserted"]) == bulk["started"]
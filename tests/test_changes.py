@@ -0,0 +1,62 @@
+import asyncio
+import json
+import math
+import changes
+from changes import ChangeHub
+
+def _drain(gen):
+    async def run():
+        return [chunk async for chunk in gen]
+    return asyncio.run(run())
+
+def _event(chunk):
+    fields = {}
+    for line in chunk.decode("utf-8").strip().split("\n"):
+        key, _, value = line.partition(": ")
+        fields[key] = value
+    return fields
+
+def test_failed_resubscribe_ends_stream_with_error_event(monkeypatch):
+    hub = ChangeHub(buffer_size=2, max_clients=1)
+    hub.last_seq = 10
+    monkeypatch.setattr(changes, "get_change_hub", lambda: hub)
+
+    async def run():
+        gen = changes.stream_changes()
+        chunks = [await gen.__anext__()]
+        # Tamponu taşır; istemci canlı dağıtımdan çıkarılır ve yeri başka bir istemciye geçer
+        for seq in (11, 12, 13):
+            hub._publish(seq, json.dumps({"seq": seq}))
+        other = hub.subscribe()
+        chunks += [chunk async for chunk in gen]
+        return chunks, other
+
+    chunks, other = asyncio.run(run())
+    assert [_event(c).get("id") for c in chunks[1:3]] == ["11", "12"]
+    error = _event(chunks[-1])
+    retry_after = math.ceil(changes.CHANGES_HEARTBEAT_INTERVAL)
+    assert len(chunks) == 4
+    assert error["event"] == "error"
+    assert error["retry"] == str(retry_after * 1000)
+    assert json.loads(error["data"]) == {
+        "reason": "clients_full",
+        "retry_after": retry_after,
+        "last_seq": 12,
+    }
+    assert hub._clients == {other}
+
+def test_open_breaker_during_replay_ends_stream_with_error_event(monkeypatch):
+    hub = ChangeHub()
+    hub.last_seq = 10
+    monkeypatch.setattr(changes, "get_change_hub", lambda: hub)
+
+    async def unavailable(fn, *args):
+        raise changes.Overloaded("db", "circuit_open", 5)
+
+    monkeypatch.setattr(changes, "run_db", unavailable)
+    chunks = _drain(changes.stream_changes(after=7))
+    error = _event(chunks[-1])
+    assert error["event"] == "error"
+    assert error["retry"] == "5000"
+    assert json.loads(error["data"])["last_seq"] == 7
+    assert not hub._clients
@@ -0,0 +1,267 @@
+import asyncio
+import itertools
+import threading
+from contextlib import contextmanager
+import psycopg2
+import pytest
+from firebase_admin import exceptions as firebase_exceptions
+import database
+import write_repair
+from database import WriteIntentClaimedError
+from firebase_service import FirebaseService
+from tests.stubs import StubConnection
+
+class _Tables:
+    """users ve dual_write_intents tablolarının SQL metnine göre yanıt veren bellek içi taklidi"""
+
+    def __init__(self):
+        self.users = {}
+        self.intents = {}
+        self._ids = itertools.count(1)
+
+    def _row(self, uid):
+        email, display_name = self.users[uid]
+        return (1, uid, email, display_name, None, None)
+
+    def respond(self, sql, params):
+        if "COUNT(*)" in sql:
+            retrying = sum(1 for intent in self.intents.values() if intent[2] > 0)
+            return [(len(self.intents), retrying, 0.0)]
+        if "INSERT INTO dual_write_intents" in sql:
+            intent_id = next(self._ids)
+            self.intents[intent_id] = [params["p1"], params["p2"], 0]
+            return [(intent_id,)]
+        if "AND attempts = 0" in sql:
+            intent = self.intents.get(params[0])
+            if intent is None or intent[2] > 0:
+                return []
+            del self.intents[params[0]]
+            # Stub'da rowcount dönen satır sayısıdır
+            return [(params[0],)]
+        if "DELETE FROM dual_write_intents" in sql:
+            self.intents.pop(params[0], None)
+            return []
+        if "SET last_error" in sql:
+            return []
+        if "UPDATE dual_write_intents" in sql:
+            claimed = []
+            for intent_id, intent in self.intents.items():
+                intent[2] += 1
+                claimed.append((intent_id, intent[0], intent[1], intent[2]))
+            return claimed
+        if "DO UPDATE" in sql:
+            uid, email, display_name = params["p1"], params["p2"], params["p3"]
+            if "COALESCE(EXCLUDED.display_name" in sql and uid in self.users:
+                email = email or self.users[uid][0]
+                display_name = display_name or self.users[uid][1]
+            self.users[uid] = (email, display_name)
+            return [self._row(uid)]
+        if "INSERT INTO users" in sql:
+            self.users[params["p1"]] = (params["p2"], params["p3"])
+            return [self._row(params["p1"]) + (True,)]
+        if "UPDATE users" in sql:
+            uid = params["p1"]
+            if uid not in self.users:
+                return []
+            email, display_name = self.users[uid]
+            self.users[uid] = (params["p2"] or email, params["p3"] or display_name)
+            return [self._row(uid)]
+        if "DELETE FROM users" in sql:
+            return [(params["p1"],)] if self.users.pop(params["p1"], None) else []
+        raise AssertionError(f"Beklenmeyen SQL: {sql}")
+
+class _TransactionalConnection(StubConnection):
+    """rollback'te tabloları bağlantının alındığı andaki haline döndüren stub"""
+
+    def __init__(self, tables):
+        super().__init__(tables.respond)
+        self.tables = tables
+        self.snapshot = None
+
+    def begin(self):
+        self.snapshot = (dict(self.tables.users), {k: list(v) for k, v in self.tables.intents.items()})
+
+    def rollback(self):
+        super().rollback()
+        self.tables.users, self.tables.intents = self.snapshot
+
+@pytest.fixture
+def tables(monkeypatch, fake):
+    """Sahte Firebase ile birlikte bellek içi tablolar; Firebase çağrıları sırasında açık transaction kaydedilir"""
+    tables = _Tables()
+    tables.conn = _TransactionalConnection(tables)
+    tables.in_transaction_during_firebase = []
+
+    @contextmanager
+    def get_connection():
+        tables.conn.begin()
+        try:
+            yield tables.conn
+        finally:
+            # Havuz iade edilen bağlantıyı autocommit'e döndürür
+            tables.conn.autocommit = True
+
+    monkeypatch.setattr(database, "get_connection", get_connection)
+    monkeypatch.setattr(write_repair, "get_connection", get_connection)
+    fake._inject_fault = lambda name: tables.in_transaction_during_firebase.append(not tables.conn.autocommit)
+    return tables
+
+def _fail_with(fake, tables, error):
+    def inject(name):
+        tables.in_transaction_during_firebase.append(not tables.conn.autocommit)
+        raise error(f"enjekte edilen hata: {name}")
+    fake._inject_fault = inject
+
+def test_create_applies_row_after_firebase_without_holding_a_transaction(tables, fake):
+    result = FirebaseService().create_user("a@x.com", "secret", "A")
+    uid = result["firebase_user"]["uid"]
+    assert tables.users == {uid: ("a@x.com", "A")}
+    assert tables.intents == {}
+    assert tables.in_transaction_during_firebase == [False]
+    assert tables.conn.commits == 1
+
+def test_async_update_does_not_hold_a_transaction_during_firebase_call(tables, fake):
+    uid = fake.add_user(email="a@x.com", display_name="A")
+    tables.users[uid] = ("a@x.com", "A")
+    asyncio.run(FirebaseService().update_user_info_async(uid, display_name="B"))
+    assert tables.users[uid] == ("a@x.com", "B")
+    assert tables.intents == {}
+    assert tables.in_transaction_during_firebase == [False]
+
+def _create_sync(email):
+    return FirebaseService().create_user(email, "secret")
+
+def _create_async(email):
+    return asyncio.run(FirebaseService().create_user_async(email, "secret"))
+
+@pytest.mark.parametrize("create", [_create_sync, _create_async])
+def test_intent_insert_overlaps_firebase_call(tables, fake, create):
+    firebase_started = threading.Event()
+    overlapped = []
+    respond = tables.conn.respond
+
+    def respond_after_firebase_starts(sql, params):
+        # Sırayla yürüseydi niyet kaydı Firebase çağrısını beklerken zaman aşımına uğrardı
+        if "INSERT INTO dual_write_intents" in sql:
+            overlapped.append(firebase_started.wait(2))
+        return respond(sql, params)
+
+    tables.conn.respond = respond_after_firebase_starts
+    fake._inject_fault = lambda name: firebase_started.set()
+    uid = create("a@x.com")["firebase_user"]["uid"]
+    assert overlapped == [True]
+    assert tables.users == {uid: ("a@x.com", None)}
+    assert tables.intents == {}
+
+def test_failed_intent_insert_still_applies_write(tables, fake):
+    tables.conn.fail_on = "INSERT INTO dual_write_intents"
+    tables.conn.error = psycopg2.OperationalError("bağlantı koptu")
+    result = FirebaseService().create_user("a@x.com", "secret")
+    assert result["firebase_user"]["uid"] in tables.users
+    assert tables.intents == {}
+
+def test_firebase_rejection_withdraws_intent_without_db_write(tables, fake):
+    _fail_with(fake, tables, firebase_exceptions.InvalidArgumentError)
+    with pytest.raises(firebase_exceptions.InvalidArgumentError):
+        FirebaseService().create_user("a@x.com", "secret")
+    assert tables.users == {}
+    assert tables.intents == {}
+    assert not any("INSERT INTO users" in sql for sql in tables.conn.sql())
+
+def test_uncertain_firebase_failure_is_compensated_by_repairer(tables, fake):
+    _fail_with(fake, tables, firebase_exceptions.DeadlineExceededError)
+    with pytest.raises(firebase_exceptions.DeadlineExceededError):
+        FirebaseService().create_user("a@x.com", "secret")
+    assert tables.users == {}
+    [(op, uid, attempts)] = tables.intents.values()
+    assert (op, attempts) == ("create", 0)
+
+    # İstek Firebase'e ulaşmış ve kullanıcı oluşmuş olabilir
+    fake._inject_fault = lambda name: None
+    fake.add_user(uid=uid, email="a@x.com")
+    assert write_repair.repair_once() == 1
+    assert uid not in fake._users
+    assert tables.users == {}
+    assert tables.intents == {}
+
+def test_db_failure_after_firebase_create_is_compensated_by_repairer(tables, fake):
+    tables.conn.fail_on = "INSERT INTO users"
+    tables.conn.error = psycopg2.OperationalError("bağlantı koptu")
+    with pytest.raises(psycopg2.OperationalError):
+        FirebaseService().create_user("a@x.com", "secret")
+    [(op, uid, attempts)] = tables.intents.values()
+    assert op == "create"
+    assert uid in fake._users
+    assert tables.conn.rollbacks == 1
+
+    tables.conn.fail_on = None
+    assert write_repair.repair_once() == 1
+    assert uid not in fake._users
+    assert tables.users == {}
+    assert tables.intents == {}
+
+def test_db_failure_after_firebase_update_is_synced_by_repairer(tables, fake):
+    uid = fake.add_user(email="a@x.com", display_name="A")
+    tables.users[uid] = ("a@x.com", "A")
+    tables.conn.fail_on = "UPDATE users"
+    tables.conn.error = psycopg2.OperationalError("bağlantı koptu")
+    with pytest.raises(psycopg2.OperationalError):
+        FirebaseService().update_user_info(uid, display_name="B")
+    assert tables.users[uid] == ("a@x.com", "A")
+    assert [intent[0] for intent in tables.intents.values()] == ["update"]
+
+    tables.conn.fail_on = None
+    assert write_repair.repair_once() == 1
+    assert tables.users[uid] == ("a@x.com", "B")
+    assert tables.intents == {}
+
+def test_intent_claimed_during_firebase_call_is_recorded_again(tables, fake):
+    uid = fake.add_user(email="a@x.com", display_name="A")
+    tables.users[uid] = ("a@x.com", "A")
+
+    intent_recorded = threading.Event()
+    respond = tables.conn.respond
+
+    def record_and_signal(sql, params):
+        rows = respond(sql, params)
+        if "INSERT INTO dual_write_intents" in sql:
+            intent_recorded.set()
+        return rows
+
+    def repairer_claims(name):
+        # Firebase yanıtı gecikirken onarıcı, eşzamanlı yazılan kaydı alır
+        assert intent_recorded.wait(2)
+        for intent in tables.intents.values():
+            intent[2] += 1
+
+    tables.conn.respond = record_and_signal
+    fake._inject_fault = repairer_claims
+
+    with pytest.raises(WriteIntentClaimedError):
+        FirebaseService().update_user_info(uid, display_name="B")
+    assert tables.users[uid] == ("a@x.com", "A")
+    assert sorted(intent[2] for intent in tables.intents.values()) == [0, 1]
+
+def test_repair_clears_fields_removed_in_firebase(tables, fake):
+    uid = fake.add_user(email="a@x.com", display_name=None)
+    tables.users[uid] = ("a@x.com", "A")
+    tables.intents[99] = ["update", uid, 0]
+    assert write_repair.repair_once() == 1
+    assert tables.users[uid] == ("a@x.com", None)
+    assert tables.intents == {}
+
+def test_repair_metrics_come_from_the_repairer_snapshot(tables, monkeypatch):
+    monkeypatch.setattr(write_repair, "_cached_stats", None)
+    monkeypatch.setattr(write_repair, "_stats_refreshed_at", None)
+    tables.intents[1] = ["update", "u1", 2]
+    tables.intents[2] = ["create", "u2", 0]
+    write_repair._refresh_cached_stats()
+
+    # Kazıma ve aralık dolmadan yapılan yenileme veritabanına gitmez
+    executed = len(tables.conn.executed)
+    write_repair._refresh_cached_stats()
+    write_repair._collect_repair_metrics()
+    assert len(tables.conn.executed) == executed
+    lines = write_repair._INTENTS.render()
+    assert 'dual_write_intents{state="pending"} 2' in lines
+    assert 'dual_write_intents{state="retrying"} 1' in lines
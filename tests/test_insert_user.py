@@ -0,0 +1,49 @@
+import pytest
+import database
+from database import insert_user
+from tests.stubs import StubConnection, stub_get_connection
+
+def _row(uid, email=None, inserted=True):
+    return (7, uid, email, None, None, None, inserted)
+
+@pytest.fixture
+def users(monkeypatch):
+    """insert_user'ın tek ifadesine verilecek yanıtı tutan stub bağlantı"""
+    conn = StubConnection(lambda sql, params: conn.rows)
+    conn.rows = []
+    conn.pinned = []
+    monkeypatch.setattr(database, "get_connection", stub_get_connection(conn))
+    monkeypatch.setattr(database, "pin_primary", lambda *uids: conn.pinned.extend(uids))
+    return conn
+
+def test_new_user_is_inserted_in_one_statement(users):
+    users.rows = [_row("u1", "a@x.com")]
+    user = insert_user("u1", email="a@x.com")
+    assert (user.id, user.firebase_uid, user.email) == (7, "u1", "a@x.com")
+    [sql] = users.sql()
+    assert "ON CONFLICT (firebase_uid) DO NOTHING" in sql
+    assert users.pinned == ["u1"]
+
+def test_existing_user_is_returned_by_the_same_statement(users):
+    users.rows = [_row("u1", "old@x.com", inserted=False)]
+    user = insert_user("u1", email="new@x.com")
+    assert user.email == "old@x.com"
+    assert len(users.executed) == 1
+
+def test_concurrent_insert_falls_back_to_select(users):
+    # Eşzamanlı ekleme ifadenin görüntüsünden sonra commit edildiyse CTE satır döndürmez
+    responses = [[], [_row("u1", "a@x.com")[:-1]]]
+    users.respond = lambda sql, params: responses.pop(0)
+    user = insert_user("u1", email="a@x.com")
+    assert user.email == "a@x.com"
+    assert "SELECT" in users.sql()[1] and "INSERT" not in users.sql()[1]
+
+def test_statement_is_prepared_once_per_connection(users, monkeypatch):
+    monkeypatch.setattr(database, "DB_PREPARED_STATEMENTS", True)
+    users.prepared = set()
+    users.rows = [_row("u1")]
+    insert_user("u1")
+    insert_user("u1")
+    statements = users.sql()
+    assert sum(sql.startswith("PREPARE insert_user") for sql in statements) == 1
+    assert sum(sql.startswith("EXECUTE insert_user") for sql in statements) == 2
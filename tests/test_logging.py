@@ -0,0 +1,70 @@
+import json
+import logging
+import logging.handlers
+import queue
+import pytest
+import logging_setup
+from logging_setup import JsonFormatter, QueueHandler, SamplingFilter
+
+def _record(msg="Kullanıcı okundu: %s", level=logging.INFO, name="database"):
+    return logging.LogRecord(name, level, __file__, 1, msg, ("u1",), None)
+
+@pytest.fixture
+def clock(monkeypatch):
+    """logging_setup'ın gördüğü monotonic saat; testler ileri sarar"""
+    now = [1000.0]
+    monkeypatch.setattr(logging_setup.time, "monotonic", lambda: now[0])
+    return now
+
+def _passed(log_filter, records):
+    return [index for index, record in enumerate(records, 1) if log_filter.filter(record)]
+
+def test_repeated_template_is_sampled_after_burst(clock):
+    log_filter = SamplingFilter(window=60, burst=3, every=5)
+    records = [_record() for _ in range(18)]
+    assert _passed(log_filter, records) == [1, 2, 3, 8, 13, 18]
+    # Yazılan kayıt kendinden önce atlananları sayar
+    assert [getattr(records[i - 1], "suppressed", 0) for i in (3, 8, 13, 18)] == [0, 4, 4, 4]
+
+def test_templates_and_loggers_are_sampled_separately(clock):
+    log_filter = SamplingFilter(window=60, burst=1, every=100)
+    assert _passed(log_filter, [_record(), _record()]) == [1]
+    assert log_filter.filter(_record("Başka mesaj %s"))
+    assert log_filter.filter(_record(name="api"))
+
+def test_warnings_are_never_sampled(clock):
+    log_filter = SamplingFilter(rate=1, window=60, burst=1, every=100)
+    records = [_record(level=logging.WARNING) for _ in range(10)]
+    assert len(_passed(log_filter, records)) == 10
+
+def test_new_window_restarts_burst_and_reports_suppressed(clock):
+    log_filter = SamplingFilter(window=10, burst=2, every=100)
+    assert _passed(log_filter, [_record() for _ in range(5)]) == [1, 2]
+    clock[0] += 10
+    record = _record()
+    assert log_filter.filter(record)
+    assert record.suppressed == 3
+
+def test_rate_limit_refills_over_time(clock):
+    log_filter = SamplingFilter(rate=2, every=1)
+    assert _passed(log_filter, [_record(f"mesaj {i}") for i in range(4)]) == [1, 2]
+    clock[0] += 0.5
+    assert _passed(log_filter, [_record("mesaj 5"), _record("mesaj 6")]) == [1]
+
+def test_full_queue_drops_info_but_not_after_stop():
+    target = logging.handlers.BufferingHandler(10)
+    handler = QueueHandler(queue.Queue(1), target)
+    handler.handle(_record("ilk"))
+    handler.handle(_record("ikinci"))
+    assert handler.queue.qsize() == 1
+    handler.stopped = True
+    handler.handle(_record("durduktan sonra"))
+    assert [record.msg for record in target.buffer] == ["durduktan sonra"]
+
+def test_json_formatter_includes_extra_and_suppressed_fields():
+    record = _record()
+    record.suppressed = 4
+    record.request_id = "r1"
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "Kullanıcı okundu: u1"
+    assert (entry["suppressed"], entry["request_id"], entry["level"]) == (4, "r1", "INFO")
@@ -0,0 +1,41 @@
+from metrics import REGISTRY, Counter, Registry
+from tests.stubs import StubConnection, stub_get_connection
+
+def test_collector_totals_render_as_counters():
+    registry = Registry()
+    lookups = registry.register(Counter("cache_lookups_total", "Önbellek isabet/ıska sayıları", ("cache", "result")))
+    registry.register_collector(lambda: lookups.set_total(7, cache="user", result="hit"))
+    lines = registry.render().splitlines()
+    assert "# TYPE cache_lookups_total counter" in lines
+    assert 'cache_lookups_total{cache="user",result="hit"} 7' in lines
+
+def test_cumulative_metrics_are_counters():
+    import database
+    import firebase_service
+    import webhook_queue
+    for metric in (firebase_service._CACHE_LOOKUPS, webhook_queue._QUEUE_EVENTS, database._POOL_TIMEOUTS):
+        assert metric.type_name == "counter"
+        assert metric.name.endswith("_total")
+
+def test_scrape_does_not_query_the_database(monkeypatch):
+    import database
+    import webhook_queue
+    import write_repair
+    conn = StubConnection(lambda sql, params: [{"depth": 3, "dead": 1, "lag_seconds": 2.5}])
+    monkeypatch.setattr(webhook_queue, "get_connection", stub_get_connection(conn))
+    monkeypatch.setattr(webhook_queue, "_cached_stats", None)
+    monkeypatch.setattr(webhook_queue, "_stats_refreshed_at", None)
+    webhook_queue._refresh_cached_stats()
+
+    # /metrics REGISTRY.render()'ı event loop'ta çağırır; toplayıcılar yalnızca bellekteki durumu okumalı
+    def no_database():
+        raise AssertionError("kazıma veritabanına gitmemeli")
+    for module in (database, webhook_queue, write_repair):
+        monkeypatch.setattr(module, "get_connection", no_database)
+    monkeypatch.setattr(REGISTRY, "_collectors", REGISTRY._collectors + [
+        webhook_queue._collect_queue_metrics, write_repair._collect_repair_metrics,
+    ])
+    lines = REGISTRY.render().splitlines()
+    assert 'webhook_queue_depth{state="pending"} 3' in lines
+    assert "webhook_queue_lag_seconds 2.5" in lines
+    assert len(conn.executed) == 1
@@ -0,0 +1,98 @@
+import threading
+import time
+import pytest
+from psycopg2 import extensions
+from database import ConnectionPool, PoolError, PoolTimeoutError
+from tests.stubs import StubConnection
+
+class _PoolConnection(StubConnection):
+    """İade sırasında transaction durumu sorgulanabilen stub bağlantı"""
+
+    def __init__(self):
+        super().__init__()
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        super().rollback()
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = True
+
+class _StubPool(ConnectionPool):
+    def __init__(self, **kwargs):
+        super().__init__("postgresql://stub/app", **kwargs)
+        self.connections = []
+
+    def _connect(self):
+        conn = _PoolConnection()
+        self.connections.append(conn)
+        return conn
+
+def test_returned_connection_is_reused():
+    pool = _StubPool(max_size=2)
+    first = pool.getconn()
+    pool.putconn(first)
+    assert pool.getconn() is first
+    assert pool.stats()["created_total"] == 1
+
+def test_checkout_times_out_when_pool_is_exhausted():
+    pool = _StubPool(max_size=1)
+    pool.getconn()
+    with pytest.raises(PoolTimeoutError):
+        pool.getconn(timeout=0.01)
+    stats = pool.stats()
+    assert (stats["size"], stats["in_use"], stats["timeouts_total"]) == (1, 1, 1)
+
+def test_waiter_gets_connection_returned_by_another_thread():
+    pool = _StubPool(max_size=1)
+    conn = pool.getconn()
+    timer = threading.Timer(0.05, pool.putconn, (conn,))
+    timer.start()
+    assert pool.getconn(timeout=2) is conn
+    timer.join()
+    assert pool.stats()["max_wait_ms"] > 0
+
+def test_open_transaction_is_rolled_back_on_return():
+    pool = _StubPool(max_size=1)
+    conn = pool.getconn()
+    conn.autocommit = False
+    conn.status = extensions.TRANSACTION_STATUS_INTRANS
+    pool.putconn(conn)
+    assert conn.rollbacks == 1
+    assert conn.autocommit
+    assert not conn.closed
+
+def test_discarded_connection_frees_its_slot():
+    pool = _StubPool(max_size=1)
+    broken = pool.getconn()
+    pool.putconn(broken, discard=True)
+    assert broken.closed
+    assert pool.getconn(timeout=0.01) is not broken
+    assert pool.stats()["discarded_total"] == 1
+
+def test_expired_connection_is_replaced_at_checkout():
+    pool = _StubPool(max_size=1, max_lifetime=0.01)
+    old = pool.getconn()
+    pool.putconn(old)
+    time.sleep(0.02)
+    assert pool.getconn() is not old
+    assert old.closed
+
+def test_stale_connection_is_validated_before_use():
+    pool = _StubPool(max_size=1, validation_interval=0)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.fail_on = "SELECT 1"
+    conn.error = RuntimeError("sunucu bağlantıyı kapattı")
+    replacement = pool.getconn()
+    assert replacement is not conn
+    assert conn.closed
+
+def test_foreign_connection_is_rejected():
+    pool = _StubPool()
+    with pytest.raises(PoolError):
+        pool.putconn(_PoolConnection())
@@ -0,0 +1,40 @@
+import database
+import write_repair
+from tests.stubs import StubConnection, stub_get_connection
+
+def _event(event_id, uid="u1"):
+    return {"event_id": event_id, "event_type": "update", "user_data": {"uid": uid}, "version": 1}
+
+def test_claiming_events_does_not_prune(monkeypatch):
+    conn = StubConnection()
+    inserted = []
+
+    def execute_values(cur, sql, rows, **kwargs):
+        inserted.extend(rows)
+        return [{"event_id": row[0]} for row in rows]
+
+    monkeypatch.setattr(database, "execute_values", execute_values)
+    duplicates = database.claim_events(conn.cursor(), [_event("e1"), _event("e2"), _event("e1")])
+    assert duplicates == {2}
+    assert [row[0] for row in inserted] == ["e1", "e2"]
+    assert not any("DELETE" in sql for sql in conn.sql())
+
+def test_repairer_prunes_once_per_interval_in_its_own_connection(monkeypatch):
+    conn = StubConnection(lambda sql, params: [("e1",), ("e2",)])
+    monkeypatch.setattr(database, "get_connection", stub_get_connection(conn))
+    monkeypatch.setattr(write_repair, "_last_prune", None)
+    write_repair._prune_processed_events()
+    write_repair._prune_processed_events()
+    [(sql, (retention, limit))] = conn.executed
+    assert "DELETE FROM processed_events" in sql
+    assert retention == database.WEBHOOK_DEDUPE_RETENTION_DAYS * 86400
+    assert limit == 10000
+
+def test_failed_prune_does_not_stop_the_repairer(monkeypatch):
+    conn = StubConnection()
+    conn.fail_on = "DELETE FROM processed_events"
+    conn.error = RuntimeError("bağlantı koptu")
+    monkeypatch.setattr(database, "get_connection", stub_get_connection(conn))
+    monkeypatch.setattr(write_repair, "_last_prune", None)
+    write_repair._prune_processed_events()
+    assert len(conn.executed) == 1
@@ -0,0 +1,137 @@
+import threading
+import pytest
+import reconcile
+from tests.stubs import StubConnection, stub_get_connection
+
+def _source(pages):
+    """Sayfa listesinden auth.list_users imzasında sahte kaynak üretir"""
+    calls = []
+
+    def list_users(page_token=None, max_results=1000):
+        calls.append(page_token)
+        index = int(page_token) if page_token else 0
+        users = [reconcile._User(*user) for user in pages[index]]
+        next_token = str(index + 1) if index + 1 < len(pages) else None
+        return reconcile._Page(users, next_token)
+    list_users.calls = calls
+    return list_users
+
+def test_iter_user_pages_follows_tokens():
+    source = _source([[("a", "a@x.com", "A")], [("b", None, "")]])
+    pages = list(reconcile.iter_user_pages(source, page_size=1))
+    assert pages == [([("a", "a@x.com", "A")], "1"), ([("b", None, "")], None)]
+    assert source.calls == [None, "1"]
+
+def test_iter_user_pages_resumes_from_token():
+    source = _source([[("a", None, None)], [("b", None, None)], [("c", None, None)]])
+    pages = list(reconcile.iter_user_pages(source, page_token="1"))
+    assert [rows for rows, _ in pages] == [[("b", None, None)], [("c", None, None)]]
+
+def test_jsonl_user_source_pages(tmp_path):
+    path = tmp_path / "users.jsonl"
+    path.write_text('{"uid": "a", "email": "a@x.com"}\n\n{"uid": "b", "display_name": ""}\n{"uid": "c"}\n', encoding="utf-8")
+    pages = list(reconcile.iter_user_pages(reconcile.jsonl_user_source(str(path)), page_size=2))
+    assert [[row[0] for row in rows] for rows, _ in pages] == [["a", "b"], ["c"]]
+    assert pages[0][0][1] == ("b", None, "")
+
+def test_staging_csv_distinguishes_null_from_empty_string():
+    rows = [("u1", None, ""), ("u2", 'a"b@x.com', "\\N")]
+    text = reconcile._staging_csv("run", rows).read()
+    assert text.splitlines() == [
+        '"run","u1",\\N,""',
+        '"run","u2","a""b@x.com","\\N"',
+    ]
+
+def test_copy_page_uses_null_marker_and_advances_checkpoint(monkeypatch):
+    conn = StubConnection()
+    monkeypatch.setattr(reconcile, "get_connection", stub_get_connection(conn))
+    reconcile._copy_page("run", [("u1", "u1@x.com", None)], None)
+
+    copy_sql, data = conn.copies[0]
+    assert "NULL '\\N'" in copy_sql and "FORMAT csv" in copy_sql
+    assert data == '"run","u1","u1@x.com",\\N\n'
+    update_sql, params = conn.executed[0]
+    assert "UPDATE reconcile_checkpoints" in update_sql
+    # Son sayfa: token yok, listeleme tamamlandı
+    assert params == (None, 1, True, "run")
+    assert conn.commits == 1
+
+def test_load_staging_loads_every_page_in_order(monkeypatch):
+    loaded = []
+    monkeypatch.setattr(reconcile, "_copy_page", lambda run_id, rows, token: loaded.append((run_id, rows, token)))
+    source = _source([[("a", None, None), ("b", None, None)], [("c", None, None)], []])
+    assert reconcile.load_staging("run", source, page_size=2, prefetch=1) == 3
+    assert [token for _, _, token in loaded] == ["1", "2", None]
+
+def test_load_staging_propagates_source_errors_and_stops_producer(monkeypatch):
+    monkeypatch.setattr(reconcile, "_copy_page", lambda *args: None)
+
+    def failing(page_token=None, max_results=1000):
+        if page_token:
+            raise RuntimeError("list_users hatası")
+        return reconcile._Page([reconcile._User("a")], "1")
+
+    with pytest.raises(RuntimeError, match="list_users"):
+        reconcile.load_staging("run", failing)
+    assert not any(t.name == "reconcile-fetch" for t in threading.enumerate())
+
+def _reconcile_db(checkpoint=None, counts=(1, 2, 0)):
+    counts = dict(zip(("insert", "update", "delete"), counts))
+
+    def respond(sql, params):
+        if "SELECT next_page_token" in sql:
+            return [checkpoint] if checkpoint else []
+        if "SELECT started_at, users" in sql:
+            return [("2024-01-01", 3)]
+        if sql.startswith("SELECT COUNT(*)"):
+            kind = next(k for k, body in reconcile._DIFF_QUERIES.items() if body in sql)
+            return [(counts[kind],)]
+        return []
+    return StubConnection(respond)
+
+def test_reconcile_dry_run_reports_without_applying(monkeypatch):
+    conn = _reconcile_db()
+    monkeypatch.setattr(reconcile, "get_connection", stub_get_connection(conn))
+    monkeypatch.setattr(reconcile, "load_staging", lambda *args: 0)
+    result = reconcile.reconcile(_source([[]]), dry_run=True)
+
+    assert result["diff"]["insert"]["count"] == 1
+    assert result["diff"]["update"]["count"] == 2
+    assert "applied" not in result
+    assert not any(sql.lstrip().startswith(("INSERT INTO users", "UPDATE users", "DELETE FROM users")) for sql in conn.sql())
+
+def test_reconcile_apply_without_delete(monkeypatch):
+    conn = _reconcile_db()
+    monkeypatch.setattr(reconcile, "get_connection", stub_get_connection(conn))
+    monkeypatch.setattr(reconcile, "load_staging", lambda *args: 0)
+    result = reconcile.reconcile(_source([[]]), delete=False)
+
+    assert set(result["applied"]) == {"insert", "update"}
+    statements = [sql.strip() for sql in conn.sql()]
+    assert any(sql.startswith("INSERT INTO users") for sql in statements)
+    assert not any(sql.startswith("DELETE FROM users") for sql in statements)
+    assert any("SET applied_at = now()" in sql for sql in statements)
+
+def test_reconcile_resume_skips_completed_listing(monkeypatch):
+    conn = _reconcile_db(checkpoint=(None, 3, 3, True, None))
+    monkeypatch.setattr(reconcile, "get_connection", stub_get_connection(conn))
+    monkeypatch.setattr(reconcile, "load_staging", lambda *args: pytest.fail("listeleme tekrarlanmamalı"))
+    assert reconcile.reconcile(_source([[]]), run_id="old", dry_run=True)["run_id"] == "old"
+
+def test_reconcile_resume_continues_from_checkpoint_token(monkeypatch):
+    conn = _reconcile_db(checkpoint=("2", 2, 10, False, None))
+    monkeypatch.setattr(reconcile, "get_connection", stub_get_connection(conn))
+    started = []
+    monkeypatch.setattr(reconcile, "load_staging", lambda run_id, source, size, token, prefetch: started.append(token))
+    reconcile.reconcile(_source([[]]), run_id="old", dry_run=True)
+    assert started == ["2"]
+
+def test_reconcile_rejects_applied_or_unknown_runs(monkeypatch):
+    conn = _reconcile_db(checkpoint=(None, 1, 1, True, "2024-01-02"))
+    monkeypatch.setattr(reconcile, "get_connection", stub_get_connection(conn))
+    with pytest.raises(ValueError, match="zaten uygulanmış"):
+        reconcile.reconcile(_source([[]]), run_id="done")
+
+    monkeypatch.setattr(reconcile, "get_connection", stub_get_connection(_reconcile_db()))
+    with pytest.raises(ValueError, match="bulunamadı"):
+        reconcile.reconcile(_source([[]]), run_id="missing")
@@ -0,0 +1,137 @@
+import contextvars
+import psycopg2
+import pytest
+from psycopg2 import extensions
+import database
+from cache import TTLCache
+from database import PoolTimeoutError, get_read_connection, pin_primary, set_read_session
+from tests.stubs import StubConnection, stub_get_connection
+
+_REPLICA_URLS = ["postgresql://replica1:5432/app", "postgresql://replica2:5432/app"]
+
+class _StubPool:
+    """ConnectionPool yerine geçen, tek bir stub bağlantı veren havuz"""
+
+    def __init__(self, url, **kwargs):
+        self.conn = StubConnection(self._respond, name=database._replica_name(url, 0))
+        # (recovery modunda mı, gecikme)
+        self.lag = (True, 0.0)
+        self.error = None
+        self.discarded = 0
+
+    def _respond(self, sql, params):
+        return [self.lag]
+
+    def getconn(self):
+        if self.error is not None:
+            raise self.error
+        return self.conn
+
+    def putconn(self, conn, discard=False):
+        self.discarded += discard
+
+    def stats(self):
+        return {}
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def router(monkeypatch):
+    """İki stub replikalı yönlendirici; primary okumaları ayrı bir stub bağlantıya gider"""
+    monkeypatch.setattr(database, "ConnectionPool", _StubPool)
+    monkeypatch.setattr(database, "DATABASE_REPLICA_URLS", _REPLICA_URLS)
+    monkeypatch.setattr(database, "DB_REPLICA_MAX_LAG", 1.0)
+    monkeypatch.setattr(database, "_router", None)
+    monkeypatch.setattr(database, "_primary_pins", TTLCache(100, ttl=60))
+    monkeypatch.setattr(database, "_read_session", contextvars.ContextVar("db_read_session", default=None))
+    primary = StubConnection(name="primary")
+    monkeypatch.setattr(database, "get_connection", stub_get_connection(primary))
+    router = database.get_replica_router()
+    router.primary = primary
+    return router
+
+def _read_from(pin_key=None):
+    with get_read_connection(pin_key) as conn:
+        return conn.name
+
+def _set_lags(router, *lags):
+    for replica, lag in zip(router.replicas, lags):
+        replica.pool.lag = (True, lag)
+    router.check_all()
+
+def test_unchecked_replicas_do_not_take_reads(router):
+    assert {_read_from() for _ in range(4)} == {"primary"}
+
+def test_lagging_replica_is_excluded_until_it_catches_up(router):
+    _set_lags(router, 0.2, 5.0)
+    assert {_read_from() for _ in range(4)} == {"replica1:5432"}
+
+    _set_lags(router, 0.2, 0.5)
+    assert {_read_from() for _ in range(4)} == {"replica1:5432", "replica2:5432"}
+
+def test_unknown_lag_excludes_replica(router):
+    # WAL alıcısı çalışmıyorsa gecikme bilinmez
+    _set_lags(router, None, None)
+    assert all(replica.healthy for replica in router.replicas)
+    assert _read_from() == "primary"
+
+def test_all_replicas_lagging_falls_back_to_primary(router):
+    _set_lags(router, 3.0, 5.0)
+    assert {_read_from() for _ in range(4)} == {"primary"}
+
+def test_writer_reads_are_pinned_to_primary(router):
+    _set_lags(router, 0.0, 0.0)
+    pin_primary("u1")
+    assert {_read_from("u1") for _ in range(4)} == {"primary"}
+    assert _read_from("u2") != "primary"
+
+def test_request_session_pins_reads_without_key(router):
+    _set_lags(router, 0.0, 0.0)
+    pin_primary("u1")
+
+    def read_as(uid):
+        set_read_session(uid)
+        return _read_from()
+
+    assert contextvars.copy_context().run(read_as, "u1") == "primary"
+    assert contextvars.copy_context().run(read_as, "u2") != "primary"
+
+def test_pool_failure_fails_over_to_primary(router):
+    _set_lags(router, 0.0, 5.0)
+    replica = router.replicas[0]
+    replica.pool.error = PoolTimeoutError("havuz dolu")
+    assert _read_from() == "primary"
+    assert not replica.healthy
+
+    # Bir sonraki başarılı ölçümde okumalara geri döner
+    replica.pool.error = None
+    router.check_all()
+    assert _read_from() == "replica1:5432"
+
+def test_connection_error_during_read_disables_replica(router):
+    _set_lags(router, 0.0, 5.0)
+    replica = router.replicas[0]
+    with pytest.raises(psycopg2.OperationalError):
+        with get_read_connection():
+            raise psycopg2.OperationalError("sunucu bağlantıyı kapattı")
+    assert replica.pool.discarded == 1
+    assert not replica.healthy
+    assert _read_from() == "primary"
+
+def test_statement_timeout_keeps_replica_eligible(router):
+    _set_lags(router, 0.0, 5.0)
+    replica = router.replicas[0]
+    with pytest.raises(extensions.QueryCanceledError):
+        with get_read_connection():
+            raise extensions.QueryCanceledError("statement timeout")
+    assert replica.healthy
+    assert _read_from() == "replica1:5432"
+
+def test_failed_lag_check_disables_replica(router):
+    _set_lags(router, 0.0, 0.0)
+    router.replicas[1].pool.conn.fail_on = "pg_is_in_recovery"
+    router.replicas[1].pool.conn.error = psycopg2.OperationalError("bağlantı koptu")
+    router.check_all()
+    assert [replica.healthy for replica in router.replicas] == [True, False]
+    assert {_read_from() for _ in range(4)} == {"replica1:5432"}
@@ -0,0 +1,142 @@
+import time
+import pytest
+from firebase_admin import auth
+from firebase_admin import exceptions as firebase_exceptions
+from psycopg2 import extensions
+import database
+import firebase_service
+from firebase_service import FirebaseService
+from resilience import CircuitBreaker, CircuitOpenError, RetryPolicy
+
+def _fail_next(fake, count, error=firebase_exceptions.UnavailableError):
+    """Sonraki count çağrıyı verilen hatayla başarısız kılar"""
+    remaining = [count]
+
+    def inject(name):
+        if remaining[0] > 0:
+            remaining[0] -= 1
+            raise error(f"enjekte edilen hata: {name}")
+    fake._inject_fault = inject
+
+def test_breaker_opens_after_consecutive_failures(fake):
+    service = FirebaseService()
+    fake.outage(60)
+    for _ in range(3):
+        with pytest.raises(firebase_exceptions.UnavailableError):
+            service._call_firebase("create_user", auth.create_user, email="a@x.com")
+    assert fake.breaker.stats()["state"] == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        service._call_firebase("create_user", auth.create_user, email="a@x.com")
+    # Açık devre çağrıyı Firebase'e göndermez
+    assert fake.calls["create_user"] == 3
+
+def test_breaker_half_open_probe_closes_on_success(fake):
+    service = FirebaseService()
+    fake.outage(60)
+    for _ in range(3):
+        with pytest.raises(firebase_exceptions.UnavailableError):
+            service._call_firebase("create_user", auth.create_user, email="a@x.com")
+    fake.outage(0)
+    time.sleep(0.06)
+    assert fake.breaker.stats()["state"] == CircuitBreaker.HALF_OPEN
+    service._call_firebase("create_user", auth.create_user, email="a@x.com")
+    assert fake.breaker.stats() == {"state": CircuitBreaker.CLOSED, "consecutive_failures": 0, "rejected_total": 0}
+
+def test_breaker_half_open_probe_failure_reopens(fake):
+    service = FirebaseService()
+    fake.outage(60)
+    for _ in range(3):
+        with pytest.raises(firebase_exceptions.UnavailableError):
+            service._call_firebase("create_user", auth.create_user, email="a@x.com")
+    time.sleep(0.06)
+    with pytest.raises(firebase_exceptions.UnavailableError):
+        service._call_firebase("create_user", auth.create_user, email="a@x.com")
+    assert fake.breaker.stats()["state"] == CircuitBreaker.OPEN
+    assert fake.calls["create_user"] == 4
+
+def test_half_open_admits_a_single_probe():
+    breaker = CircuitBreaker("test", lambda exc: True, failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    # Sonucu belirsiz deneme hakkını geri verir
+    breaker.record_ignored()
+    breaker.before_call()
+
+def test_user_errors_do_not_trip_breaker(fake):
+    service = FirebaseService()
+    for _ in range(5):
+        with pytest.raises(auth.UserNotFoundError):
+            service._call_firebase("get_user", auth.get_user, "yok")
+    assert fake.breaker.stats()["state"] == CircuitBreaker.CLOSED
+    # Bulunamadı yanıtı yeniden denenmez
+    assert fake.calls["get_user"] == 5
+
+def test_idempotent_calls_are_retried(fake):
+    service = FirebaseService()
+    uid = fake.add_user(email="a@x.com")
+    _fail_next(fake, 2)
+    user = service._call_firebase("update_user", auth.update_user, uid, display_name="A")
+    assert user.display_name == "A"
+    assert fake.calls["update_user"] == 3
+
+@pytest.mark.parametrize("call", ["create_user", "delete_user"])
+def test_non_idempotent_calls_are_not_retried(fake, call):
+    service = FirebaseService()
+    uid = fake.add_user(email="a@x.com")
+    _fail_next(fake, 1)
+    args = () if call == "create_user" else (uid,)
+    with pytest.raises(firebase_exceptions.UnavailableError):
+        service._call_firebase(call, getattr(auth, call), *args)
+    assert fake.calls[call] == 1
+    # Tek başarısızlık devreyi açmaz; çağrı tekrar edildiğinde geçer
+    service._call_firebase(call, getattr(auth, call), *args)
+    assert fake.calls[call] == 2
+
+def test_retries_exhaust_attempts_and_count_towards_breaker(fake):
+    service = FirebaseService()
+    _fail_next(fake, 10)
+    with pytest.raises(firebase_exceptions.UnavailableError):
+        service._call_firebase("get_user_by_email", auth.get_user_by_email, "a@x.com")
+    assert fake.calls["get_user_by_email"] == 3
+    assert fake.breaker.stats()["state"] == CircuitBreaker.OPEN
+
+def test_retry_stops_at_breaker(fake):
+    service = FirebaseService()
+    fake.breaker.failure_threshold = 2
+    _fail_next(fake, 10)
+    with pytest.raises(CircuitOpenError):
+        service._call_firebase("get_user", auth.get_user, "u1")
+    # Üçüncü deneme açık devreye takılır, Firebase'e gitmez
+    assert fake.calls["get_user"] == 2
+
+def test_firebase_http_timeout_is_passed_to_sdk(fake):
+    FirebaseService().initialize()
+    assert fake.app_options == [{"httpTimeout": firebase_service.FIREBASE_HTTP_TIMEOUT}]
+
+def test_retry_budget_bounds_total_time_on_timeouts(fake, monkeypatch):
+    fake.timeout_rate = 1.0
+    fake.timeout = 0.05
+    monkeypatch.setattr(firebase_service, "_firebase_retry", RetryPolicy(
+        "firebase", lambda exc: isinstance(exc, firebase_service._FIREBASE_RETRYABLE),
+        attempts=5, base_delay=0.001, max_delay=0.001, max_elapsed=0.08))
+    fake.breaker.failure_threshold = 0
+    service = FirebaseService()
+    start = time.monotonic()
+    with pytest.raises(firebase_exceptions.DeadlineExceededError):
+        service._call_firebase("get_user", auth.get_user, "u1")
+    # İkinci deneme bütçe içinde başlar, üçüncüsü bütçeyi aşacağı için başlatılmaz
+    assert fake.calls["get_user"] == 2
+    assert time.monotonic() - start < 0.2
+
+def test_db_deadlines_are_passed_to_connections(monkeypatch):
+    monkeypatch.setattr(database, "DB_CONNECT_TIMEOUT", 3)
+    monkeypatch.setattr(database, "DB_STATEMENT_TIMEOUT", 2.5)
+    assert database._connect_kwargs() == {"connect_timeout": 3, "options": "-c statement_timeout=2500"}
+
+def test_db_statement_timeout_is_not_retried_but_trips_breaker():
+    timeout = extensions.QueryCanceledError("canceling statement due to statement timeout")
+    assert not database._read_retry.is_retryable(timeout)
+    assert database._is_db_failure(timeout)
+    assert database._read_retry.is_retryable(database.psycopg2.OperationalError("server closed the connection"))
@@ -0,0 +1,79 @@
+import functools
+import pytest
+import schema
+from tests.stubs import StubConnection, stub_get_connection
+
+def _respond(lock_results, uid_index=True, email_index=True):
+    def respond(sql, params):
+        if "pg_try_advisory_lock" in sql:
+            return [(lock_results.pop(0),)]
+        if "NOT i.indisvalid" in sql:
+            return [("users_email_lower_idx",)]
+        if "a.attname = %s" in sql:
+            return [("users_firebase_uid_key", True, 1, True)] if uid_index else []
+        if "lower(email)'" in sql:
+            return [("users_email_lower_idx",)] if email_index else []
+        return []
+    return respond
+
+@pytest.fixture
+def bootstrap(monkeypatch):
+    """Stub bağlantıyla bootstrap_schema çalıştırır; değişiklik akışı açık"""
+    monkeypatch.setattr(schema, "CHANGES_ENABLED", True)
+
+    def run(conn):
+        monkeypatch.setattr(schema, "get_connection", stub_get_connection(conn))
+        schema.bootstrap_schema()
+    return run
+
+def test_all_bootstrap_steps_run_under_one_advisory_lock(bootstrap):
+    conn = StubConnection(_respond([True], email_index=False))
+    bootstrap(conn)
+    statements = conn.sql()
+    assert "pg_try_advisory_lock" in statements[0]
+    assert "pg_advisory_unlock" in statements[-1]
+    assert sum("advisory" in sql for sql in statements) == 2
+    inner = statements[1:-1]
+    assert any("CREATE TABLE IF NOT EXISTS users" in sql for sql in inner)
+    assert any("DROP INDEX CONCURRENTLY IF EXISTS users_email_lower_idx" in sql for sql in inner)
+    assert any("CREATE INDEX CONCURRENTLY IF NOT EXISTS users_email_lower_idx" in sql for sql in inner)
+    assert any("CREATE OR REPLACE FUNCTION record_user_change" in sql for sql in inner)
+
+def test_waits_for_lock_before_touching_schema(bootstrap, monkeypatch):
+    conn = StubConnection(_respond([False, False, True]))
+    sleeps = []
+
+    def sleep(seconds):
+        # Kilit beklenirken hiçbir tablo, fonksiyon veya indeks oluşturulmamış olmalı
+        assert not any("DROP" in sql or "CREATE" in sql for sql in conn.sql())
+        sleeps.append(seconds)
+
+    monkeypatch.setattr(schema.time, "sleep", sleep)
+    bootstrap(conn)
+    assert len(sleeps) == 2
+    assert sum("pg_try_advisory_lock" in sql for sql in conn.sql()) == 3
+
+def test_lock_wait_times_out(bootstrap, monkeypatch):
+    conn = StubConnection(_respond([False] * 10))
+    monkeypatch.setattr(schema, "SCHEMA_LOCK_TIMEOUT", 0.05)
+    monkeypatch.setattr(schema, "_advisory_lock", functools.partial(schema._advisory_lock, poll_interval=0.01))
+    with pytest.raises(schema.SchemaLockTimeoutError):
+        bootstrap(conn)
+    assert not any("CREATE" in sql or "pg_advisory_unlock" in sql for sql in conn.sql())
+
+def test_lock_released_when_index_build_fails(bootstrap):
+    conn = StubConnection(_respond([True], uid_index=False))
+    conn.fail_on = "CREATE UNIQUE INDEX"
+    conn.error = RuntimeError("yinelenen uid")
+    with pytest.raises(RuntimeError):
+        bootstrap(conn)
+    assert "RESET statement_timeout" in conn.sql()[-2]
+    assert "pg_advisory_unlock" in conn.sql()[-1]
+
+def test_disabled_change_stream_drops_triggers(bootstrap, monkeypatch):
+    conn = StubConnection(_respond([True]))
+    monkeypatch.setattr(schema, "CHANGES_ENABLED", False)
+    bootstrap(conn)
+    inner = conn.sql()[1:-1]
+    assert any("DROP TRIGGER %I ON users" in sql for sql in inner)
+    assert not any("record_user_change" in sql for sql in inner)
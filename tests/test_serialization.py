@@ -0,0 +1,51 @@
+import json
+from datetime import datetime
+import pytest
+import serialization
+from database import UserRecord
+from serialization import FastJSONResponse, dumps
+
+_CREATED = datetime(2024, 6, 1, 12, 0, 0, 123000)
+
+def _user(**overrides):
+    fields = dict(id=1, firebase_uid="u1", email="ayşe@x.com", display_name="Ayşe", created_at=_CREATED, updated_at=None)
+    fields.update(overrides)
+    return UserRecord(**fields)
+
+_EXPECTED = {
+    "id": 1,
+    "firebase_uid": "u1",
+    "email": "ayşe@x.com",
+    "display_name": "Ayşe",
+    "created_at": "2024-06-01T12:00:00.123000",
+    "updated_at": None,
+}
+
+def test_user_record_has_no_per_row_dict():
+    user = _user()
+    assert not hasattr(user, "__dict__")
+    with pytest.raises(AttributeError):
+        user.extra = 1
+
+def test_user_record_is_encoded_as_object():
+    assert json.loads(dumps(_user())) == _EXPECTED
+
+def test_nested_records_and_unicode_are_encoded_compactly():
+    body = dumps({"status": "success", "users": [_user(), _user(id=2, firebase_uid="u2")]})
+    assert b": " not in body and b", " not in body
+    assert "Ayşe".encode("utf-8") in body
+    assert [user["id"] for user in json.loads(body)["users"]] == [1, 2]
+
+def test_stdlib_fallback_matches_fast_path():
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=serialization._default)
+    value = {"user": _user(), "at": _CREATED}
+    assert json.loads(encoder.encode(value)) == json.loads(dumps(value))
+
+def test_unsupported_values_are_rejected():
+    with pytest.raises(TypeError):
+        serialization._default(object())
+
+def test_response_body_is_the_encoded_content():
+    response = FastJSONResponse({"user": _user()})
+    assert response.body == dumps({"user": _user()})
+    assert response.headers["content-type"] == "application/json"
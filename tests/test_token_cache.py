@@ -0,0 +1,60 @@
+import asyncio
+import time
+import pytest
+import firebase_service
+from firebase_service import FirebaseService
+
+def test_repeated_token_is_verified_once(fake):
+    token = fake.issue_token("u1")
+    service = FirebaseService()
+    assert service.verify_id_token(token)["uid"] == "u1"
+    assert service.verify_id_token(token)["uid"] == "u1"
+    assert asyncio.run(service.verify_id_token_async(token))["uid"] == "u1"
+    assert fake.calls["verify_id_token"] == 1
+    assert service.token_cache_stats()["hits"] == 2
+
+def test_cache_is_keyed_by_token_digest(fake):
+    token = fake.issue_token("u1")
+    service = FirebaseService()
+    service.verify_id_token(token)
+    # Ham token bellekte anahtar olarak tutulmaz
+    assert token not in service._token_cache._data
+    assert all(len(key) == 32 for key in service._token_cache._data)
+
+def test_invalid_token_is_not_cached(fake):
+    service = FirebaseService()
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            service.verify_id_token("geçersiz")
+    assert fake.calls["verify_id_token"] == 2
+    assert service.token_cache_stats()["size"] == 0
+
+def test_max_ttl_bounds_cached_token(fake, monkeypatch):
+    monkeypatch.setattr(firebase_service, "TOKEN_CACHE_MAX_TTL", 0.05)
+    token = fake.issue_token("u1")
+    service = FirebaseService()
+    service.verify_id_token(token)
+    time.sleep(0.06)
+    service.verify_id_token(token)
+    assert fake.calls["verify_id_token"] == 2
+
+def test_revocation_check_bounds_cached_token(fake, monkeypatch):
+    monkeypatch.setattr(firebase_service, "TOKEN_CHECK_REVOKED", True)
+    monkeypatch.setattr(firebase_service, "TOKEN_REVOCATION_CHECK_INTERVAL", 0.05)
+    token = fake.issue_token("u1")
+    service = FirebaseService()
+    service.verify_id_token(token)
+    service.verify_id_token(token)
+    assert fake.calls["verify_id_token"] == 1
+    time.sleep(0.06)
+    service.verify_id_token(token)
+    assert fake.calls["verify_id_token"] == 2
+
+def test_disabled_cache_verifies_every_time(fake, monkeypatch):
+    monkeypatch.setattr(firebase_service, "TOKEN_CACHE_ENABLED", False)
+    token = fake.issue_token("u1")
+    service = FirebaseService()
+    service.verify_id_token(token)
+    service.verify_id_token(token)
+    assert fake.calls["verify_id_token"] == 2
+    assert service.token_cache_stats() is None
@@ -0,0 +1,60 @@
+from datetime import datetime
+import pytest
+import database
+from database import iter_user_batches, list_users
+from tests.stubs import StubConnection, stub_get_connection
+
+def _rows(*ids):
+    return [(i, f"u{i}", f"u{i}@x.com", None, None, None) for i in ids]
+
+class _ExportConnection(StubConnection):
+    """İsimli (sunucu taraflı) cursor adlarını kaydeden stub"""
+
+    def __init__(self, rows):
+        super().__init__(lambda sql, params: rows)
+        self.cursor_names = []
+
+    def cursor(self, *args, name=None, **kwargs):
+        self.cursor_names.append(name)
+        return super().cursor(*args, **kwargs)
+
+@pytest.fixture
+def reads(monkeypatch):
+    def install(conn):
+        monkeypatch.setattr(database, "get_read_connection", stub_get_connection(conn))
+        return conn
+    return install
+
+def test_page_continues_after_last_id_without_offset(reads):
+    conn = reads(StubConnection(lambda sql, params: _rows(11, 12)))
+    since = datetime(2024, 6, 1)
+    users = list_users(after_id=10, limit=2, updated_since=since)
+    assert [user.id for user in users] == [11, 12]
+    [(sql, params)] = conn.executed
+    assert "id > %s" in sql and "COALESCE(updated_at, created_at) >= %s" in sql
+    assert "ORDER BY id" in sql and "OFFSET" not in sql
+    assert params == [10, since, 2]
+
+def test_first_page_has_no_conditions(reads):
+    conn = reads(StubConnection(lambda sql, params: []))
+    assert list_users(limit=5) == []
+    [(sql, params)] = conn.executed
+    assert "WHERE" not in sql
+    assert params == [5]
+
+def test_export_streams_batches_from_a_named_cursor(reads):
+    conn = reads(_ExportConnection(_rows(1, 2, 3, 4, 5)))
+    batches = list(iter_user_batches(batch_size=2))
+    assert [[user.id for user in batch] for batch in batches] == [[1, 2], [3, 4], [5]]
+    assert conn.cursor_names == ["users_export"]
+    # İsimli cursor transaction içinde açılır ve akış bitince geri alınır
+    assert conn.autocommit is False
+    assert conn.rollbacks == 1
+
+def test_closing_export_early_releases_the_transaction(reads):
+    conn = reads(_ExportConnection(_rows(1, 2, 3)))
+    batches = iter_user_batches(after_id=0, batch_size=1)
+    assert [user.id for user in next(batches)] == [1]
+    batches.close()
+    assert conn.rollbacks == 1
+    assert conn.executed[0][1] == [0]
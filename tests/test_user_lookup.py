@@ -0,0 +1,119 @@
+import asyncio
+from datetime import datetime
+import pytest
+import database
+import firebase_service
+from cache import UserLookupCache
+from database import UserRecord
+from firebase_service import FirebaseService
+from tests.stubs import StubConnection, stub_get_connection
+
+VERSION = datetime(2024, 1, 2, 3, 4, 5)
+DB_USER = UserRecord(1, "u1", "Ada@X.com", "Ada", VERSION, None)
+FIREBASE_USER = {
+    "uid": "u1",
+    "email": "ada@x.com",
+    "display_name": "Ada",
+    "phone_number": "+905550000000",
+    "photo_url": None,
+    "disabled": True,
+}
+
+class _FirebaseUser:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+@pytest.fixture
+def lookup(monkeypatch):
+    """Önbelleği, users sorgusunu, profil kaydını ve Firebase'i taklit eder"""
+    state = {"db": (None, None), "saved": [], "firebase_calls": []}
+
+    def get_details(email):
+        state.setdefault("db_calls", []).append(email)
+        return state["db"]
+
+    def save_profile(user, phone_number, photo_url, disabled):
+        state["saved"].append((user.firebase_uid, phone_number, photo_url, disabled))
+        return True
+
+    def call_firebase(self, call, func, *args, **kwargs):
+        state["firebase_calls"].append((call, args))
+        return _FirebaseUser(**FIREBASE_USER)
+
+    monkeypatch.setattr(firebase_service, "user_lookup_cache", UserLookupCache(100, 60))
+    monkeypatch.setattr(firebase_service, "db_get_user_details_by_email", get_details)
+    monkeypatch.setattr(firebase_service, "save_user_profile", save_profile)
+    monkeypatch.setattr(FirebaseService, "_call_firebase", call_firebase)
+    return state
+
+def test_db_hit_returns_same_fields_as_firebase(lookup):
+    lookup["db"] = (DB_USER, {"phone_number": "+905550000000", "photo_url": None, "disabled": True})
+    user = FirebaseService().get_user_by_email("ada@x.com")
+    assert set(user) == set(FIREBASE_USER)
+    assert user["disabled"] is True
+    assert lookup["firebase_calls"] == []
+
+def test_missing_profile_falls_back_to_firebase_and_saves_it(lookup):
+    lookup["db"] = (DB_USER, None)
+    user = FirebaseService().get_user_by_email("ada@x.com")
+    assert user == FIREBASE_USER
+    assert len(lookup["firebase_calls"]) == 1
+    assert lookup["saved"] == [("u1", "+905550000000", None, True)]
+
+def test_profile_not_saved_for_different_uid(lookup):
+    lookup["db"] = (UserRecord(2, "other", "ada@x.com", None, VERSION, None), None)
+    FirebaseService().get_user_by_email("ada@x.com")
+    assert lookup["saved"] == []
+
+def test_cache_is_case_insensitive(lookup):
+    lookup["db"] = (DB_USER, None)
+    service = FirebaseService()
+    first = service.get_user_by_email("Ada@X.com")
+    second = service.get_user_by_email(" ada@x.COM")
+    assert first is second
+    assert lookup["db_calls"] == ["Ada@X.com"]
+    firebase_service.invalidate_cached_user(email="ADA@x.com")
+    service.get_user_by_email("ada@x.com")
+    assert len(lookup["db_calls"]) == 2
+
+def test_fresh_skips_database(lookup):
+    lookup["db"] = (DB_USER, {"phone_number": None, "photo_url": None, "disabled": False})
+    user = FirebaseService().get_user_by_email("ada@x.com", fresh=True)
+    assert user["disabled"] is True
+    assert "db_calls" not in lookup
+
+def test_async_lookup_shares_the_sync_flow(lookup, monkeypatch):
+    lookup["db"] = (DB_USER, None)
+    service = FirebaseService()
+    user = asyncio.run(service.get_user_by_email_async("ada@x.com"))
+    assert user == FIREBASE_USER
+    assert lookup["saved"] == [("u1", "+905550000000", None, True)]
+
+    async def no_thread_hop(*args, **kwargs):
+        raise AssertionError("önbellek isabeti thread havuzuna gitmemeli")
+
+    monkeypatch.setattr(firebase_service, "run_blocking", no_thread_hop)
+    assert asyncio.run(service.get_user_by_email_async("ADA@x.com")) is user
+
+def test_details_query_reads_primary_case_insensitively(monkeypatch):
+    conn = StubConnection(lambda sql, params: [(1, "u1", "Ada@X.com", "Ada", VERSION, None, None, None, False)])
+    monkeypatch.setattr(database, "get_connection", stub_get_connection(conn))
+    monkeypatch.setattr(database, "get_read_connection", None)
+    user, profile = database.get_user_details_by_email("ADA@x.com", max_age=60)
+    assert user == DB_USER
+    assert profile == {"phone_number": None, "photo_url": None, "disabled": False}
+    sql, params = conn.executed[0]
+    assert "lower(u.email) = lower(%(p1)s)" in sql
+    assert params == {"p1": "ADA@x.com", "p2": 60}
+
+def test_details_query_without_profile(monkeypatch):
+    conn = StubConnection(lambda sql, params: [(1, "u1", "Ada@X.com", "Ada", VERSION, None, None, None, None)])
+    monkeypatch.setattr(database, "get_connection", stub_get_connection(conn))
+    assert database.get_user_details_by_email("ada@x.com") == (DB_USER, None)
+
+def test_save_user_profile_binds_row_version(monkeypatch):
+    conn = StubConnection()
+    monkeypatch.setattr(database, "get_connection", stub_get_connection(conn))
+    assert database.save_user_profile(DB_USER, None, "https://p", False)
+    assert conn.executed[0][1] == ("u1", None, "https://p", False, VERSION)
+    assert not database.save_user_profile(UserRecord(1, "u1", None, None, None, None), None, None, False)
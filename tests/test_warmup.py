@@ -0,0 +1,100 @@
+import asyncio
+import threading
+from firebase_admin import auth
+import warmup
+from firebase_service import FirebaseService
+from warmup import Warmup
+
+def _run_until_ready(steps, monkeypatch, delays=None):
+    """Adımları çalıştırır; yeniden deneme beklemeleri kısaltılıp delays listesine yazılır"""
+    sleep = asyncio.sleep
+
+    def retry_sleep(delay):
+        if delays is not None:
+            delays.append(delay)
+        return sleep(0)
+
+    monkeypatch.setattr(warmup.asyncio, "sleep", retry_sleep)
+
+    async def run():
+        w = Warmup()
+        for name, func in steps:
+            w.add_step(name, func)
+        statuses = [w.status()]
+        w.start()
+        for _ in range(100):
+            if w.ready:
+                break
+            await sleep(0.001)
+            statuses.append(w.status())
+        await w.stop()
+        return w, statuses
+    return asyncio.run(run())
+
+def test_not_ready_until_every_step_completes(monkeypatch):
+    async def fast():
+        pass
+
+    async def slow():
+        await asyncio.sleep(0)
+
+    w, statuses = _run_until_ready([("firebase", fast), ("database", slow)], monkeypatch)
+    assert statuses[0]["status"] == "warming"
+    assert w.ready
+    assert w.status()["steps"]["database"]["attempts"] == 1
+
+def test_failed_step_is_retried_until_it_succeeds(monkeypatch):
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionError("veritabanı henüz açılmadı")
+
+    delays = []
+    w, _ = _run_until_ready([("database", flaky)], monkeypatch, delays)
+    assert w.ready
+    assert w.status()["steps"]["database"]["attempts"] == 3
+    # Bekleme her denemede iki katına çıkar
+    assert delays == [1.0, 2.0]
+
+def test_failing_step_reports_its_error(monkeypatch):
+    async def broken():
+        raise ConnectionError("veritabanı henüz açılmadı")
+
+    async def run():
+        w = Warmup()
+        w.add_step("database", broken)
+        w.start()
+        await asyncio.sleep(0.01)
+        status = w.status()
+        await w.stop()
+        return status
+
+    status = asyncio.run(run())
+    assert status["status"] == "warming"
+    assert status["steps"]["database"] == {"ready": False, "error": "veritabanı henüz açılmadı", "attempts": 1}
+
+def test_service_is_initialized_on_first_use(fake):
+    service = FirebaseService()
+    assert not service.initialized
+    assert fake.app_options == []
+    token = fake.issue_token("u1")
+    service._call_firebase("verify_id_token", auth.verify_id_token, token)
+    assert service.initialized
+    assert len(fake.app_options) == 1
+
+def test_concurrent_first_calls_initialize_once(fake):
+    service = FirebaseService()
+    barrier = threading.Barrier(8)
+
+    def first_call():
+        barrier.wait()
+        service.initialize()
+
+    threads = [threading.Thread(target=first_call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(fake.app_options) == 1
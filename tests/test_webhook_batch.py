@@ -0,0 +1,91 @@
+import psycopg2
+import pytest
+import database
+from database import DUPLICATE_EVENT_RESULT, apply_user_events
+from firebase_service import FirebaseService
+from tests.stubs import StubConnection, stub_get_connection
+
+def _event(event_type, uid, event_id=None, **user_data):
+    return {"event_type": event_type, "user_data": dict(user_data, uid=uid), "event_id": event_id, "version": None}
+
+def _user_row(uid, email, display_name):
+    return {"id": 1, "firebase_uid": uid, "email": email, "display_name": display_name, "created_at": None, "updated_at": None}
+
+def test_segments_keep_order_and_split_repeated_uids():
+    events = [
+        _event("create", "u1"),
+        _event("create", "u2"),
+        _event("update", "u1"),
+        _event("update", "u1"),
+        _event("delete", "u2"),
+    ]
+    segments = database._segment_events(events, [None] * len(events))
+    assert [(kind, [index for index, _, _ in items]) for kind, items in segments] == [
+        ("create", [0, 1]),
+        ("update", [2]),
+        ("update", [3]),
+        ("delete", [4]),
+    ]
+
+@pytest.fixture
+def batch(monkeypatch):
+    """Stub bağlantı ve execute_values ile apply_user_events; processed içindeki olaylar daha önce işlenmiştir"""
+    conn = StubConnection(lambda sql, params: [{"firebase_uid": uid} for uid in params[0]] if "DELETE FROM users" in sql else [])
+    conn.statements = []
+    conn.processed = set()
+
+    def execute_values(cur, sql, rows, **kwargs):
+        conn.statements.append(sql)
+        if conn.fail_on is not None and conn.fail_on in sql:
+            raise conn.error
+        if "processed_events" in sql:
+            return [{"event_id": row[0]} for row in rows if row[0] not in conn.processed]
+        return [_user_row(*row[:3]) for row in rows]
+
+    monkeypatch.setattr(database, "get_connection", stub_get_connection(conn))
+    monkeypatch.setattr(database, "execute_values", execute_values)
+    monkeypatch.setattr(database, "pin_primary", lambda *uids: None)
+    return conn
+
+def test_events_are_applied_in_one_transaction(batch):
+    results = apply_user_events([
+        _event("create", "u1", email="a@x.com"),
+        _event("create", "u2", email="b@x.com"),
+        _event("update", "u1", display_name="A"),
+        _event("delete", "u2"),
+    ])
+    assert [result["message"] for result in results] == [
+        "Kullanıcı eklendi", "Kullanıcı eklendi", "Kullanıcı güncellendi", "Kullanıcı silindi",
+    ]
+    assert results[2]["user"].display_name == "A"
+    assert results[3]["result"] is True
+    # İki create tek bir çok satırlı INSERT ile yazılır
+    assert sum("DO NOTHING" in sql and "INSERT INTO users" in sql for sql in batch.statements) == 1
+    assert (batch.commits, batch.rollbacks) == (1, 0)
+
+def test_invalid_and_duplicate_events_do_not_touch_users(batch):
+    batch.processed.add("e1")
+    results = apply_user_events([
+        _event("create", "u1", event_id="e1"),
+        _event("rename", "u2"),
+        {"event_type": "create", "user_data": {}},
+    ])
+    assert results[0] == DUPLICATE_EVENT_RESULT
+    assert results[1] == {"status": "error", "message": "Bilinmeyen olay tipi"}
+    assert results[2] == {"status": "error", "message": "Kullanıcı uid'si eksik"}
+    assert not any("INSERT INTO users" in sql for sql in batch.statements)
+
+def test_failure_rolls_back_every_event(batch):
+    batch.fail_on = "INSERT INTO users"
+    batch.error = psycopg2.OperationalError("bağlantı koptu")
+    with pytest.raises(psycopg2.OperationalError):
+        apply_user_events([_event("delete", "u2", event_id="e2"), _event("create", "u1", event_id="e1")])
+    assert (batch.commits, batch.rollbacks) == (0, 1)
+
+def test_service_reports_failed_batch_per_event(fake, monkeypatch):
+    def fail(events):
+        raise psycopg2.OperationalError("bağlantı koptu")
+
+    monkeypatch.setattr("firebase_service.apply_user_events", fail)
+    results = FirebaseService().handle_auth_events([_event("create", "u1"), _event("delete", "u2")])
+    assert results == [{"status": "error", "message": "bağlantı koptu"}] * 2
@@ -0,0 +1,115 @@
+import pytest
+import webhook_queue
+from webhook_queue import coalesce_events
+from tests.stubs import StubConnection, stub_get_connection
+
+def test_updates_merge_into_one_upsert():
+    events = [
+        ("create", {"email": "a@x.com"}),
+        ("update", {"display_name": "A"}),
+        ("update", {"display_name": "B"}),
+    ]
+    assert coalesce_events(events) == ("upsert", "a@x.com", "B")
+
+def test_single_create_stays_insert():
+    assert coalesce_events([("create", {"email": "a@x.com", "display_name": "A"})]) == ("insert", "a@x.com", "A")
+
+def test_delete_wins_over_earlier_events():
+    events = [
+        ("create", {"email": "a@x.com"}),
+        ("update", {"display_name": "A"}),
+        ("delete", {}),
+    ]
+    assert coalesce_events(events) == ("delete", None, None)
+
+def test_write_after_delete_replaces_without_old_fields():
+    events = [
+        ("update", {"email": "a@x.com", "display_name": "A"}),
+        ("delete", {}),
+        ("update", {"display_name": "B"}),
+    ]
+    assert coalesce_events(events) == ("replace", None, "B")
+    assert coalesce_events([("delete", {}), ("create", {"email": "b@x.com"})]) == ("replace", "b@x.com", None)
+
+def test_repeated_create_does_not_reset_fields():
+    events = [
+        ("update", {"email": "a@x.com", "display_name": "A"}),
+        ("create", {"email": "b@x.com"}),
+    ]
+    assert coalesce_events(events) == ("upsert", "a@x.com", "A")
+
+class _Outbox:
+    """webhook_outbox sorgularına yanıt veren taklit; cutoffs başka işçilerin tuttuğu en eski olaylardır"""
+
+    def __init__(self, rows, cutoffs=None):
+        self.rows = [
+            {"id": i, "firebase_uid": uid, "event_type": kind, "user_data": data, "version": version}
+            for i, uid, kind, data, version in rows
+        ]
+        self.cutoffs = cutoffs or {}
+        self.deleted = []
+
+    def respond(self, sql, params):
+        if "FOR UPDATE SKIP LOCKED" in sql:
+            return self.rows
+        if "MIN(id) AS cutoff" in sql:
+            return [{"firebase_uid": uid, "cutoff": cutoff} for uid, cutoff in self.cutoffs.items()]
+        if "DELETE FROM webhook_outbox" in sql:
+            self.deleted.extend(params[0])
+        return []
+
+@pytest.fixture
+def drain(monkeypatch):
+    """Stub bağlantıyla drain_once çalıştırır ve write_user_changes'e gelenleri döndürür"""
+    written = []
+
+    def write_user_changes(cur, **changes):
+        written.append(changes)
+
+    monkeypatch.setattr(webhook_queue, "write_user_changes", write_user_changes)
+    monkeypatch.setattr(webhook_queue, "tombstone_versions", lambda cur, uids: {})
+    monkeypatch.setattr(webhook_queue, "invalidate_cached_user", lambda **kwargs: None)
+
+    def run(outbox):
+        conn = StubConnection(outbox.respond)
+        monkeypatch.setattr(webhook_queue, "get_connection", stub_get_connection(conn))
+        applied = webhook_queue.drain_once()
+        assert conn.commits == 1
+        [changes] = written
+        return applied, changes
+    return run
+
+def test_drain_coalesces_each_user_into_one_write(drain):
+    outbox = _Outbox([
+        (1, "u1", "create", {"email": "a@x.com"}, None),
+        (2, "u2", "create", {"email": "b@x.com"}, None),
+        (3, "u1", "update", {"display_name": "A"}, None),
+        (4, "u2", "delete", {}, None),
+    ])
+    applied, changes = drain(outbox)
+    assert applied == 4
+    assert changes["upserts"] == [("u1", "a@x.com", "A", None)]
+    assert changes["deletes"] == [("u2", None)]
+    assert changes["inserts"] == changes["replaces"] == []
+    assert sorted(outbox.deleted) == [1, 2, 3, 4]
+
+def test_drain_applies_versioned_events_in_source_order(drain):
+    outbox = _Outbox([
+        (1, "u1", "update", {"display_name": "B"}, 2),
+        (2, "u1", "update", {"display_name": "A"}, 1),
+    ])
+    _, changes = drain(outbox)
+    assert changes["upserts"] == [("u1", None, "B", 2)]
+
+def test_drain_stops_at_event_held_by_another_worker(drain):
+    # u1'in 3 numaralı olayı başka bir işçide; 5 numaralı olay onu beklemeli
+    outbox = _Outbox([
+        (1, "u1", "update", {"display_name": "A"}, None),
+        (2, "u2", "update", {"display_name": "X"}, None),
+        (5, "u1", "delete", {}, None),
+    ], cutoffs={"u1": 3})
+    applied, changes = drain(outbox)
+    assert applied == 2
+    assert changes["upserts"] == [("u1", None, "A", None), ("u2", None, "X", None)]
+    assert changes["deletes"] == []
+    assert sorted(outbox.deleted) == [1, 2]
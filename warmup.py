@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class Warmup:
+    """Açılıştan sonra arka planda çalışan ısınma adımlarını ve hazır olma durumunu tutar
+
+    Adımlar birbirinden bağımsız olarak eşzamanlı çalışır. Başarısız olan adım
+    üstel bekleme ile yeniden denenir; böylece açılışta geçici olarak
+    erişilemeyen bir bağımlılık sonradan hazır hale gelebilir.
+    """
+
+    def __init__(self, max_retry_delay=30.0):
+        self.max_retry_delay = max_retry_delay
+        self._steps = []
+        self._state = {}
+        self._tasks = []
+        self._started_at = None
+
+    def add_step(self, name, func):
+        """Isınma adımı ekler
+
+        Args:
+            name (str): Adım adı (/ready yanıtında görünür)
+            func (callable): Argümansız async fonksiyon
+        """
+        self._steps.append((name, func))
+        self._state[name] = {"ready": False}
+
+    def start(self):
+        """Adımları mevcut event loop üzerinde arka planda başlatır"""
+        self._started_at = time.monotonic()
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._run_step(name, func)) for name, func in self._steps]
+
+    async def _run_step(self, name, func):
+        delay = 1.0
+        attempt = 0
+        while True:
+            attempt += 1
+            start = time.monotonic()
+            try:
+                await func()
+                self._state[name] = {
+                    "ready": True,
+                    "seconds": round(time.monotonic() - start, 3),
+                    "attempts": attempt,
+                }
+                logger.info("Isınma adımı tamamlandı: %s", name)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._state[name] = {"ready": False, "error": str(e), "attempts": attempt}
+                logger.error("Isınma adımı başarısız (%s), %.0f sn sonra yeniden denenecek: %s", name, delay, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+
+    @property
+    def ready(self):
+        return all(state["ready"] for state in self._state.values())
+
+    def status(self):
+        """Hazır olma durumunu ve adım ayrıntılarını döndürür"""
+        uptime = time.monotonic() - self._started_at if self._started_at is not None else 0.0
+        return {
+            "status": "ready" if self.ready else "warming",
+            "uptime_seconds": round(uptime, 3),
+            "steps": {name: dict(state) for name, state in self._state.items()},
+        }
+
+    async def stop(self):
+        """Bitmemiş adımları iptal eder"""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
@@ -0,0 +1,387 @@
+import threading
+import time
+import logging
+from psycopg2.extras import Json, RealDictCursor, execute_values
+from config import (
+    WEBHOOK_QUEUE_WORKERS,
+    WEBHOOK_QUEUE_BATCH_SIZE,
+    WEBHOOK_QUEUE_POLL_INTERVAL,
+    WEBHOOK_QUEUE_MAX_ATTEMPTS,
+)
+from database import get_connection, write_user_changes, claim_events, tombstone_versions
+from resilience import CircuitOpenError
+from firebase_service import invalidate_cached_user, is_recent_event, remember_events
+from metrics import REGISTRY, counter, gauge
+
+logger = logging.getLogger(__name__)
+
+# Webhook olayları bu tabloya yazılıp hemen onaylanır. Kayıtlar users tablosuna
+# uygulandığı transaction içinde silinir, böylece bir olay ya kuyruktadır ya da
+# uygulanmıştır.
+_OUTBOX_DDL = """
+    CREATE TABLE IF NOT EXISTS webhook_outbox (
+        id BIGSERIAL PRIMARY KEY,
+        firebase_uid TEXT NOT NULL,
+        event_type TEXT NOT NULL,
+        user_data JSONB NOT NULL,
+        version BIGINT,
+        received_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT
+    );
+    ALTER TABLE webhook_outbox ADD COLUMN IF NOT EXISTS version BIGINT;
+    CREATE INDEX IF NOT EXISTS webhook_outbox_uid_idx ON webhook_outbox (firebase_uid, id);
+"""
+
+EVENT_TYPES = ("create", "update", "delete")
+
+def ensure_outbox_table():
+    """webhook_outbox tablosunu ve indeksini oluşturur"""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(_OUTBOX_DDL)
+
+def _validate_event(event_type, user_data):
+    if event_type not in EVENT_TYPES:
+        raise ValueError("Bilinmeyen olay tipi")
+    if not (user_data or {}).get("uid"):
+        raise ValueError("Kullanıcı uid'si eksik")
+
+def enqueue_events(events):
+    """Olayları kalıcı kuyruğa ekler
+
+    event_id'si daha önce işlenmiş veya kuyruğa alınmış olaylar eklenmez.
+
+    Args:
+        events (list): {"event_type": str, "user_data": dict, "event_id": str,
+            "version": int} sözlükleri; event_id ve version isteğe bağlıdır
+
+    Returns:
+        list: Her olay için outbox kayıt ID'si; tekrar eden olaylar için None
+
+    Raises:
+        ValueError: Olaylardan biri geçersizse (hiçbiri eklenmez)
+    """
+    for event in events:
+        _validate_event(event.get("event_type"), event.get("user_data"))
+    queue_ids = [None] * len(events)
+    pending = [i for i, event in enumerate(events) if not is_recent_event(event.get("event_id"))]
+    if not pending:
+        return queue_ids
+    try:
+        with get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                # Olay kaydı ve kuyruğa ekleme aynı transaction'da
+                duplicates = claim_events(cur, [events[i] for i in pending])
+                fresh = [i for n, i in enumerate(pending) if n not in duplicates]
+                rows = []
+                if fresh:
+                    rows = execute_values(
+                        cur,
+                        "INSERT INTO webhook_outbox (firebase_uid, event_type, user_data, version) VALUES %s RETURNING id",
+                        [
+                            (events[i]["user_data"]["uid"], events[i]["event_type"], Json(events[i]["user_data"]), events[i].get("version"))
+                            for i in fresh
+                        ],
+                        page_size=len(fresh),
+                        fetch=True
+                    )
+    except Exception as e:
+        logger.error("Olay kuyruğa eklenemedi: %s", e)
+        raise
+    for index, row in zip(fresh, rows):
+        queue_ids[index] = row["id"]
+    remember_events(
+        [events[i] for i in pending],
+        [{"status": "success"} for _ in pending]
+    )
+    if fresh:
+        _wakeup.set()
+    return queue_ids
+
+def enqueue_event(event_type, user_data, event_id=None, version=None):
+    """Tek bir olayı kalıcı kuyruğa ekler ve outbox kayıt ID'sini döndürür (tekrar eden olay için None)"""
+    return enqueue_events([{
+        "event_type": event_type,
+        "user_data": user_data,
+        "event_id": event_id,
+        "version": version,
+    }])[0]
+
+def _merge(fields, user_data):
+    email = user_data.get("email")
+    display_name = user_data.get("display_name")
+    return (
+        email if email is not None else fields[0],
+        display_name if display_name is not None else fields[1],
+    )
+
+def coalesce_events(events):
+    """Aynı kullanıcıya ait sıralı olayları tek bir son yazıma indirger
+
+    Örneğin create→update→update tek bir upsert'e, create→delete tek bir
+    delete'e dönüşür. Silmeden sonra gelen create/update satırı yeniden yazar.
+
+    Args:
+        events (list): (event_type, user_data) çiftleri, geliş sırasıyla
+
+    Returns:
+        tuple: (işlem, email, display_name); işlem "insert", "upsert",
+            "replace" veya "delete"
+    """
+    kind = None
+    fields = (None, None)
+    for event_type, user_data in events:
+        if event_type == "delete":
+            kind, fields = "delete", (None, None)
+        elif event_type == "create":
+            if kind is None:
+                kind, fields = "insert", _merge((None, None), user_data)
+            elif kind == "delete":
+                kind, fields = "replace", _merge((None, None), user_data)
+            # Mevcut kullanıcı için create tekrarı etkisizdir
+        elif event_type == "update":
+            if kind is None or kind == "insert":
+                kind = "upsert"
+            elif kind == "delete":
+                kind, fields = "replace", (None, None)
+            fields = _merge(fields, user_data)
+    return (kind,) + fields
+
+def _write_groups(cur, groups):
+    changes = {"insert": [], "upsert": [], "replace": [], "delete": []}
+    tombstones = tombstone_versions(cur, list(groups))
+    for uid, events in groups.items():
+        versions = [version for _, _, version in events]
+        if all(version is not None for version in versions):
+            # Geliş sırası değil kaynak sürümü esas alınır
+            events = sorted(events, key=lambda event: event[2])
+            version = events[-1][2]
+        else:
+            version = max((v for v in versions if v is not None), default=None)
+        kind, email, display_name = coalesce_events([(event_type, user_data) for event_type, user_data, _ in events])
+        if kind == "delete":
+            changes["delete"].append((uid, version))
+            continue
+        deleted_at = tombstones.get(uid)
+        if version is not None and deleted_at is not None and version <= deleted_at:
+            # Daha önce işlenmiş bir silmeden eski olaylar kullanıcıyı geri getirmez
+            continue
+        changes[kind].append((uid, email, display_name, version))
+    write_user_changes(
+        cur,
+        inserts=changes["insert"],
+        upserts=changes["upsert"],
+        replaces=changes["replace"],
+        deletes=changes["delete"]
+    )
+
+# Süreç içi sayaçlar
+_stats_lock = threading.Lock()
+_stats = {
+    "events_processed": 0,
+    "writes": 0,
+    "events_failed": 0,
+    "last_drain_at": None,
+}
+
+def _record(processed, writes, failed):
+    with _stats_lock:
+        _stats["events_processed"] += processed
+        _stats["writes"] += writes
+        _stats["events_failed"] += failed
+        _stats["last_drain_at"] = time.time()
+
+def drain_once(batch_size=WEBHOOK_QUEUE_BATCH_SIZE):
+    """Kuyruktan bir grup olay alıp kullanıcı başına birleştirerek uygular
+
+    Olaylar FOR UPDATE SKIP LOCKED ile alınır, böylece birden fazla işçi ve
+    süreç aynı anda çalışabilir. Bir kullanıcının daha eski bir olayı başka bir
+    işçideyse, bu işçi o kullanıcının yalnızca o olaydan önceki olaylarını
+    uygular; kalanlar sonraki turlara bırakılır ve sıra korunur.
+
+    Returns:
+        int: Uygulanan olay sayısı
+    """
+    with get_connection() as conn:
+        conn.autocommit = False
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(
+                    """
+                    SELECT id, firebase_uid, event_type, user_data, version FROM webhook_outbox
+                    WHERE attempts < %s
+                    ORDER BY id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                    """,
+                    (WEBHOOK_QUEUE_MAX_ATTEMPTS, batch_size)
+                )
+                rows = cur.fetchall()
+                if not rows:
+                    conn.rollback()
+                    return 0
+
+                claimed_ids = [row["id"] for row in rows]
+                cur.execute(
+                    """
+                    SELECT firebase_uid, MIN(id) AS cutoff FROM webhook_outbox
+                    WHERE firebase_uid = ANY(%s) AND NOT (id = ANY(%s)) AND attempts < %s
+                    GROUP BY firebase_uid
+                    """,
+                    (list({row["firebase_uid"] for row in rows}), claimed_ids, WEBHOOK_QUEUE_MAX_ATTEMPTS)
+                )
+                cutoffs = {row["firebase_uid"]: row["cutoff"] for row in cur.fetchall()}
+
+                groups = {}
+                group_ids = {}
+                for row in rows:
+                    uid = row["firebase_uid"]
+                    cutoff = cutoffs.get(uid)
+                    if cutoff is not None and row["id"] > cutoff:
+                        continue
+                    groups.setdefault(uid, []).append((row["event_type"], row["user_data"], row["version"]))
+                    group_ids.setdefault(uid, []).append(row["id"])
+
+                failed_ids = []
+                cur.execute("SAVEPOINT drain_bulk")
+                try:
+                    _write_groups(cur, groups)
+                    cur.execute("RELEASE SAVEPOINT drain_bulk")
+                except Exception as e:
+                    # Toplu yazım başarısız: hatalı kullanıcıyı bulmak için tek tek dene
+                    logger.warning("Toplu kuyruk yazımı başarısız, kullanıcı bazında deneniyor: %s", e)
+                    cur.execute("ROLLBACK TO SAVEPOINT drain_bulk")
+                    for uid in list(groups):
+                        cur.execute("SAVEPOINT drain_user")
+                        try:
+                            _write_groups(cur, {uid: groups[uid]})
+                            cur.execute("RELEASE SAVEPOINT drain_user")
+                        except Exception as user_error:
+                            cur.execute("ROLLBACK TO SAVEPOINT drain_user")
+                            logger.error("Kuyruk olayı uygulanamadı (%s): %s", uid, user_error)
+                            cur.execute(
+                                "UPDATE webhook_outbox SET attempts = attempts + 1, last_error = %s WHERE id = ANY(%s)",
+                                (str(user_error), group_ids[uid])
+                            )
+                            failed_ids.extend(group_ids.pop(uid))
+                            del groups[uid]
+
+                done_ids = [i for ids in group_ids.values() for i in ids]
+                if done_ids:
+                    cur.execute("DELETE FROM webhook_outbox WHERE id = ANY(%s)", (done_ids,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    for uid, events in groups.items():
+        invalidate_cached_user(uid=uid)
+        for _, user_data, _ in events:
+            invalidate_cached_user(email=user_data.get("email"))
+    _record(len(done_ids), len(groups), len(failed_ids))
+    return len(done_ids)
+
+def get_queue_stats():
+    """Kuyruk derinliği, gecikme ve işleme sayaçlarını döndürür"""
+    with get_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                """
+                SELECT
+                    COUNT(*) FILTER (WHERE attempts < %(max)s) AS depth,
+                    COUNT(*) FILTER (WHERE attempts >= %(max)s) AS dead,
+                    EXTRACT(EPOCH FROM now() - MIN(received_at) FILTER (WHERE attempts < %(max)s)) AS lag_seconds
+                FROM webhook_outbox
+                """,
+                {"max": WEBHOOK_QUEUE_MAX_ATTEMPTS}
+            )
+            row = cur.fetchone()
+    with _stats_lock:
+        stats = dict(_stats)
+    stats.update({
+        "depth": row["depth"],
+        "dead": row["dead"],
+        "lag_seconds": float(row["lag_seconds"]) if row["lag_seconds"] is not None else 0.0,
+        "workers": sum(1 for t in _workers if t.is_alive()),
+    })
+    return stats
+
+_workers = []
+_stop = threading.Event()
+_wakeup = threading.Event()
+
+# Kuyruk metrikleri işçilerin en fazla bu aralıkla okuduğu son durumdan
+# üretilir; /metrics event loop'ta çalışır ve veritabanına gitmez
+_STATS_REFRESH_INTERVAL = 5.0
+_cached_stats = None
+_stats_refreshed_at = None
+
+def _refresh_cached_stats():
+    global _cached_stats, _stats_refreshed_at
+    now = time.monotonic()
+    with _stats_lock:
+        if _stats_refreshed_at is not None and now - _stats_refreshed_at < _STATS_REFRESH_INTERVAL:
+            return
+        # Aynı turda diğer işçiler sorguyu tekrarlamaz
+        _stats_refreshed_at = now
+    try:
+        _cached_stats = get_queue_stats()
+    except Exception as e:
+        logger.warning("Kuyruk metrikleri okunamadı: %s", e)
+
+def _worker_loop():
+    while not _stop.is_set():
+        try:
+            processed = drain_once()
+        except CircuitOpenError as e:
+            # Veritabanı sağlıksız; devre kapanana kadar yoklama aralığıyla bekle
+            logger.warning("Kuyruk işçisi bekliyor: %s", e.detail)
+            processed = 0
+        except Exception as e:
+            logger.exception("Kuyruk işçisi hatası: %s", e)
+            processed = 0
+        _refresh_cached_stats()
+        if processed == 0:
+            # Kuyruk boş: yeni olay eklenene veya yoklama süresi dolana kadar bekle
+            _wakeup.wait(WEBHOOK_QUEUE_POLL_INTERVAL)
+            _wakeup.clear()
+
+_QUEUE_DEPTH = gauge("webhook_queue_depth", "Kuyrukta bekleyen olaylar", ("state",))
+_QUEUE_LAG = gauge("webhook_queue_lag_seconds", "Kuyruktaki en eski olayın bekleme süresi")
+_QUEUE_EVENTS = counter("webhook_queue_events_total", "Bu worker'da işlenen kuyruk olayları", ("outcome",))
+
+_collector_registered = False
+
+def _collect_queue_metrics():
+    with _stats_lock:
+        totals = dict(_stats)
+    _QUEUE_EVENTS.set_total(totals["events_processed"], outcome="applied")
+    _QUEUE_EVENTS.set_total(totals["events_failed"], outcome="failed")
+    _QUEUE_EVENTS.set_total(totals["writes"], outcome="writes")
+    stats = _cached_stats
+    if stats is not None:
+        _QUEUE_DEPTH.set(stats["depth"], state="pending")
+        _QUEUE_DEPTH.set(stats["dead"], state="dead")
+        _QUEUE_LAG.set(stats["lag_seconds"])
+
+def start_workers(count=WEBHOOK_QUEUE_WORKERS):
+    """Kuyruğu boşaltan arka plan işçilerini başlatır ve kuyruk metriklerini kaydeder"""
+    global _collector_registered
+    if not _collector_registered:
+        REGISTRY.register_collector(_collect_queue_metrics)
+        _collector_registered = True
+    _stop.clear()
+    for index in range(count):
+        thread = threading.Thread(target=_worker_loop, name=f"webhook-queue-{index}", daemon=True)
+        thread.start()
+        _workers.append(thread)
+    logger.info("%s webhook kuyruk işçisi başlatıldı", count)
+
+def stop_workers(timeout=5.0):
+    """Arka plan işçilerini durdurur"""
+    _stop.set()
+    _wakeup.set()
+    for thread in _workers:
+        thread.join(timeout)
+    _workers.clear()
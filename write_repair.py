@@ -0,0 +1,214 @@
+import threading
+import time
+import logging
+from config import (
+    DUAL_WRITE_REPAIR_DELAY,
+    DUAL_WRITE_REPAIR_INTERVAL,
+    DUAL_WRITE_REPAIR_BATCH_SIZE,
+)
+from database import get_connection, prune_processed_events
+from resilience import CircuitOpenError
+from firebase_service import FirebaseService
+from metrics import REGISTRY, DUAL_WRITE_REPAIRS, gauge
+
+logger = logging.getLogger(__name__)
+
+# Firebase + PostgreSQL çift yazımlarından yarım kalanlar (ör. Firebase
+# yazıldı ama veritabanı yazımı başarısız, Firebase zaman aşımına uğradı, süreç çöktü)
+# dual_write_intents tablosunda kalır. Onarıcı süresi dolan kayıtları alır ve
+# FirebaseService.repair_user_write ile Firebase'deki duruma göre tamamlar
+# veya telafi eder. Her deneme kaydı üstel olarak ileri erteler; böylece
+# kayıt aynı anda tek bir onarıcıdadır ve sürekli başarısız olanlar diğerlerini
+# bekletmez.
+
+# Art arda başarısız denemelerde bekleme en fazla DELAY * 2^6 olur
+_MAX_BACKOFF_EXPONENT = 6
+
+def claim_intents(batch_size=DUAL_WRITE_REPAIR_BATCH_SIZE):
+    """Süresi dolmuş niyet kayıtlarını alır ve bir sonraki denemeyi erteler
+
+    Kayıtlar FOR UPDATE SKIP LOCKED ile seçilir; o anda apply_user_write
+    ile uygulanan bir yazımın kaydı kilitli olduğundan atlanır. Alınan kaydın
+    attempts değeri artar; geciken istek bu kaydı artık uygulamaz.
+
+    Returns:
+        list: (id, op, firebase_uid, attempts) demetleri
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE dual_write_intents
+                SET attempts = attempts + 1,
+                    next_attempt_at = now() + make_interval(
+                        secs => %(delay)s * power(2, LEAST(attempts, %(max_exponent)s))
+                    )
+                WHERE id IN (
+                    SELECT id FROM dual_write_intents
+                    WHERE next_attempt_at <= now()
+                    ORDER BY next_attempt_at
+                    LIMIT %(limit)s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, op, firebase_uid, attempts
+                """,
+                {"delay": DUAL_WRITE_REPAIR_DELAY, "max_exponent": _MAX_BACKOFF_EXPONENT, "limit": batch_size}
+            )
+            return cur.fetchall()
+
+def _finish(intent_id, error=None):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            if error is None:
+                cur.execute("DELETE FROM dual_write_intents WHERE id = %s", (intent_id,))
+            else:
+                cur.execute("UPDATE dual_write_intents SET last_error = %s WHERE id = %s", (error, intent_id))
+
+# Süreç içi sayaçlar
+_stats_lock = threading.Lock()
+_stats = {
+    "repaired": 0,
+    "failed": 0,
+    "last_run_at": None,
+}
+
+def repair_once(batch_size=DUAL_WRITE_REPAIR_BATCH_SIZE):
+    """Süresi dolmuş bir grup niyet kaydını onarır
+
+    Returns:
+        int: Ele alınan kayıt sayısı
+    """
+    service = FirebaseService()
+    rows = claim_intents(batch_size)
+    repaired = failed = 0
+    for intent_id, op, uid, attempts in rows:
+        try:
+            service.repair_user_write(op, uid)
+        except CircuitOpenError:
+            # Kayıt ertelendi; bağımlılık düzelince yeniden denenir
+            raise
+        except Exception as e:
+            logger.error("Çift yazım onarılamadı (%s %s, deneme %s): %s", op, uid, attempts, e)
+            DUAL_WRITE_REPAIRS.inc(op=op, outcome="failed")
+            failed += 1
+            _finish(intent_id, str(e))
+            continue
+        _finish(intent_id)
+        DUAL_WRITE_REPAIRS.inc(op=op, outcome="repaired")
+        repaired += 1
+    with _stats_lock:
+        _stats["repaired"] += repaired
+        _stats["failed"] += failed
+        _stats["last_run_at"] = time.time()
+    return len(rows)
+
+def get_repair_stats():
+    """Bekleyen niyet kayıtları ve onarım sayaçlarını döndürür"""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT COUNT(*),
+                       COUNT(*) FILTER (WHERE attempts > 0),
+                       EXTRACT(EPOCH FROM now() - MIN(created_at))
+                FROM dual_write_intents
+                """
+            )
+            pending, retrying, oldest = cur.fetchone()
+    with _stats_lock:
+        stats = dict(_stats)
+    stats.update({
+        "pending": pending,
+        "retrying": retrying,
+        "oldest_seconds": float(oldest) if oldest is not None else 0.0,
+        "running": _thread is not None and _thread.is_alive(),
+    })
+    return stats
+
+_thread = None
+_stop = threading.Event()
+
+# Metrikler onarıcı thread'inin en fazla bu aralıkla okuduğu son durumdan
+# üretilir; /metrics isteği veritabanına gitmez
+_STATS_REFRESH_INTERVAL = 5.0
+_cached_stats = None
+_stats_refreshed_at = None
+
+def _refresh_cached_stats():
+    global _cached_stats, _stats_refreshed_at
+    now = time.monotonic()
+    if _stats_refreshed_at is not None and now - _stats_refreshed_at < _STATS_REFRESH_INTERVAL:
+        return
+    _stats_refreshed_at = now
+    try:
+        _cached_stats = get_repair_stats()
+    except Exception as e:
+        logger.warning("Çift yazım metrikleri okunamadı: %s", e)
+
+# Süresi dolmuş processed_events kayıtları da bu thread'de, süreç başına
+# saatte bir temizlenir; webhook istekleri silme maliyetini ödemez
+_PRUNE_INTERVAL = 3600.0
+_last_prune = None
+
+def _prune_processed_events():
+    global _last_prune
+    now = time.monotonic()
+    if _last_prune is not None and now - _last_prune < _PRUNE_INTERVAL:
+        return
+    _last_prune = now
+    try:
+        deleted = prune_processed_events()
+    except Exception as e:
+        logger.warning("İşlenmiş olay kayıtları temizlenemedi: %s", e)
+        return
+    if deleted:
+        logger.info("%d işlenmiş olay kaydı temizlendi", deleted)
+
+def _repair_loop():
+    while not _stop.is_set():
+        try:
+            processed = repair_once()
+        except CircuitOpenError as e:
+            logger.warning("Çift yazım onarıcısı bekliyor: %s", e.detail)
+            processed = 0
+        except Exception as e:
+            logger.exception("Çift yazım onarıcısı hatası: %s", e)
+            processed = 0
+        _refresh_cached_stats()
+        _prune_processed_events()
+        if processed == 0:
+            _stop.wait(DUAL_WRITE_REPAIR_INTERVAL)
+
+_INTENTS = gauge("dual_write_intents", "Onarım bekleyen çift yazım niyetleri", ("state",))
+_INTENT_AGE = gauge("dual_write_intent_oldest_seconds", "En eski çift yazım niyetinin yaşı")
+
+_collector_registered = False
+
+def _collect_repair_metrics():
+    stats = _cached_stats
+    if stats is None:
+        return
+    _INTENTS.set(stats["pending"], state="pending")
+    _INTENTS.set(stats["retrying"], state="retrying")
+    _INTENT_AGE.set(stats["oldest_seconds"])
+
+def start_repairer():
+    """Yarım kalan çift yazımları onaran arka plan thread'ini başlatır"""
+    global _thread, _collector_registered
+    if not _collector_registered:
+        REGISTRY.register_collector(_collect_repair_metrics)
+        _collector_registered = True
+    if _thread is not None and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_repair_loop, name="dual-write-repair", daemon=True)
+    _thread.start()
+    logger.info("Çift yazım onarıcısı başlatıldı")
+
+def stop_repairer(timeout=5.0):
+    """Onarıcı thread'ini durdurur"""
+    global _thread
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout)
+    _thread = None